@@ -0,0 +1,202 @@
+"""Benchmarks de las rutas de escaneo y limpieza fuera de Kodi.
+
+Genera un userdata sintético (benchmarks/userdata.py) para cada tamaño, mide
+cada operación con los módulos xbmc* de kodi_stubs/ y escribe los tiempos en
+JSON para comparar versiones del addon.
+
+Uso:
+    python benchmarks/run.py [--sizes small,medium] [--repeat 3] [--output results.json]
+    python benchmarks/run.py --compare antes.json despues.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+
+def _prepare_imports(home):
+    for path in (os.path.join(REPO_DIR, 'kodi_stubs'), REPO_DIR, BENCH_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    # La raíz de special:// se fija antes de importar: storage calcula addon_data al cargarse
+    import kodistub
+    kodistub.configure(root=home)
+
+
+def _timed(function, repeat):
+    runs = []
+    value = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = function()
+        runs.append(time.perf_counter() - started)
+    return {
+        'seconds': min(runs),
+        'median': statistics.median(runs),
+        'runs': [round(run, 6) for run in runs],
+    }, value
+
+
+def _describe(value):
+    """Resume el valor devuelto por una operación para el JSON de resultados."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return {'value': value}
+    if isinstance(value, dict) and value and all(isinstance(item, tuple) for item in value.values()):
+        return {'size': sum(item[0] for item in value.values()), 'files': sum(item[1] for item in value.values())}
+    if isinstance(value, dict):
+        return dict((key, item) for key, item in value.items() if isinstance(item, (int, float, bool)))
+    if isinstance(value, (list, tuple)):
+        if len(value) == 2 and all(isinstance(item, int) for item in value):
+            return {'size': value[0], 'files': value[1]}
+        return {'items': len(value)}
+    return None
+
+
+def run_size(label, params, home, repeat):
+    import userdata
+    shutil.rmtree(home, ignore_errors=True)
+    started = time.perf_counter()
+    userdata.generate(home, **params)
+    generate_seconds = time.perf_counter() - started
+
+    import default
+    import packages
+    import storage
+    import textures
+
+    paths = default.get_kodi_paths()
+    operations = {}
+
+    def measure(name, function, times=repeat):
+        timing, value = _timed(function, times)
+        described = _describe(value)
+        if described:
+            timing['value'] = described
+        operations[name] = timing
+        sys.stderr.write('  %-32s %9.4fs\n' % (name, timing['seconds']))
+
+    def cold_categories():
+        storage.save_index({'version': storage.INDEX_VERSION, 'roots': {}})
+        return default.get_all_categories_info(paths)
+
+    sys.stderr.write('[%s] %s\n' % (label, json.dumps(params)))
+    # Operaciones de solo lectura: se repiten y se guarda el mínimo y la mediana
+    measure('get_folder_size_thumbnails', lambda: default.get_folder_size(paths['thumbnails']))
+    measure('count_files_thumbnails', lambda: default.count_files_in_folder(paths['thumbnails']))
+    measure('categories_cold_index', cold_categories)
+    measure('categories_warm_index', lambda: default.get_all_categories_info(paths))
+    measure('collect_streaming_targets', default._collect_streaming_artifact_targets)
+    measure('plan_clean_all', lambda: default.plan_clean_all(paths))
+    measure('textures_find_orphans', lambda: textures.find_orphans(paths['thumbnails']))
+    measure('packages_plan_prune', lambda: packages.plan_prune(paths['packages'], keep=1))
+    # Árbol profundo: coste por archivo recorriendo por rutas completas y por descriptores
+    deep_root = os.path.join(home, userdata.DEEP_TREE_DIRNAME)
+    if os.path.isdir(deep_root):
+        deep_files = storage.scan_tree(deep_root)['files']
+        for mode, use_fd in (('path', False), ('fd', True)):
+            if use_fd and not storage.FD_TRAVERSAL_SUPPORTED:
+                continue
+            storage.use_fd_traversal = use_fd
+            measure('deep_scan_' + mode, lambda: storage.scan_tree(deep_root))
+            snapshot = deep_root + '.' + mode
+            shutil.copytree(deep_root, snapshot, symlinks=True)
+            measure('deep_remove_' + mode, lambda: storage.remove_folder_contents(snapshot), 1)
+            shutil.rmtree(snapshot, ignore_errors=True)
+            for name in ('deep_scan_' + mode, 'deep_remove_' + mode):
+                operations[name]['per_file_us'] = round(operations[name]['seconds'] * 1e6 / max(1, deep_files), 3)
+        storage.use_fd_traversal = storage.FD_TRAVERSAL_SUPPORTED
+
+    # Operaciones destructivas: una sola pasada, en orden
+    measure('vacuum_databases', default.vacuum_databases, 1)
+    measure('clean_textures_database', default.clean_textures_database, 1)
+    measure('safe_remove_thumbnails', lambda: default.safe_remove_folder_contents(paths['thumbnails']), 1)
+    measure('clean_all_rest', lambda: default.clean_all(interactive=False, notify=False), 1)
+    return {
+        'size': label,
+        'params': params,
+        'generate_seconds': round(generate_seconds, 3),
+        'operations': operations,
+    }
+
+
+def _addon_version():
+    import xbmcaddon
+    return xbmcaddon.Addon().getAddonInfo('version')
+
+
+def run(sizes, repeat, workdir=None):
+    home_parent = workdir or tempfile.mkdtemp(prefix='aspirando-bench-')
+    home = os.path.join(home_parent, 'home')
+    _prepare_imports(home)
+    import userdata
+    results = []
+    try:
+        for label in sizes:
+            results.append(run_size(label, dict(userdata.PRESETS[label]), home, repeat))
+    finally:
+        if workdir is None:
+            shutil.rmtree(home_parent, ignore_errors=True)
+    return {
+        'addon_version': _addon_version(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(old_path, new_path):
+    """Imprime la relación de tiempos nuevo/antiguo por tamaño y operación."""
+    with open(old_path, 'r', encoding='utf-8') as file_handle:
+        old = json.load(file_handle)
+    with open(new_path, 'r', encoding='utf-8') as file_handle:
+        new = json.load(file_handle)
+    old_results = dict((item['size'], item['operations']) for item in old.get('results', []))
+    print('%-8s %-32s %10s %10s %8s' % ('tamaño', 'operación', old.get('addon_version', '?'), new.get('addon_version', '?'), 'ratio'))
+    for item in new.get('results', []):
+        previous = old_results.get(item['size'], {})
+        for name, timing in item['operations'].items():
+            before = previous.get(name, {}).get('seconds')
+            after = timing['seconds']
+            ratio = '%.2fx' % (after / before) if before else '-'
+            print('%-8s %-32s %10s %10.4f %8s' % (
+                item['size'], name, '%.4f' % before if before is not None else '-', after, ratio))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks de escaneo y limpieza de Aspirando Kodi.')
+    parser.add_argument('--sizes', default='small,medium', help='presets separados por comas (small, medium, large)')
+    parser.add_argument('--repeat', type=int, default=3, help='repeticiones de las operaciones de solo lectura')
+    parser.add_argument('--output', help='archivo JSON de resultados (por defecto benchmarks/results/<versión>-<fecha>.json)')
+    parser.add_argument('--workdir', help='carpeta de trabajo (se conserva al terminar)')
+    parser.add_argument('--compare', nargs=2, metavar=('ANTES', 'DESPUES'), help='compara dos archivos de resultados')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    report = run(sizes, max(1, args.repeat), args.workdir)
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', '%s-%s.json' % (report['addon_version'], time.strftime('%Y%m%d-%H%M%S')))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file_handle:
+        json.dump(report, file_handle, indent=2)
+    sys.stderr.write('Resultados en %s\n' % output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""Generador de un userdata de Kodi sintético para los benchmarks.
+
+Crea, bajo una raíz con la estructura de Kodi en Linux (addons/, userdata/,
+temp/), miniaturas repartidas en los 16 fragmentos hexadecimales, caché,
+paquetes con varias versiones por addon, las bases Textures/Epg/TV/Addons/
+MyVideos con M filas y el addon_data de pvr.iptvsimple.
+
+Uso: python benchmarks/userdata.py RAÍZ [--thumbnails N] [--rows M] ...
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+import zipfile
+
+HEX_SHARDS = '0123456789abcdef'
+TEXTURES_DB = 'Textures13.db'
+EPG_DB = 'Epg16.db'
+TV_DB = 'TV40.db'
+ADDONS_DB = 'Addons33.db'
+VIDEOS_DB = 'MyVideos131.db'
+
+# Tamaños por defecto de cada preset (número de archivos / filas)
+PRESETS = {
+    'small': {'thumbnails': 2000, 'cache': 500, 'temp': 200, 'addons': 20, 'versions': 3, 'rows': 2000, 'iptv_files': 20,
+              'deep_depth': 6},
+    'medium': {'thumbnails': 20000, 'cache': 5000, 'temp': 1000, 'addons': 60, 'versions': 4, 'rows': 20000, 'iptv_files': 100,
+               'deep_depth': 9},
+    'large': {'thumbnails': 100000, 'cache': 20000, 'temp': 5000, 'addons': 150, 'versions': 5, 'rows': 100000, 'iptv_files': 400,
+              'deep_depth': 11},
+}
+DEEP_TREE_DIRNAME = 'deep_tree'
+
+
+def _write_file(path, size, rng, max_age_days=400):
+    # Contenido real (no archivos dispersos) para que st_blocks refleje el disco
+    with open(path, 'wb') as file_handle:
+        file_handle.write(bytes(rng.getrandbits(8) for _ in range(min(size, 64))) * (size // 64 + 1))
+        file_handle.truncate(size)
+    # Fechas repartidas en el pasado, como en un userdata con uso real
+    timestamp = time.time() - rng.randint(3600, max_age_days * 86400)
+    os.utime(path, (timestamp, timestamp))
+
+
+def _hash_name(index):
+    return hashlib.md5(('texture-%d' % index).encode('ascii')).hexdigest()[:8]
+
+
+def make_thumbnails(userdata, count, rng, orphan_ratio=0.05):
+    """Crea Thumbnails/<0-f>/<hash>.jpg y devuelve las cachedurl creadas."""
+    thumbs_dir = os.path.join(userdata, 'Thumbnails')
+    for shard in HEX_SHARDS:
+        os.makedirs(os.path.join(thumbs_dir, shard), exist_ok=True)
+    os.makedirs(os.path.join(thumbs_dir, 'Video', 'Bookmarks'), exist_ok=True)
+    cached_urls = []
+    for index in range(count):
+        name = _hash_name(index)
+        cachedurl = '%s/%s.jpg' % (name[0], name)
+        _write_file(os.path.join(thumbs_dir, *cachedurl.split('/')), rng.randint(4096, 65536), rng)
+        cached_urls.append(cachedurl)
+    # Una parte de miniaturas sin fila en la base (huérfanas)
+    orphan_count = int(count * orphan_ratio)
+    for index in range(count, count + orphan_count):
+        name = _hash_name(index)
+        _write_file(os.path.join(thumbs_dir, name[0], name + '.png'), rng.randint(4096, 32768), rng)
+    return cached_urls
+
+
+def make_textures_db(db_dir, cached_urls, rows, rng, missing_ratio=0.05):
+    """Textures13.db con `rows` filas; las que sobran sobre las miniaturas apuntan a archivos inexistentes."""
+    conn = sqlite3.connect(os.path.join(db_dir, TEXTURES_DB))
+    conn.executescript(
+        'CREATE TABLE texture (id integer primary key, url text, cachedurl text, imagehash text, lasthashcheck text);'
+        'CREATE TABLE sizes (idtexture integer, size integer, width integer, height integer, usecount integer, lastusetime text);'
+        'CREATE TABLE path (id integer primary key, url text, type text, texture text);'
+        'CREATE INDEX idxTexture ON texture(url);'
+        'CREATE INDEX idxSize ON sizes(idtexture, size);'
+    )
+    missing = max(int(rows * missing_ratio), rows - len(cached_urls))
+    urls = cached_urls[:max(0, rows - missing)]
+    urls += ['%s/%s.jpg' % (name[0], name) for name in (_hash_name(10 ** 9 + i) for i in range(rows - len(urls)))]
+    now = time.time()
+    texture_rows = []
+    size_rows = []
+    for texture_id, cachedurl in enumerate(urls, 1):
+        texture_rows.append((texture_id, 'http://example.invalid/art/%d.jpg' % texture_id, cachedurl, '', ''))
+        last_use = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now - rng.randint(0, 400 * 86400)))
+        size_rows.append((texture_id, 1, 500, 750, rng.randint(0, 50), last_use))
+    conn.executemany('INSERT INTO texture VALUES (?, ?, ?, ?, ?)', texture_rows)
+    conn.executemany('INSERT INTO sizes VALUES (?, ?, ?, ?, ?, ?)', size_rows)
+    conn.commit()
+    conn.close()
+
+
+def make_epg_db(db_dir, rows, rng):
+    conn = sqlite3.connect(os.path.join(db_dir, EPG_DB))
+    conn.executescript(
+        'CREATE TABLE epg (idEpg integer primary key, sName varchar(64), sScraperName varchar(32));'
+        'CREATE TABLE epgtags (idBroadcast integer primary key, iBroadcastUid integer, idEpg integer, sTitle varchar(128), '
+        'sPlot text, iStartTime integer, iEndTime integer);'
+    )
+    channels = max(1, rows // 200)
+    conn.executemany('INSERT INTO epg VALUES (?, ?, ?)', [(i, 'Canal %d' % i, 'client') for i in range(1, channels + 1)])
+    start = int(time.time())
+    conn.executemany('INSERT INTO epgtags VALUES (?, ?, ?, ?, ?, ?, ?)', [
+        (i, i, rng.randint(1, channels), 'Programa %d' % i, 'x' * rng.randint(50, 400), start + i * 60, start + i * 60 + 1800)
+        for i in range(1, rows + 1)])
+    conn.commit()
+    conn.close()
+
+
+def make_tv_db(db_dir, rows):
+    conn = sqlite3.connect(os.path.join(db_dir, TV_DB))
+    conn.execute('CREATE TABLE channels (idChannel integer primary key, iUniqueId integer, bIsRadio bool, '
+                 'sChannelName varchar(64), sIconPath varchar(255))')
+    conn.executemany('INSERT INTO channels VALUES (?, ?, ?, ?, ?)', [
+        (i, i, 0, 'Canal %d' % i, 'http://example.invalid/logo/%d.png' % i) for i in range(1, max(1, rows // 50) + 1)])
+    conn.commit()
+    conn.close()
+
+
+def make_fragmented_db(db_dir, name, rows):
+    """Base con la mitad de filas borradas para que VACUUM tenga trabajo."""
+    conn = sqlite3.connect(os.path.join(db_dir, name))
+    conn.execute('CREATE TABLE data (id integer primary key, payload text)')
+    conn.executemany('INSERT INTO data VALUES (?, ?)', [(i, 'p' * 200) for i in range(1, rows + 1)])
+    conn.commit()
+    conn.execute('DELETE FROM data WHERE id % 2 = 0')
+    conn.commit()
+    conn.close()
+
+
+def make_packages(home, addons, versions, rng):
+    packages_dir = os.path.join(home, 'addons', 'packages')
+    os.makedirs(packages_dir, exist_ok=True)
+    for addon_index in range(addons):
+        addon_id = 'plugin.video.bench%03d' % addon_index
+        for version_index in range(versions):
+            name = '%s-%d.%d.%d.zip' % (addon_id, 1 + version_index // 3, version_index % 3, rng.randint(0, 9))
+            with zipfile.ZipFile(os.path.join(packages_dir, name), 'w', zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('%s/addon.xml' % addon_id, '<addon id="%s"/>' % addon_id)
+                archive.writestr('%s/default.py' % addon_id, 'x = 1\n' * rng.randint(100, 4000))
+
+
+def make_flat_files(folder, count, rng, fanout=50):
+    """Archivos repartidos en subcarpetas de `fanout` entradas (caché/temp)."""
+    for index in range(count):
+        subdir = os.path.join(folder, 'd%03d' % (index // fanout))
+        if index % fanout == 0:
+            os.makedirs(subdir, exist_ok=True)
+        _write_file(os.path.join(subdir, 'f%05d.tmp' % index), rng.randint(512, 16384), rng)
+
+
+def make_deep_tree(folder, depth, rng, fanout=2, files_per_dir=10):
+    """Árbol binario de `depth` niveles con nombres largos, para medir el coste por
+    archivo cuando el kernel tiene que resolver rutas profundas."""
+    pending = [(folder, 0)]
+    created = 0
+    while pending:
+        current, level = pending.pop()
+        os.makedirs(current, exist_ok=True)
+        for index in range(files_per_dir):
+            _write_file(os.path.join(current, 'archivo_de_cache_%02d.bin' % index), rng.randint(64, 2048), rng)
+            created += 1
+        if level < depth:
+            for branch in range(fanout):
+                pending.append((os.path.join(current, 'nivel%02d_rama%d_directorio_largo' % (level, branch)), level + 1))
+    return created
+
+
+def make_iptvsimple(userdata, count, rng):
+    data_dir = os.path.join(userdata, 'addon_data', 'pvr.iptvsimple')
+    os.makedirs(os.path.join(data_dir, 'cache'), exist_ok=True)
+    with open(os.path.join(data_dir, 'settings.xml'), 'w', encoding='utf-8') as file_handle:
+        file_handle.write('<settings version="2"><setting id="m3uPath">/tmp/lista.m3u</setting></settings>')
+    _write_file(os.path.join(data_dir, 'iptv.m3u.cache'), 256 * 1024, rng)
+    _write_file(os.path.join(data_dir, 'xmltv.xml.gz.cache'), 512 * 1024, rng)
+    for index in range(count):
+        _write_file(os.path.join(data_dir, 'cache', 'logo%04d.png' % index), rng.randint(1024, 8192), rng)
+
+
+def generate(root, thumbnails=2000, cache=500, temp=200, addons=20, versions=3, rows=2000, iptv_files=20,
+             deep_depth=0, seed=1):
+    """Genera el árbol completo bajo `root` y devuelve los parámetros usados.
+
+    Con `deep_depth` crea además <root>/deep_tree, fuera de las categorías de limpieza.
+    """
+    rng = random.Random(seed)
+    userdata = os.path.join(root, 'userdata')
+    db_dir = os.path.join(userdata, 'Database')
+    os.makedirs(db_dir, exist_ok=True)
+    cached_urls = make_thumbnails(userdata, thumbnails, rng)
+    make_textures_db(db_dir, cached_urls, rows, rng)
+    make_epg_db(db_dir, rows, rng)
+    make_tv_db(db_dir, rows)
+    make_fragmented_db(db_dir, ADDONS_DB, rows)
+    make_fragmented_db(db_dir, VIDEOS_DB, rows)
+    make_flat_files(os.path.join(userdata, 'cache'), cache, rng)
+    make_flat_files(os.path.join(root, 'temp'), temp, rng)
+    make_packages(root, addons, versions, rng)
+    make_iptvsimple(userdata, iptv_files, rng)
+    if deep_depth:
+        make_deep_tree(os.path.join(root, DEEP_TREE_DIRNAME), deep_depth, rng)
+    return {
+        'thumbnails': thumbnails, 'cache': cache, 'temp': temp, 'addons': addons,
+        'versions': versions, 'rows': rows, 'iptv_files': iptv_files, 'deep_depth': deep_depth, 'seed': seed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Genera un userdata de Kodi sintético.')
+    parser.add_argument('root', help='carpeta raíz (equivale a special://home)')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    for key in PRESETS['small']:
+        parser.add_argument('--' + key.replace('_', '-'), dest=key, type=int, default=None)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    params = dict(PRESETS[args.preset])
+    for key in params:
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+    started = time.time()
+    used = generate(args.root, seed=args.seed, **params)
+    used['seconds'] = round(time.time() - started, 3)
+    json.dump(used, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,6 +8,7 @@ import json
 import time
 import datetime
 import urllib.request
+import storage
 
 # Contexto del addon (local a este módulo)
 addon = xbmcaddon.Addon()
@@ -423,57 +424,40 @@ def read_cachepath_from_config(config_path):
 def clean_usb_cachepath_legacy(config_path):
     return clean_usb_cachepath(config_path, silent=False)
 
-# Necesitamos estas utilidades aquí; se pasarán desde default si están allí.
-# Para evitar circularidad, las reimplementamos mínimamente.
+# Escaneo delegado en storage.py (motor compartido con default.py)
 def get_folder_size(folder_path):
-    total_size = 0
-    try:
-        if os.path.exists(folder_path):
-            for dirpath, dirnames, filenames in os.walk(folder_path):
-                for filename in filenames:
-                    file_path = os.path.join(dirpath, filename)
-                    try:
-                        total_size += os.path.getsize(file_path)
-                    except (OSError, IOError):
-                        continue
-    except Exception as e:
-        log('Error calculando tamaño de %s: %s' % (folder_path, str(e)))
-    return total_size
+    return storage.scan_tree(folder_path)['size']
 
 def count_files_in_folder(folder_path):
-    count = 0
-    try:
-        if os.path.exists(folder_path):
-            for dirpath, dirnames, filenames in os.walk(folder_path):
-                count += len(filenames)
-    except Exception as e:
-        log('Error contando archivos en %s: %s' % (folder_path, str(e)))
-    return count
+    return storage.scan_tree(folder_path)['files']
 
-def safe_remove_folder_contents(folder_path):
-    removed_count = 0
-    removed_size = 0
+def safe_remove_folder_contents(folder_path, progress=None):
+    """Vacía la carpeta y anota en 'free_space_gained' lo que ganó el dispositivo (statvfs)."""
+    probe = storage.FreeSpaceProbe([folder_path])
+    result = storage.remove_folder_contents(folder_path, progress=progress)
+    result['free_space_gained'] = probe.gained()
+    return result
+
+def remove_folder_contents_with_progress(folder_path, heading):
+    """Borra con DialogProgress cancelable; los totales salen del índice de tamaños."""
+    stats = storage.scan_tree_cached(folder_path)
+    progress = xbmcgui.DialogProgress()
+    progress.create(heading, 'Eliminando archivos de caché...')
+    reporter = storage.ProgressReporter(progress, stats['files'], stats['size'])
+    reporter.set_stage('Eliminando archivos de caché...')
     try:
-        if os.path.exists(folder_path):
-            for item in os.listdir(folder_path):
-                item_path = os.path.join(folder_path, item)
-                try:
-                    if os.path.isfile(item_path):
-                        size = os.path.getsize(item_path)
-                        os.remove(item_path)
-                        removed_size += size
-                        removed_count += 1
-                    elif os.path.isdir(item_path):
-                        size = get_folder_size(item_path)
-                        shutil.rmtree(item_path)
-                        removed_size += size
-                        removed_count += 1
-                except Exception as e:
-                    log('Error eliminando %s: %s' % (item_path, str(e)))
-                    continue
-    except Exception as e:
-        log('Error accediendo a carpeta %s: %s' % (folder_path, str(e)))
-    return removed_count, removed_size
+        return safe_remove_folder_contents(folder_path, progress=reporter)
+    finally:
+        progress.close()
+
+def _freed_text(result):
+    return storage.describe_freed(result, result.get('free_space_gained'))
+
+def _removed_message(result):
+    msg = 'Eliminados %d archivos (%s liberados).' % (result['removed_count'], _freed_text(result))
+    if result.get('cancelled'):
+        msg += '\nOperación cancelada: el resto de archivos se conserva.'
+    return msg
 
 # Flags de auto-clean
 def autoclean_flag_path():
@@ -874,17 +858,13 @@ def view_special_temp_cache():
         temp_root = special_temp_path()
         cache_dir = os.path.join(temp_root, 'cache')
         target = cache_dir if os.path.exists(cache_dir) else temp_root
-        total_size = get_folder_size(target)
-        total_files = count_files_in_folder(target)
         recent = []
-        for dirpath, dirnames, filenames in os.walk(target):
-            for fn in filenames:
-                fp = os.path.join(dirpath, fn)
-                try:
-                    st = os.stat(fp)
-                except Exception:
-                    continue
-                recent.append((st.st_mtime, os.path.relpath(fp, target), st.st_size))
+        stats = storage.scan_tree(
+            target,
+            on_file=lambda entry, st: recent.append((st.st_mtime, os.path.relpath(entry.path, target), st.st_size))
+        )
+        total_size = stats['size']
+        total_files = stats['files']
         recent.sort(reverse=True)
         lines = []
         lines.append('RUTA DE CACHÉ EN USO (special://temp)')
@@ -1246,7 +1226,10 @@ def save_buffering_config_to_usb(config_path):
         log('Error general en save_buffering_config_to_usb: %s' % str(e))
         xbmcgui.Dialog().ok('Error', 'Error guardando en USB: %s' % str(e))
 
-def clean_usb_cachepath(config_path, silent=False):
+def clean_usb_cachepath(config_path, silent=False, throttle=None):
+    """Limpia el cachepath (o el temp redirigido). En modo silencioso, `throttle`
+    (storage.TimeSlicer) reparte el borrado en lotes."""
+    result = storage.empty_result()
     try:
         dialog = xbmcgui.Dialog()
         cpath = read_cachepath_from_config(config_path)
@@ -1260,24 +1243,27 @@ def clean_usb_cachepath(config_path, silent=False):
                        'Se detectó redirección de special://temp a:\n%s\n\n'
                        '¿Limpiar la carpeta de caché en ese destino?') % use_target
                 if not silent and dialog.yesno('Cache en USB (temp redirigido)', msg, yeslabel='Limpiar', nolabel='Cancelar'):
-                    removed_count, removed_size = safe_remove_folder_contents(use_target)
-                    dialog.ok('Cache en USB', 'Eliminados %d elementos (%s liberados).' % (removed_count, format_size(removed_size)))
-                    log('Limpieza via temp redirigido: %d, %s' % (removed_count, format_size(removed_size)))
+                    result = remove_folder_contents_with_progress(use_target, 'Cache en USB')
+                    dialog.ok('Cache en USB', _removed_message(result))
+                    log('Limpieza via temp redirigido: %d, %s' % (result['removed_count'], _freed_text(result)))
                 elif silent:
-                    removed_count, removed_size = safe_remove_folder_contents(use_target)
-                    log('Limpieza via temp redirigido (silent): %d, %s' % (removed_count, format_size(removed_size)))
-                return
+                    result = safe_remove_folder_contents(use_target, progress=throttle)
+                    log('Limpieza via temp redirigido (silent): %d, %s' % (result['removed_count'], _freed_text(result)))
+                return result
             if not silent:
                 dialog.ok('Cache USB', 'No hay cachepath válido configurado.')
-            return
-        removed_count, removed_size = safe_remove_folder_contents(cpath)
-        if not silent:
-            xbmcgui.Dialog().ok('Cache USB', 'Eliminados %d elementos (%s liberados).' % (removed_count, format_size(removed_size)))
-        log('Auto-limpieza manual: %d, %s (silent=%s)' % (removed_count, format_size(removed_size), silent))
+            return result
+        if silent:
+            result = safe_remove_folder_contents(cpath, progress=throttle)
+        else:
+            result = remove_folder_contents_with_progress(cpath, 'Cache USB')
+            xbmcgui.Dialog().ok('Cache USB', _removed_message(result))
+        log('Auto-limpieza manual: %d, %s (silent=%s)' % (result['removed_count'], _freed_text(result), silent))
     except Exception as e:
         log('Error limpiando cache USB: %s' % str(e))
         if not silent:
             xbmcgui.Dialog().ok('Error', 'Error limpiando cache USB: %s' % str(e))
+    return result
 
 def configure_usb_cachepath(config_path):
     """Configura directamente un almacenamiento externo como cachepath."""
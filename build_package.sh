@@ -39,6 +39,12 @@ copy_item "$ROOT_DIR/default.py" "$STAGE_DIR/default.py"
 copy_item "$ROOT_DIR/service.py" "$STAGE_DIR/service.py"
 copy_item "$ROOT_DIR/buffering.py" "$STAGE_DIR/buffering.py"
 copy_item "$ROOT_DIR/updater.py" "$STAGE_DIR/updater.py"
+copy_item "$ROOT_DIR/storage.py" "$STAGE_DIR/storage.py"
+copy_item "$ROOT_DIR/textures.py" "$STAGE_DIR/textures.py"
+copy_item "$ROOT_DIR/packages.py" "$STAGE_DIR/packages.py"
+copy_item "$ROOT_DIR/watcher.py" "$STAGE_DIR/watcher.py"
+copy_item "$ROOT_DIR/priority.py" "$STAGE_DIR/priority.py"
+copy_item "$ROOT_DIR/maintenance.py" "$STAGE_DIR/maintenance.py"
 copy_item "$ROOT_DIR/LICENSE" "$STAGE_DIR/LICENSE"
 copy_item "$ROOT_DIR/README.md" "$STAGE_DIR/README.md"
 copy_item "$ROOT_DIR/icon.png" "$STAGE_DIR/icon.png"
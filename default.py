@@ -7,12 +7,14 @@ import time
 import urllib.request
 import urllib.error
 import os
-import shutil
 import json
 import subprocess
 import re
 import datetime
 import buffering as buffering_module
+import packages
+import storage
+import textures
 import updater
 from buffering import (
     get_default_kodi_values,
@@ -110,59 +112,50 @@ def _safe_int_from_elem(elem, default=0):
 
 def get_folder_size(folder_path):
     """Calcula el tamaño total de una carpeta"""
-    total_size = 0
-    try:
-        if os.path.exists(folder_path):
-            for dirpath, dirnames, filenames in os.walk(folder_path):
-                for filename in filenames:
-                    file_path = os.path.join(dirpath, filename)
-                    try:
-                        total_size += os.path.getsize(file_path)
-                    except (OSError, IOError):
-                        continue
-    except Exception as e:
-        log('Error calculando tamaño de %s: %s' % (folder_path, str(e)))
-    return total_size
+    return storage.scan_tree(folder_path)['size']
 
 def count_files_in_folder(folder_path):
     """Cuenta el número de archivos en una carpeta"""
-    count = 0
+    return storage.scan_tree(folder_path)['files']
+
+def safe_remove_folder_contents(folder_path, progress=None):
+    """Elimina el contenido de una carpeta de forma segura.
+
+    Devuelve el resultado de storage.remove_folder_contents (removed_count,
+    removed_size, removed_blocks, removed_dirs, errors, cancelled) más
+    free_space_gained: lo que ganó el dispositivo según statvfs.
+    """
+    probe = storage.FreeSpaceProbe([folder_path])
+    result = storage.remove_folder_contents(folder_path, progress=progress)
+    result['free_space_gained'] = probe.gained()
+    return result
+
+
+def _freed_text(result):
+    trashed_count = result.get('trashed_count')
+    # Lo movido a la papelera aún ocupa sitio: una ganancia medida ahora sería engañosa
+    text = storage.describe_freed(result, None if trashed_count else result.get('free_space_gained'))
+    if trashed_count:
+        trashed = '%d archivos (%s) en la papelera: el espacio se liberará en segundo plano' % (
+            trashed_count, format_size(result['trashed_size']))
+        text = '%s; %s' % (text, trashed) if result['removed_count'] else trashed
+    return text
+
+
+def is_instant_clean_enabled():
+    """Limpieza instantánea: mover a la papelera y dejar el borrado al servicio."""
     try:
-        if os.path.exists(folder_path):
-            for dirpath, dirnames, filenames in os.walk(folder_path):
-                count += len(filenames)
-    except Exception as e:
-        log('Error contando archivos en %s: %s' % (folder_path, str(e)))
-    return count
+        return addon.getSettingBool('instant_clean')
+    except Exception:
+        return True
+
+
+def _cleanup_outcome(result, done_line, cancelled_line):
+    """Título del diálogo, primera y última línea del resumen según si se canceló la limpieza."""
+    if result.get('cancelled'):
+        return 'Limpieza Cancelada', cancelled_line, 'Operación cancelada: el resto de archivos se conserva.'
+    return 'Limpieza Completada', done_line, 'Operación completada.'
 
-def safe_remove_folder_contents(folder_path):
-    """Elimina el contenido de una carpeta de forma segura"""
-    removed_count = 0
-    removed_size = 0
-    try:
-        if os.path.exists(folder_path):
-            for item in os.listdir(folder_path):
-                item_path = os.path.join(folder_path, item)
-                try:
-                    if os.path.isfile(item_path):
-                        size = os.path.getsize(item_path)
-                        os.remove(item_path)
-                        removed_size += size
-                        removed_count += 1
-                    elif os.path.isdir(item_path):
-                        # Contar archivos dentro del directorio antes de eliminarlo
-                        dir_file_count = count_files_in_folder(item_path)
-                        size = get_folder_size(item_path)
-                        shutil.rmtree(item_path)
-                        removed_size += size
-                        removed_count += dir_file_count  # Contar archivos reales, no directorios
-                except Exception as e:
-                    log('Error eliminando %s: %s' % (item_path, str(e)))
-                    continue
-    except Exception as e:
-        log('Error accediendo a carpeta %s: %s' % (folder_path, str(e)))
-    
-    return removed_count, removed_size
 
 def _translate(path):
     """Traduce rutas special:// de forma segura"""
@@ -202,7 +195,7 @@ def get_kodi_paths():
         log('Error obteniendo rutas de Kodi: %s' % str(e))
         return {}
 
-def get_cache_info():
+def get_cache_info(index=None):
     """Obtiene información de caché"""
     paths = get_kodi_paths()
     cache_path = paths.get('cache', '')
@@ -210,12 +203,10 @@ def get_cache_info():
     if not os.path.exists(cache_path):
         return 0, 0
     
-    size = get_folder_size(cache_path)
-    files = count_files_in_folder(cache_path)
-    
-    return size, files
+    stats = storage.scan_tree_cached(cache_path, index=index)
+    return stats['size'], stats['files']
 
-def get_thumbnails_info():
+def get_thumbnails_info(index=None):
     """Obtiene información de thumbnails"""
     paths = get_kodi_paths()
     thumbnails_path = paths.get('thumbnails', '')
@@ -223,12 +214,10 @@ def get_thumbnails_info():
     if not os.path.exists(thumbnails_path):
         return 0, 0
     
-    size = get_folder_size(thumbnails_path)
-    files = count_files_in_folder(thumbnails_path)
-    
-    return size, files
+    stats = storage.scan_tree_cached(thumbnails_path, index=index)
+    return stats['size'], stats['files']
 
-def get_packages_info():
+def get_packages_info(index=None):
     """Obtiene información de paquetes"""
     paths = get_kodi_paths()
     packages_path = paths.get('packages', '')
@@ -236,12 +225,10 @@ def get_packages_info():
     if not os.path.exists(packages_path):
         return 0, 0
     
-    size = get_folder_size(packages_path)
-    files = count_files_in_folder(packages_path)
-    
-    return size, files
+    stats = storage.scan_tree_cached(packages_path, index=index)
+    return stats['size'], stats['files']
 
-def get_temp_info():
+def get_temp_info(index=None):
     """Obtiene información de archivos temporales"""
     paths = get_kodi_paths()
     temp_path = paths.get('temp', '')
@@ -249,10 +236,8 @@ def get_temp_info():
     if not os.path.exists(temp_path):
         return 0, 0
     
-    size = get_folder_size(temp_path)
-    files = count_files_in_folder(temp_path)
-    
-    return size, files
+    stats = storage.scan_tree_cached(temp_path, index=index)
+    return stats['size'], stats['files']
 
 
 STREAMING_DB_PREFIXES = ('epg', 'tv', 'pvr')
@@ -261,16 +246,8 @@ STREAMING_CACHE_EXTENSIONS = ('.cache', '.tmp', '.temp', '.bak')
 
 def _path_cleanup_stats(path):
     """Devuelve tamaño y número de archivos asociados a una ruta."""
-    try:
-        if not path or not os.path.exists(path):
-            return 0, 0
-        if os.path.isfile(path):
-            return os.path.getsize(path), 1
-        if os.path.isdir(path):
-            return get_folder_size(path), count_files_in_folder(path)
-    except Exception as e:
-        log('Error obteniendo estadísticas de %s: %s' % (path, str(e)))
-    return 0, 0
+    stats = storage.scan_path(path)
+    return stats['size'], stats['files']
 
 
 def _collect_streaming_artifact_targets():
@@ -319,37 +296,92 @@ def _collect_streaming_artifact_targets():
     return targets
 
 
-def get_streaming_artifacts_info():
+def get_streaming_artifacts_info(targets=None):
     """Devuelve el tamaño y número de archivos de residuos IPTV/PVR."""
     total_size = 0
     total_files = 0
-    for target in _collect_streaming_artifact_targets():
+    if targets is None:
+        targets = _collect_streaming_artifact_targets()
+    for target in targets:
         size, files = _path_cleanup_stats(target)
         total_size += size
         total_files += files
     return total_size, total_files
 
 
-def _clean_target_paths(targets):
+def get_all_categories_info(paths=None):
+    """Escanea en paralelo todas las categorías de limpieza usando el índice persistente.
+
+    Devuelve un dict categoría -> (tamaño, archivos).
+    """
+    if paths is None:
+        paths = get_kodi_paths()
+    size_index = storage.load_index()
+    results = storage.scan_roots_parallel(_clean_all_categories(paths), index=size_index)
+    storage.save_index(size_index)
+    return dict((label, (stats['size'], stats['files'])) for label, stats in results.items())
+
+
+def refresh_category_sizes(paths=None, workers_per_device=1, skip=()):
+    """Pre-escaneo del servicio: recalcula las categorías con un solo hilo por
+    dispositivo (para no competir con Kodi) y guarda la caché de tamaños.
+
+    `skip` son categorías que ya se siguen en vivo (watcher.py) y no se tocan.
+    """
+    if paths is None:
+        paths = get_kodi_paths()
+    categories = dict((label, targets) for label, targets in _clean_all_categories(paths).items() if label not in skip)
+    size_index = storage.load_index()
+    results = storage.scan_roots_parallel(categories, index=size_index, workers_per_device=workers_per_device)
+    storage.save_index(size_index)
+    storage.save_size_cache(results, merge=bool(skip))
+    return results
+
+
+def _category_figures(label, scan_function):
+    """Tamaño y archivos de una categoría para el diálogo de confirmación.
+
+    Usa la cifra del pre-escaneo del servicio si existe, con una nota sobre su
+    antigüedad; si no, escanea en el momento (la nota queda vacía).
+    """
+    cached = storage.cached_category_sizes(label)
+    if cached is not None and cached[0] > 0:
+        size, files, age = cached
+        return size, files, '\n(Escaneado %s; se recalcula al confirmar)' % storage.format_age(age)
+    size, files = scan_function()
+    return size, files, ''
+
+
+CLEAN_ALL_LABELS = ('cache', 'thumbnails', 'packages', 'temp', 'streaming')
+
+
+def _clean_all_categories(paths):
+    """Rutas de cada categoría que vacía la limpieza completa."""
+    return {
+        'cache': [paths.get('cache', '')],
+        'thumbnails': [paths.get('thumbnails', '')],
+        'packages': [paths.get('packages', '')],
+        'temp': [paths.get('temp', '')],
+        'streaming': _collect_streaming_artifact_targets(),
+    }
+
+
+def plan_clean_all(paths=None):
+    """Planificación en seco de la limpieza completa: un único escaneo que
+    devuelve el manifiesto de borrado (rutas, tamaños y totales por categoría)."""
+    if paths is None:
+        paths = get_kodi_paths()
+    return storage.build_manifest(_clean_all_categories(paths))
+
+
+def _clean_target_paths(targets, result=None, progress=None):
     """Elimina un conjunto de rutas concretas sin tocar directorios ajenos."""
-    removed_count = 0
-    removed_size = 0
-    for target in targets:
-        try:
-            if not os.path.exists(target):
-                continue
-            if os.path.isfile(target):
-                size = os.path.getsize(target)
-                os.remove(target)
-                removed_size += size
-                removed_count += 1
-            elif os.path.isdir(target):
-                dir_removed_count, dir_removed_size = safe_remove_folder_contents(target)
-                removed_count += dir_removed_count
-                removed_size += dir_removed_size
-        except Exception as e:
-            log('Error eliminando residuo de streaming %s: %s' % (target, str(e)))
-    return removed_count, removed_size
+    if result is None:
+        result = storage.empty_result()
+    with storage.skip_open_files():
+        for target in targets:
+            storage.remove_path(target, result, progress)
+    return result
 
 
 def clean_streaming_artifacts(interactive=True, notify=True):
@@ -357,52 +389,62 @@ def clean_streaming_artifacts(interactive=True, notify=True):
     try:
         log('Iniciando limpieza específica de streaming/IPTV')
         targets = _collect_streaming_artifact_targets()
-        total_size, total_files = get_streaming_artifacts_info()
+        if interactive:
+            total_size, total_files, cached_note = _category_figures('streaming', lambda: get_streaming_artifacts_info(targets))
+        else:
+            total_size, total_files = get_streaming_artifacts_info(targets)
+            cached_note = ''
 
         if total_size == 0 and total_files == 0:
             if notify:
                 xbmcgui.Dialog().ok('Información', 'No se encontraron residuos de IPTV/PVR para limpiar.')
-            return {'removed_count': 0, 'removed_size': 0}
+            return storage.empty_result()
 
         if interactive:
             message = ('Residuos de streaming/IPTV detectados:\n\n'
                       'Archivos: %d\n'
-                      'Tamaño: %s\n\n'
+                      'Tamaño: %s%s\n\n'
                       'Se limpiarán bases de datos EPG/TV y cachés temporales de IPTV Simple sin borrar la configuración del usuario.\n\n'
-                      '¿Continuar?') % (total_files, format_size(total_size))
+                      '¿Continuar?') % (total_files, format_size(total_size), cached_note)
             if not xbmcgui.Dialog().yesno('Limpieza Streaming/IPTV', message, yeslabel='Limpiar', nolabel='Cancelar'):
-                return {'removed_count': 0, 'removed_size': 0}
+                return storage.empty_result()
+            if cached_note:
+                total_size, total_files = get_streaming_artifacts_info(targets)
 
         progress = None
+        reporter = None
         if interactive and notify:
             progress = xbmcgui.DialogProgress()
             progress.create('Limpieza Streaming/IPTV', 'Eliminando residuos persistentes de IPTV/PVR...')
             progress.update(0)
+            reporter = storage.ProgressReporter(progress, total_files, total_size)
+            reporter.set_stage('Eliminando residuos persistentes de IPTV/PVR...')
 
-        removed_count, removed_size = _clean_target_paths(targets)
+        result = _clean_target_paths(targets, progress=reporter)
+        storage.forget_cached_sizes(['streaming'])
+        removed_count, removed_size = result['removed_count'], result['removed_size']
 
         if progress:
-            progress.update(100, 'Limpieza completada')
-            xbmc.sleep(500)
             progress.close()
 
         if notify:
-            result_msg = ('Limpieza de streaming/IPTV finalizada:\n\n'
+            title, first_line, _ = _cleanup_outcome(result, 'Limpieza de streaming/IPTV finalizada:', 'Limpieza de streaming/IPTV cancelada:')
+            result_msg = (first_line + '\n\n'
                          'Archivos eliminados: %d\n'
                          'Espacio liberado: %s\n\n'
                          'Kodi regenerará EPG y bases temporales cuando vuelvas a cargar tu lista.') % (
                              removed_count,
                              format_size(removed_size)
                          )
-            xbmcgui.Dialog().ok('Limpieza Completada', result_msg)
+            xbmcgui.Dialog().ok(title, result_msg)
 
         log('Limpieza streaming/IPTV: %d archivos, %s liberados' % (removed_count, format_size(removed_size)))
-        return {'removed_count': removed_count, 'removed_size': removed_size}
+        return result
     except Exception as e:
         log('Error en limpieza streaming/IPTV: %s' % str(e))
         if notify:
             xbmcgui.Dialog().ok('Error', 'Error limpiando residuos de streaming/IPTV: %s' % str(e))
-        return {'removed_count': 0, 'removed_size': 0}
+        return storage.empty_result()
 
 def get_default_kodi_values():
     """Proxy a buffering.py para mantener una única implementación."""
@@ -450,7 +492,7 @@ def clean_cache():
             return
         
         # Obtener información antes de limpiar
-        size, files = get_cache_info()
+        size, files, cached_note = _category_figures('cache', get_cache_info)
         
         if size == 0:
             xbmcgui.Dialog().ok('Información', 'La caché ya está vacía.')
@@ -459,32 +501,38 @@ def clean_cache():
         # Confirmar limpieza
         message = ('Caché de Kodi:\n\n'
                   'Archivos: %d\n'
-                  'Tamaño: %s\n\n'
-                  '¿Eliminar caché?') % (files, format_size(size))
+                  'Tamaño: %s%s\n\n'
+                  '¿Eliminar caché?') % (files, format_size(size), cached_note)
         
         if not xbmcgui.Dialog().yesno('Limpiar Caché', message, yeslabel='Eliminar', nolabel='Cancelar'):
             return
+        if cached_note:
+            # La cifra mostrada viene del pre-escaneo: revalidar antes de borrar
+            size, files = get_cache_info()
         
         # Mostrar progreso
         progress = xbmcgui.DialogProgress()
         progress.create('Limpiando Caché', 'Eliminando archivos de caché...')
         progress.update(0)
+        reporter = storage.ProgressReporter(progress, files, size)
+        reporter.set_stage('Eliminando archivos de caché...')
         
         # Limpiar caché
-        removed_count, removed_size = safe_remove_folder_contents(cache_path)
+        result = safe_remove_folder_contents(cache_path, progress=reporter)
+        storage.forget_cached_sizes(['cache'])
+        removed_count = result['removed_count']
         
-        progress.update(100, 'Limpieza completada')
-        xbmc.sleep(1000)
         progress.close()
         
         # Mostrar resultado
-        result_msg = ('Caché limpiada exitosamente:\n\n'
+        title, first_line, closing = _cleanup_outcome(result, 'Caché limpiada exitosamente:', 'Limpieza de caché cancelada:')
+        result_msg = (first_line + '\n\n'
                      'Archivos eliminados: %d\n'
                      'Espacio liberado: %s\n\n'
-                     'Operación completada.') % (removed_count, format_size(removed_size))
+                     '%s') % (removed_count, _freed_text(result), closing)
         
-        xbmcgui.Dialog().ok('Limpieza Completada', result_msg)
-        log('Caché limpiada: %d archivos, %s liberados' % (removed_count, format_size(removed_size)))
+        xbmcgui.Dialog().ok(title, result_msg)
+        log('Caché limpiada: %d archivos, liberado %s' % (removed_count, _freed_text(result)))
         
     except Exception as e:
         log('Error limpiando caché: %s' % str(e))
@@ -498,12 +546,8 @@ def clean_textures_database():
             log('No se encontró directorio de base de datos')
             return False
         
-        # Buscar base de datos de Textures
-        textures_db = None
-        for name in os.listdir(db_dir):
-            if name.lower().startswith('textures') and name.endswith('.db'):
-                textures_db = os.path.join(db_dir, name)
-                break
+        # Buscar base de datos de Textures (la de versión más alta)
+        textures_db = textures.find_textures_db()
         
         if not textures_db:
             log('No se encontró base de datos Textures')
@@ -543,53 +587,126 @@ def clean_thumbnails():
             return
         
         # Obtener información antes de limpiar
-        size, files = get_thumbnails_info()
+        size, files, cached_note = _category_figures('thumbnails', get_thumbnails_info)
         
         if size == 0:
             xbmcgui.Dialog().ok('Información', 'Los thumbnails ya están vacíos.')
             return
         
+        # Elegir entre vaciar todo o solo quitar huérfanos
+        if textures.find_textures_db():
+            choice = xbmcgui.Dialog().select('Limpiar Thumbnails (%s en %d archivos)' % (format_size(size), files), [
+                'Eliminar todos los thumbnails',
+                'Solo huérfanos (archivos sin fila y filas sin archivo)'
+            ])
+            if choice == -1:
+                return
+            if choice == 1:
+                clean_thumbnail_orphans()
+                return
+
         # Confirmar limpieza
         message = ('Thumbnails de Kodi:\n\n'
                   'Archivos: %d\n'
-                  'Tamaño: %s\n\n'
+                  'Tamaño: %s%s\n\n'
                   'NOTA: También se limpiará la base de datos de texturas.\n\n'
-                  '¿Eliminar thumbnails?') % (files, format_size(size))
+                  '¿Eliminar thumbnails?') % (files, format_size(size), cached_note)
         
         if not xbmcgui.Dialog().yesno('Limpiar Thumbnails', message, yeslabel='Eliminar', nolabel='Cancelar'):
             return
+        if cached_note:
+            # La cifra mostrada viene del pre-escaneo: revalidar antes de borrar
+            size, files = get_thumbnails_info()
         
         # Mostrar progreso
         progress = xbmcgui.DialogProgress()
         progress.create('Limpiando Thumbnails', 'Eliminando thumbnails...')
         progress.update(0)
+        reporter = storage.ProgressReporter(progress, files, size)
+        reporter.set_stage('Eliminando thumbnails...')
+        
+        # Limpiar archivos de thumbnails: al instante con la papelera, si se puede
+        trashed = storage.move_to_trash(thumbnails_path, 'thumbnails') if is_instant_clean_enabled() else None
+        if trashed:
+            result = storage.empty_result()
+            result.update({'trashed_count': files, 'trashed_size': size})
+        else:
+            result = safe_remove_folder_contents(thumbnails_path, progress=reporter)
+        storage.forget_cached_sizes(['thumbnails'])
+        removed_count = result['removed_count'] + result.get('trashed_count', 0)
         
-        # Limpiar archivos de thumbnails
-        removed_count, removed_size = safe_remove_folder_contents(thumbnails_path)
-        
-        progress.update(50, 'Limpiando base de datos de texturas...')
-        
-        # Limpiar base de datos de Textures
-        db_cleaned = clean_textures_database()
+        # Limpiar base de datos de Textures (no si se canceló: quedan miniaturas en disco)
+        db_cleaned = False
+        if not result.get('cancelled'):
+            progress.update(100, 'Limpiando base de datos de texturas...')
+            db_cleaned = clean_textures_database()
         
-        progress.update(100, 'Limpieza completada')
-        xbmc.sleep(1000)
         progress.close()
         
         # Mostrar resultado
-        db_msg = '\nBase de datos: %s' % ('Limpiada' if db_cleaned else 'No se pudo limpiar')
-        result_msg = ('Thumbnails limpiados exitosamente:\n\n'
+        if result.get('cancelled'):
+            db_msg = '\nBase de datos: Sin cambios'
+        else:
+            db_msg = '\nBase de datos: %s' % ('Limpiada' if db_cleaned else 'No se pudo limpiar')
+        title, first_line, closing = _cleanup_outcome(result, 'Thumbnails limpiados exitosamente:', 'Limpieza de thumbnails cancelada:')
+        result_msg = (first_line + '\n\n'
                      'Archivos eliminados: %d\n'
                      'Espacio liberado: %s%s\n\n'
-                     'Operación completada.') % (removed_count, format_size(removed_size), db_msg)
+                     '%s') % (removed_count, _freed_text(result), db_msg, closing)
         
-        xbmcgui.Dialog().ok('Limpieza Completada', result_msg)
-        log('Thumbnails limpiados: %d archivos, %s liberados, DB: %s' % (removed_count, format_size(removed_size), 'OK' if db_cleaned else 'FALLO'))
+        xbmcgui.Dialog().ok(title, result_msg)
+        log('Thumbnails limpiados: %d archivos, liberado %s, DB: %s' % (removed_count, _freed_text(result), 'OK' if db_cleaned else 'FALLO'))
         
     except Exception as e:
         log('Error limpiando thumbnails: %s' % str(e))
         xbmcgui.Dialog().ok('Error', 'Error limpiando thumbnails: %s' % str(e))
 
+def clean_thumbnail_orphans(interactive=True, notify=True, throttle=None):
+    """Elimina miniaturas sin fila en Textures DB y filas cuyo archivo ya no existe"""
+    try:
+        log('Buscando miniaturas huérfanas')
+        paths = get_kodi_paths()
+        thumbnails_path = paths.get('thumbnails', '')
+        report = textures.find_orphans(thumbnails_path)
+        if not report['db_ok']:
+            if notify:
+                xbmcgui.Dialog().ok('Información', 'No se pudo leer la base de datos de texturas.')
+            return storage.empty_result()
+        if not report['files'] and not report['rows']:
+            if notify:
+                xbmcgui.Dialog().ok('Información', 'No hay miniaturas huérfanas.')
+            return storage.empty_result()
+
+        if interactive:
+            message = ('Miniaturas huérfanas encontradas:\n\n'
+                      'Archivos sin fila en la base: %d (%s)\n'
+                      'Filas sin archivo: %d\n\n'
+                      '¿Eliminarlas?') % (len(report['files']), format_size(report['size']), len(report['rows']))
+            if not xbmcgui.Dialog().yesno('Miniaturas huérfanas', message, yeslabel='Eliminar', nolabel='Cancelar'):
+                return storage.empty_result()
+
+        progress = None
+        if interactive and notify:
+            progress = xbmcgui.DialogProgress()
+            progress.create('Miniaturas huérfanas', 'Eliminando huérfanos...')
+        reporter = storage.ProgressReporter(progress, len(report['files']), report['size'], throttle=throttle)
+        reporter.set_stage('Eliminando huérfanos...')
+        result = textures.clean_orphans(thumbnails_path, report=report, progress=reporter)
+        storage.forget_cached_sizes(['thumbnails'])
+        if progress:
+            progress.close()
+
+        if notify:
+            title, first_line, closing = _cleanup_outcome(result, 'Huérfanos eliminados:', 'Limpieza de huérfanos cancelada:')
+            xbmcgui.Dialog().ok(title, '%s\n\nArchivos eliminados: %d\nEspacio liberado: %s\nFilas eliminadas: %d\n\n%s' % (
+                first_line, result['removed_count'], format_size(result['removed_size']), result['db_rows'], closing))
+        return result
+    except Exception as e:
+        log('Error limpiando miniaturas huérfanas: %s' % str(e))
+        if notify:
+            xbmcgui.Dialog().ok('Error', 'Error limpiando miniaturas huérfanas: %s' % str(e))
+        return storage.empty_result()
+
 def clean_packages():
     """Limpia los paquetes de addons de Kodi"""
     try:
@@ -602,46 +719,115 @@ def clean_packages():
             return
         
         # Obtener información antes de limpiar
-        size, files = get_packages_info()
+        size, files, cached_note = _category_figures('packages', get_packages_info)
         
         if size == 0:
             xbmcgui.Dialog().ok('Información', 'No hay paquetes para eliminar.')
             return
         
+        # Elegir entre vaciar todo o podar conservando los últimos de cada addon
+        keep = packages.get_keep_per_addon()
+        choice = xbmcgui.Dialog().select('Limpiar Paquetes (%s en %d archivos)' % (format_size(size), files), [
+            'Eliminar todos los paquetes',
+            'Conservar los %d más recientes por addon y quitar corruptos' % keep
+        ])
+        if choice == -1:
+            return
+        if choice == 1:
+            prune_addon_packages(packages_path, keep)
+            return
+        
         # Confirmar limpieza
         message = ('Paquetes de Addons:\n\n'
                   'Archivos: %d\n'
-                  'Tamaño: %s\n\n'
-                  '¿Eliminar paquetes de instalación?') % (files, format_size(size))
+                  'Tamaño: %s%s\n\n'
+                  '¿Eliminar paquetes de instalación?') % (files, format_size(size), cached_note)
         
         if not xbmcgui.Dialog().yesno('Limpiar Paquetes', message, yeslabel='Eliminar', nolabel='Cancelar'):
             return
+        if cached_note:
+            # La cifra mostrada viene del pre-escaneo: revalidar antes de borrar
+            size, files = get_packages_info()
         
         # Mostrar progreso
         progress = xbmcgui.DialogProgress()
         progress.create('Limpiando Paquetes', 'Eliminando paquetes de addons...')
         progress.update(0)
+        reporter = storage.ProgressReporter(progress, files, size)
+        reporter.set_stage('Eliminando paquetes de addons...')
         
         # Limpiar paquetes
-        removed_count, removed_size = safe_remove_folder_contents(packages_path)
+        result = safe_remove_folder_contents(packages_path, progress=reporter)
+        storage.forget_cached_sizes(['packages'])
+        removed_count = result['removed_count']
         
-        progress.update(100, 'Limpieza completada')
-        xbmc.sleep(1000)
         progress.close()
         
         # Mostrar resultado
-        result_msg = ('Paquetes limpiados exitosamente:\n\n'
+        title, first_line, closing = _cleanup_outcome(result, 'Paquetes limpiados exitosamente:', 'Limpieza de paquetes cancelada:')
+        result_msg = (first_line + '\n\n'
                      'Archivos eliminados: %d\n'
                      'Espacio liberado: %s\n\n'
-                     'Operación completada.') % (removed_count, format_size(removed_size))
+                     '%s') % (removed_count, _freed_text(result), closing)
         
-        xbmcgui.Dialog().ok('Limpieza Completada', result_msg)
-        log('Paquetes limpiados: %d archivos, %s liberados' % (removed_count, format_size(removed_size)))
+        xbmcgui.Dialog().ok(title, result_msg)
+        log('Paquetes limpiados: %d archivos, liberado %s' % (removed_count, _freed_text(result)))
         
     except Exception as e:
         log('Error limpiando paquetes: %s' % str(e))
         xbmcgui.Dialog().ok('Error', 'Error limpiando paquetes: %s' % str(e))
 
+def prune_addon_packages(packages_path=None, keep=None, interactive=True, notify=True, throttle=None):
+    """Borra los paquetes antiguos de cada addon y los corruptos, conservando los más recientes"""
+    try:
+        packages_path = packages_path or get_kodi_paths().get('packages', '')
+        if interactive:
+            progress = xbmcgui.DialogProgress()
+            progress.create('Limpiando Paquetes', 'Comprobando integridad de los paquetes...')
+            progress.update(0)
+        plan = packages.plan_prune(packages_path, keep)
+        if interactive:
+            progress.close()
+
+        if not plan['delete']:
+            if notify:
+                xbmcgui.Dialog().ok('Información', 'No hay paquetes antiguos ni corruptos.\n\nAddons: %d\nPaquetes conservados: %d' % (plan['addons'], plan['kept']))
+            return storage.empty_result()
+
+        if interactive:
+            message = ('Paquetes de %d addons:\n\n'
+                      'Antiguos a eliminar: %d\n'
+                      'Corruptos a eliminar: %d\n'
+                      'Espacio a liberar: %s\n'
+                      'Se conservan: %d\n\n'
+                      '¿Eliminar paquetes?') % (plan['addons'], len(plan['delete']) - plan['corrupt'], plan['corrupt'],
+                                                format_size(plan['size']), plan['kept'])
+            if not xbmcgui.Dialog().yesno('Limpiar Paquetes', message, yeslabel='Eliminar', nolabel='Cancelar'):
+                return storage.empty_result()
+
+        progress = None
+        if interactive and notify:
+            progress = xbmcgui.DialogProgress()
+            progress.create('Limpiando Paquetes', 'Eliminando paquetes antiguos...')
+        reporter = storage.ProgressReporter(progress, len(plan['delete']), plan['size'], throttle=throttle)
+        reporter.set_stage('Eliminando paquetes antiguos...')
+        result = packages.prune_packages(plan, progress=reporter)
+        storage.forget_cached_sizes(['packages'])
+        if progress:
+            progress.close()
+
+        if notify:
+            title, first_line, closing = _cleanup_outcome(result, 'Paquetes podados:', 'Poda de paquetes cancelada:')
+            xbmcgui.Dialog().ok(title, '%s\n\nArchivos eliminados: %d\nEspacio liberado: %s\nPaquetes conservados: %d\n\n%s' % (
+                first_line, result['removed_count'], format_size(result['removed_size']), plan['kept'], closing))
+        log('Paquetes podados: %d archivos, %s liberados' % (result['removed_count'], format_size(result['removed_size'])))
+        return result
+    except Exception as e:
+        log('Error podando paquetes: %s' % str(e))
+        if notify:
+            xbmcgui.Dialog().ok('Error', 'Error podando paquetes: %s' % str(e))
+        return storage.empty_result()
+
 def clean_temp():
     """Limpia archivos temporales de Kodi"""
     try:
@@ -660,7 +846,7 @@ def clean_temp():
             log('temp_path es un symlink a: %s' % real_path)
         
         # Obtener información antes de limpiar
-        size, files = get_temp_info()
+        size, files, cached_note = _category_figures('temp', get_temp_info)
         
         if size == 0:
             xbmcgui.Dialog().ok('Información', 'No hay archivos temporales para eliminar.')
@@ -670,57 +856,88 @@ def clean_temp():
         symlink_info = '\n(Redirigido a: %s)' % os.path.realpath(temp_path) if is_symlink else ''
         message = ('Archivos Temporales:%s\n\n'
                   'Archivos: %d\n'
-                  'Tamaño: %s\n\n'
-                  '¿Eliminar archivos temporales?') % (symlink_info, files, format_size(size))
+                  'Tamaño: %s%s\n\n'
+                  '¿Eliminar archivos temporales?') % (symlink_info, files, format_size(size), cached_note)
         
         if not xbmcgui.Dialog().yesno('Limpiar Temporales', message, yeslabel='Eliminar', nolabel='Cancelar'):
             return
+        if cached_note:
+            # La cifra mostrada viene del pre-escaneo: revalidar antes de borrar
+            size, files = get_temp_info()
         
         # Mostrar progreso
         progress = xbmcgui.DialogProgress()
         progress.create('Limpiando Temporales', 'Eliminando archivos temporales...')
         progress.update(0)
+        reporter = storage.ProgressReporter(progress, files, size)
+        reporter.set_stage('Eliminando archivos temporales...')
         
         # Limpiar temporales
-        removed_count, removed_size = safe_remove_folder_contents(temp_path)
+        result = safe_remove_folder_contents(temp_path, progress=reporter)
+        storage.forget_cached_sizes(['temp'])
+        removed_count = result['removed_count']
         
-        progress.update(100, 'Limpieza completada')
-        xbmc.sleep(1000)
         progress.close()
         
         # Mostrar resultado
-        result_msg = ('Archivos temporales limpiados:\n\n'
+        title, first_line, closing = _cleanup_outcome(result, 'Archivos temporales limpiados:', 'Limpieza de temporales cancelada:')
+        result_msg = (first_line + '\n\n'
                      'Archivos eliminados: %d\n'
                      'Espacio liberado: %s\n\n'
-                     'Operación completada.') % (removed_count, format_size(removed_size))
+                     '%s') % (removed_count, _freed_text(result), closing)
         
-        xbmcgui.Dialog().ok('Limpieza Completada', result_msg)
-        log('Temporales limpiados: %d archivos, %s liberados' % (removed_count, format_size(removed_size)))
+        xbmcgui.Dialog().ok(title, result_msg)
+        log('Temporales limpiados: %d archivos, liberado %s' % (removed_count, _freed_text(result)))
         
     except Exception as e:
         log('Error limpiando archivos temporales: %s' % str(e))
         xbmcgui.Dialog().ok('Error', 'Error limpiando temporales: %s' % str(e))
 
-def clean_all(interactive=True, notify=True):
-    """Limpia todo: caché, thumbnails, paquetes, temporales y residuos IPTV/PVR."""
+def clean_all(interactive=True, notify=True, throttle=None, manifest=None):
+    """Limpia todo: caché, thumbnails, paquetes, temporales y residuos IPTV/PVR.
+
+    `throttle` (storage.TimeSlicer) reparte el borrado en lotes para que el
+    servicio no acapare la E/S de Kodi. Con `manifest` (de plan_clean_all) no
+    se vuelve a escanear: se borra lo planificado y solo se relistan los
+    directorios que han cambiado desde entonces.
+    """
     try:
         log('Iniciando limpieza completa')
 
-        # Obtener información de todas las categorías
-        paths = get_kodi_paths()
-        cache_size, cache_files = get_cache_info()
-        thumb_size, thumb_files = get_thumbnails_info()
-        pack_size, pack_files = get_packages_info()
-        temp_size, temp_files = get_temp_info()
-        streaming_size, streaming_files = get_streaming_artifacts_info()
+        # En modo interactivo el resumen sale del pre-escaneo del servicio, si
+        # existe y cubre todas las categorías; el manifiesto se calcula al confirmar
+        cached = storage.load_size_cache() if interactive and manifest is None else None
+        cached_note = ''
+        if cached is not None and all(label in cached['categories'] for label in CLEAN_ALL_LABELS):
+            summary_stats = dict((label, (category['size'], category['files']))
+                                 for label, category in cached['categories'].items())
+            total_allocated = storage.allocated_bytes(sum(category.get('blocks', 0) for category in cached['categories'].values()))
+            cached_note = '(Escaneado %s; se recalcula al confirmar)\n\n' % storage.format_age(time.time() - cached.get('created', 0))
+        else:
+            # Un único escaneo: el mismo manifiesto da el resumen y guía el borrado
+            if manifest is None:
+                manifest = plan_clean_all()
+            summary_stats = storage.manifest_totals(manifest)
+            total_allocated = storage.manifest_allocated(manifest)
+        for label in CLEAN_ALL_LABELS:
+            summary_stats.setdefault(label, (0, 0))
+        cache_size, cache_files = summary_stats['cache']
+        thumb_size, thumb_files = summary_stats['thumbnails']
+        pack_size, pack_files = summary_stats['packages']
+        temp_size, temp_files = summary_stats['temp']
+        streaming_size, streaming_files = summary_stats['streaming']
 
         total_size = cache_size + thumb_size + pack_size + temp_size + streaming_size
         total_files = cache_files + thumb_files + pack_files + temp_files + streaming_files
 
+        if total_size == 0 and cached_note:
+            # Una caché a cero puede estar desfasada: confirmar con un escaneo real
+            storage.forget_cached_sizes()
+            return clean_all(interactive, notify, throttle)
         if total_size == 0:
             if notify:
                 xbmcgui.Dialog().ok('Información', 'No hay archivos para limpiar.')
-            return {'removed_count': 0, 'removed_size': 0}
+            return storage.empty_result()
 
         # Mostrar resumen antes de limpiar
         summary = ('Resumen de limpieza completa:\n\n'
@@ -729,18 +946,26 @@ def clean_all(interactive=True, notify=True):
                   'Paquetes: %d archivos (%s)\n'
                   'Temporales: %d archivos (%s)\n'
                   'Streaming/IPTV: %d archivos (%s)\n\n'
-                  'TOTAL: %d archivos (%s)\n\n'
+                  'TOTAL: %d archivos (%s, %s en disco)\n\n'
+                  '%s'
                   '¿Proceder con la limpieza completa?') % (
                       cache_files, format_size(cache_size),
                       thumb_files, format_size(thumb_size), 
                       pack_files, format_size(pack_size),
                       temp_files, format_size(temp_size),
                       streaming_files, format_size(streaming_size),
-                      total_files, format_size(total_size))
+                      total_files, format_size(total_size), format_size(total_allocated),
+                      cached_note)
 
         if interactive:
             if not xbmcgui.Dialog().yesno('Limpieza Completa', summary, yeslabel='Limpiar Todo', nolabel='Cancelar'):
-                return {'removed_count': 0, 'removed_size': 0}
+                return storage.empty_result()
+        if manifest is None:
+            # Revalidar lo mostrado desde la caché antes de borrar
+            manifest = plan_clean_all()
+            totals = storage.manifest_totals(manifest).values()
+            total_size = sum(size for size, _ in totals)
+            total_files = sum(files for _, files in totals)
 
         # Mostrar progreso
         progress = None
@@ -748,83 +973,541 @@ def clean_all(interactive=True, notify=True):
             progress = xbmcgui.DialogProgress()
             progress.create('Limpieza Completa', 'Iniciando limpieza completa...')
 
-        total_removed_count = 0
-        total_removed_size = 0
-
-        def update_progress(percent, message):
-            if progress:
-                progress.update(percent, message)
-        
-        # Limpiar caché
-        update_progress(10, 'Limpiando caché...')
-        if cache_size > 0:
-            removed_count, removed_size = safe_remove_folder_contents(paths.get('cache', ''))
-            total_removed_count += removed_count
-            total_removed_size += removed_size
-        
-        # Limpiar thumbnails
-        update_progress(35, 'Limpiando thumbnails...')
-        if thumb_size > 0:
-            removed_count, removed_size = safe_remove_folder_contents(paths.get('thumbnails', ''))
-            total_removed_count += removed_count
-            total_removed_size += removed_size
-            
-            # Limpiar base de datos de Textures
-            update_progress(45, 'Limpiando base de datos de texturas...')
-            clean_textures_database()
-
-        # Limpiar residuos persistentes de IPTV/PVR
-        update_progress(60, 'Limpiando residuos de streaming/IPTV...')
-        if streaming_size > 0:
-            stream_result = clean_streaming_artifacts(interactive=False, notify=False)
-            total_removed_count += stream_result.get('removed_count', 0)
-            total_removed_size += stream_result.get('removed_size', 0)
-        
-        # Limpiar paquetes
-        update_progress(78, 'Limpiando paquetes...')
-        if pack_size > 0:
-            removed_count, removed_size = safe_remove_folder_contents(paths.get('packages', ''))
-            total_removed_count += removed_count
-            total_removed_size += removed_size
-        
-        # Limpiar temporales
-        update_progress(92, 'Limpiando archivos temporales...')
-        if temp_size > 0:
-            removed_count, removed_size = safe_remove_folder_contents(paths.get('temp', ''))
-            total_removed_count += removed_count
-            total_removed_size += removed_size
+        total_result = storage.empty_result()
+        reporter = storage.ProgressReporter(progress, total_files, total_size, throttle=throttle)
+        free_probe = storage.FreeSpaceProbe(storage.manifest_paths(manifest))
+        # Limpieza instantánea (solo interactiva): las carpetas enteras van a la
+        # papelera y el servicio las vacía después; el servicio ya borra por lotes
+        if interactive and is_instant_clean_enabled():
+            remove_category = storage.trash_manifest_category
+        else:
+            remove_category = storage.remove_manifest_category
+        
+        # Un único conjunto de archivos abiertos por Kodi para toda la limpieza
+        with storage.skip_open_files():
+            # Limpiar caché
+            reporter.set_stage('Limpiando caché...')
+            remove_category(manifest, 'cache', total_result, reporter)
+
+            # Limpiar thumbnails
+            before_thumbs = total_result['removed_count'] + total_result.get('trashed_count', 0)
+            reporter.set_stage('Limpiando thumbnails...')
+            remove_category(manifest, 'thumbnails', total_result, reporter)
+            if thumb_size > 0 or total_result['removed_count'] + total_result.get('trashed_count', 0) > before_thumbs:
+                # Limpiar base de datos de Textures (no si se canceló: quedan miniaturas en disco).
+                # El VACUUM no se puede pausar: en segundo plano esperar antes a que no haya reproducción
+                if throttle is not None and not throttle.checkpoint():
+                    total_result['cancelled'] = True
+                if not total_result['cancelled']:
+                    if progress:
+                        progress.update(reporter.percent(total_result), 'Limpiando base de datos de texturas...')
+                    clean_textures_database()
+
+            # Limpiar residuos persistentes de IPTV/PVR
+            reporter.set_stage('Limpiando residuos de streaming/IPTV...')
+            storage.remove_manifest_category(manifest, 'streaming', total_result, reporter)
+
+            # Limpiar paquetes
+            reporter.set_stage('Limpiando paquetes...')
+            remove_category(manifest, 'packages', total_result, reporter)
+
+            # Limpiar temporales
+            reporter.set_stage('Limpiando archivos temporales...')
+            remove_category(manifest, 'temp', total_result, reporter)
+        storage.forget_cached_sizes()
+
+        total_removed_count = total_result['removed_count'] + total_result.get('trashed_count', 0)
+        total_removed_size = total_result['removed_size'] + total_result.get('trashed_size', 0)
+        # Lo que el dispositivo ha ganado de verdad, según statvfs
+        total_result['free_space_gained'] = free_probe.gained()
+        freed_text = _freed_text(total_result)
 
-        update_progress(100, 'Limpieza completada')
         if progress:
-            xbmc.sleep(500)
             progress.close()
 
         # Mostrar resultado final
-        result_msg = ('Limpieza completa finalizada:\n\n'
-                     'Total archivos eliminados: %d\n'
-                     'Total espacio liberado: %s\n\n'
-                     '¡Kodi está más limpio!') % (total_removed_count, format_size(total_removed_size))
+        if total_result['cancelled']:
+            title = 'Limpieza Cancelada'
+            result_msg = ('Limpieza completa cancelada:\n\n'
+                         'Total archivos eliminados: %d de %d\n'
+                         'Total espacio liberado: %s de %s\n'
+                         'Detalle: %s\n\n'
+                         'El resto de archivos se conserva.') % (
+                             total_removed_count, total_files,
+                             format_size(total_removed_size), format_size(total_size), freed_text)
+        else:
+            title = 'Limpieza Completada'
+            result_msg = ('Limpieza completa finalizada:\n\n'
+                         'Total archivos eliminados: %d\n'
+                         'Total espacio liberado: %s\n\n'
+                         '¡Kodi está más limpio!') % (total_removed_count, freed_text)
 
         if notify:
-            xbmcgui.Dialog().ok('Limpieza Completada', result_msg)
-        log('Limpieza completa: %d archivos, %s liberados' % (total_removed_count, format_size(total_removed_size)))
-        return {'removed_count': total_removed_count, 'removed_size': total_removed_size}
+            xbmcgui.Dialog().ok(title, result_msg)
+        log('Limpieza completa%s: %d archivos, %s' % (
+            ' (cancelada)' if total_result['cancelled'] else '', total_removed_count, freed_text))
+        return total_result
     except Exception as e:
         log('Error en limpieza completa: %s' % str(e))
         if notify:
             xbmcgui.Dialog().ok('Error', 'Error en limpieza completa: %s' % str(e))
-        return {'removed_count': 0, 'removed_size': 0}
+        return storage.empty_result()
+
+# Modo objetivo: liberar N bytes con el menor daño posible. Los pasos van de
+# lo más barato de regenerar a lo más caro y cada uno borra solo lo necesario
+TARGET_STEPS = (
+    ('temp', 'Temporales'),
+    ('packages', 'Paquetes (versiones antiguas)'),
+    ('cache', 'Caché (más antigua)'),
+    ('thumbnails', 'Thumbnails (menos usadas)'),
+    ('streaming', 'Streaming/IPTV'),
+    # Último recurso: el zip más reciente de cada addon es el que Kodi usa para reinstalar
+    ('packages_latest', 'Paquetes recientes (último recurso)'),
+)
+TARGET_DEFAULT_MB = 1024
+
+
+def plan_free_target(target_bytes, paths=None):
+    """Planificación en seco del modo objetivo.
+
+    Devuelve {'target', 'available', 'planned', 'steps'}; cada paso es
+    {'label', 'name', 'available', 'planned'} y solo se planifica lo que falta
+    tras los pasos anteriores. Streaming/IPTV es todo o nada: sus bases EPG
+    se borran enteras. Los paquetes se reparten en dos pasos: las versiones
+    antiguas van pronto y los más recientes de cada addon, al final.
+    """
+    if paths is None:
+        paths = get_kodi_paths()
+    target_bytes = max(0, int(target_bytes or 0))
+    size_index = storage.load_index()
+    stats = storage.scan_roots_parallel(_clean_all_categories(paths), index=size_index)
+    storage.save_index(size_index)
+    outdated, latest, _ = packages.eviction_candidates(paths.get('packages', ''))
+    stats['packages'] = {'size': sum(item['size'] for item in outdated)}
+    stats['packages_latest'] = {'size': sum(item['size'] for item in latest)}
+    plan = {'target': target_bytes, 'available': 0, 'planned': 0, 'steps': []}
+    remaining = target_bytes
+    for label, name in TARGET_STEPS:
+        available = stats.get(label, storage.empty_stats())['size']
+        planned = min(available, remaining) if remaining > 0 else 0
+        if label == 'streaming' and planned:
+            planned = available
+        plan['steps'].append({'label': label, 'name': name, 'available': available, 'planned': planned})
+        plan['available'] += available
+        plan['planned'] += planned
+        remaining -= planned
+    return plan
+
+
+def _describe_target_plan(plan):
+    lines = []
+    for step in plan['steps']:
+        if not step['available']:
+            continue
+        if not step['planned']:
+            lines.append('%s: no hace falta (%s)' % (step['name'], format_size(step['available'])))
+        elif step['planned'] >= step['available']:
+            lines.append('%s: %s (todo)' % (step['name'], format_size(step['planned'])))
+        else:
+            lines.append('%s: %s de %s' % (step['name'], format_size(step['planned']), format_size(step['available'])))
+    return '\n'.join(lines)
+
+
+def _ask_target_bytes():
+    """Pide al usuario cuántos MB liberar. Devuelve bytes o None si cancela."""
+    value = xbmcgui.Dialog().numeric(0, 'MB a liberar', str(TARGET_DEFAULT_MB))
+    try:
+        target_mb = int(value)
+    except (TypeError, ValueError):
+        return None
+    return target_mb * 1024 * 1024 if target_mb > 0 else None
+
+
+def free_space_target(target_bytes=None, interactive=True, notify=True, throttle=None):
+    """Libera `target_bytes` borrando lo más barato de regenerar primero.
+
+    Sigue el plan de plan_free_target: temporales y versiones antiguas de los
+    paquetes, después la caché más antigua (criterio eviction_order), las
+    miniaturas menos usadas, los residuos de streaming y, solo si aún falta,
+    el paquete más reciente de cada addon. Cada paso borra únicamente lo que
+    queda para llegar al objetivo y el borrado se detiene al alcanzarlo.
+    """
+    try:
+        if target_bytes is None:
+            if not interactive:
+                return storage.empty_result()
+            target_bytes = _ask_target_bytes()
+            if not target_bytes:
+                return storage.empty_result()
+        log('Iniciando limpieza con objetivo de %s' % format_size(target_bytes))
+        paths = get_kodi_paths()
+        plan = plan_free_target(target_bytes, paths)
+        if not plan['planned']:
+            if notify:
+                xbmcgui.Dialog().ok('Información', 'No hay archivos para limpiar.')
+            return storage.empty_result()
+
+        if interactive:
+            shortfall = ''
+            if plan['available'] < plan['target']:
+                shortfall = 'Solo se pueden liberar %s de los %s pedidos.\n\n' % (
+                    format_size(plan['available']), format_size(plan['target']))
+            message = 'Para liberar %s se borrará, de menor a mayor coste:\n\n%s\n\n%s¿Continuar?' % (
+                format_size(plan['target']), _describe_target_plan(plan), shortfall)
+            if not xbmcgui.Dialog().yesno('Liberar espacio', message, yeslabel='Liberar', nolabel='Cancelar'):
+                return storage.empty_result()
+
+        progress = None
+        if interactive and notify:
+            progress = xbmcgui.DialogProgress()
+            progress.create('Liberar espacio', 'Iniciando...')
+
+        policy = get_eviction_policy()
+        folders = _clean_all_categories(paths)
+        total_result = storage.empty_result()
+        reporter = storage.ProgressReporter(progress, 0, plan['planned'], throttle=throttle)
+        free_probe = storage.FreeSpaceProbe([path for targets in folders.values() for path in targets])
+        size_index = storage.load_index()
+        per_step = []
+        touched = []
+        for step in plan['steps']:
+            needed = plan['target'] - total_result['removed_size']
+            if needed <= 0 or total_result['cancelled']:
+                break
+            if not step['planned']:
+                continue
+            label = step['label']
+            reporter.set_stage('Liberando: %s...' % step['name'].lower())
+            before_count, before_size = total_result['removed_count'], total_result['removed_size']
+            if label == 'streaming':
+                _clean_target_paths(folders[label], total_result, reporter)
+            elif label in ('packages', 'packages_latest'):
+                packages.evict_to_quota(keep_latest=label == 'packages', folder_path=folders['packages'][0],
+                                        result=total_result, progress=reporter, needed_bytes=needed)
+            else:
+                folder = folders[label][0]
+                # Cuota que deja la carpeta `needed` bytes más pequeña (1 byte = vaciarla: 0 desactiva la cuota)
+                quota = max(1, step['available'] - needed)
+                _evict_category(label, folder, quota, 0, policy['order'], total_result, reporter, size_index)
+            touched.append('packages' if label == 'packages_latest' else label)
+            per_step.append('%s: %d archivos (%s)' % (
+                step['name'], total_result['removed_count'] - before_count,
+                format_size(total_result['removed_size'] - before_size)))
+        storage.save_index(size_index)
+        storage.forget_cached_sizes(touched)
+        total_result['free_space_gained'] = free_probe.gained()
+        freed_text = storage.describe_freed(total_result, total_result['free_space_gained'])
+
+        if progress:
+            progress.close()
+
+        reached = total_result['removed_size'] >= plan['target']
+        if notify:
+            title, first_line, closing = _cleanup_outcome(total_result, 'Objetivo %s:' % (
+                'alcanzado' if reached else 'no alcanzado'), 'Liberación de espacio cancelada:')
+            xbmcgui.Dialog().ok(title, '%s\n\n%s\n\nTotal: %d archivos, %s\n\n%s' % (
+                first_line, '\n'.join(per_step), total_result['removed_count'], freed_text, closing))
+        log('Limpieza con objetivo de %s%s: %d archivos, %s%s' % (
+            format_size(plan['target']), '' if reached else ' (no alcanzado)', total_result['removed_count'], freed_text,
+            '; %d paquetes recientes borrados como último recurso' % total_result['packages_latest']
+            if total_result.get('packages_latest') else ''))
+        return total_result
+    except Exception as e:
+        log('Error en limpieza con objetivo: %s' % str(e))
+        if notify:
+            xbmcgui.Dialog().ok('Error', 'Error liberando espacio: %s' % str(e))
+        return storage.empty_result()
+
+
+EVICTION_CATEGORIES = (
+    ('cache', 'Caché', 'eviction_quota_cache_mb'),
+    ('thumbnails', 'Thumbnails', 'eviction_quota_thumbnails_mb'),
+    ('packages', 'Paquetes', 'eviction_quota_packages_mb'),
+    ('temp', 'Temporales', 'eviction_quota_temp_mb'),
+)
+
+
+def get_eviction_policy():
+    """Lee de los ajustes las cuotas por categoría, la antigüedad máxima y el criterio de orden."""
+    policy = {'order': 'atime', 'max_age_days': 0, 'quotas': {}}
+    try:
+        policy['order'] = storage.EVICTION_ORDERS[addon.getSettingInt('eviction_order')]
+    except Exception:
+        pass
+    try:
+        policy['max_age_days'] = max(0, addon.getSettingInt('eviction_max_age_days'))
+    except Exception:
+        pass
+    for category, _, setting_id in EVICTION_CATEGORIES:
+        try:
+            policy['quotas'][category] = max(0, addon.getSettingInt(setting_id)) * 1024 * 1024
+        except Exception:
+            policy['quotas'][category] = 0
+    return policy
+
+
+def _evict_category(category, folder, quota, max_age_seconds, order, result, progress, index):
+    """Expulsión por cuota de una categoría con el criterio que le corresponde.
+
+    Las miniaturas van por uso real (Textures DB) y los paquetes respetan el
+    más reciente de cada addon; el resto, por `order` con storage.evict_folder.
+    """
+    if category == 'thumbnails' and textures.find_textures_db():
+        # Miniaturas: decidir por uso real (Textures DB) y borrar archivo y filas juntos; sin
+        # cuota el objetivo es el tamaño actual y solo cuenta la antigüedad
+        if not quota:
+            quota = storage.scan_tree_cached(folder, index)['size']
+        return textures.evict_by_usage(quota, folder, result=result, progress=progress,
+                                       max_age_seconds=max_age_seconds, index=index)
+    if category == 'packages':
+        return packages.evict_to_quota(quota, max_age_seconds, folder_path=folder, result=result, progress=progress)
+    return storage.evict_folder(folder, quota, max_age_seconds, order, result, progress, index=index)
+
+
+def evict_caches(interactive=True, notify=True, throttle=None):
+    """Limpia por cuota y antigüedad: borra los archivos menos usados de cada categoría
+    hasta dejarla bajo su cuota, en vez de vaciarla entera."""
+    try:
+        log('Iniciando limpieza por cuota/antigüedad')
+        paths = get_kodi_paths()
+        policy = get_eviction_policy()
+        summary_stats = get_all_categories_info(paths)
+        max_age_seconds = policy['max_age_days'] * 86400
+
+        lines = []
+        planned = []
+        for category, label, _ in EVICTION_CATEGORIES:
+            quota = policy['quotas'].get(category, 0)
+            size, files = summary_stats.get(category, (0, 0))
+            if size == 0 or (not quota and not max_age_seconds):
+                continue
+            planned.append((category, label, quota))
+            lines.append('%s: %s en %d archivos -> cuota %s' % (
+                label, format_size(size), files, format_size(quota) if quota else 'sin límite'))
+
+        if not planned:
+            if notify:
+                xbmcgui.Dialog().ok('Información', 'No hay cuotas ni antigüedad máxima configuradas, o las categorías están vacías.\n\nAjusta los límites en la configuración del addon.')
+            return storage.empty_result()
+
+        if interactive:
+            message = ('Se borrarán primero los archivos %s:\n\n%s\n%s\n\n¿Continuar?') % (
+                'con acceso más antiguo' if policy['order'] == 'atime' else 'modificados hace más tiempo',
+                '\n'.join(lines),
+                'Antigüedad máxima: %d días' % policy['max_age_days'] if policy['max_age_days'] else 'Sin antigüedad máxima')
+            if not xbmcgui.Dialog().yesno('Limpieza por cuota/antigüedad', message, yeslabel='Limpiar', nolabel='Cancelar'):
+                return storage.empty_result()
+
+        progress = None
+        if interactive and notify:
+            progress = xbmcgui.DialogProgress()
+            progress.create('Limpieza por cuota/antigüedad', 'Analizando archivos...')
+
+        total_result = storage.empty_result()
+        excess_total = sum(max(0, summary_stats[c][0] - q) for c, _, q in planned if q)
+        reporter = storage.ProgressReporter(progress, 0, excess_total, throttle=throttle)
+        size_index = storage.load_index()
+        per_category = []
+        for category, label, quota in planned:
+            reporter.set_stage('Limpiando %s...' % label.lower())
+            before_count, before_size = total_result['removed_count'], total_result['removed_size']
+            _evict_category(category, paths.get(category, ''), quota, max_age_seconds, policy['order'],
+                           total_result, reporter, size_index)
+            per_category.append('%s: %d archivos (%s)' % (
+                label, total_result['removed_count'] - before_count,
+                format_size(total_result['removed_size'] - before_size)))
+            if total_result['cancelled']:
+                break
+        storage.save_index(size_index)
+        storage.forget_cached_sizes([category for category, _, _ in planned])
+
+        if progress:
+            progress.close()
+
+        if notify:
+            title, first_line, closing = _cleanup_outcome(total_result, 'Limpieza por cuota finalizada:', 'Limpieza por cuota cancelada:')
+            xbmcgui.Dialog().ok(title, '%s\n\n%s\n\nTotal: %d archivos, %s liberados\n\n%s' % (
+                first_line, '\n'.join(per_category), total_result['removed_count'],
+                format_size(total_result['removed_size']), closing))
+        log('Limpieza por cuota: %d archivos, %s liberados' % (total_result['removed_count'], format_size(total_result['removed_size'])))
+        return total_result
+    except Exception as e:
+        log('Error en limpieza por cuota: %s' % str(e))
+        if notify:
+            xbmcgui.Dialog().ok('Error', 'Error en limpieza por cuota: %s' % str(e))
+        return storage.empty_result()
+
+# Guardián de espacio libre: si el dispositivo de userdata, temp o cachepath
+# baja de su suelo, se expulsan archivos por orden de coste de regeneración
+# hasta volver a la marca alta
+FREE_SPACE_FLOOR_MB = 512
+FREE_SPACE_HIGH_WATER_MB = 1024
+# Miniaturas que el guardián puede expulsar: sin usar en eviction_max_age_days
+# o, si no hay antigüedad máxima configurada, en estos días
+FREE_SPACE_STALE_THUMBNAIL_DAYS = 30
+FREE_SPACE_GUARD_ORDER = (
+    ('temp', 'Temporales'),
+    ('cachepath', 'Caché USB'),
+    ('cache', 'Caché'),
+    ('thumbnails', 'Thumbnails'),
+)
+
+
+def get_free_space_thresholds():
+    """Devuelve (suelo, marca alta) en bytes; la marca alta nunca queda por debajo del suelo.
+
+    Con el guardián desactivado el suelo es 0.
+    """
+    try:
+        if not addon.getSettingBool('free_space_guard'):
+            return 0, 0
+    except Exception:
+        pass
+    try:
+        floor_mb = addon.getSettingInt('free_space_floor_mb')
+    except Exception:
+        floor_mb = FREE_SPACE_FLOOR_MB
+    try:
+        high_mb = addon.getSettingInt('free_space_high_water_mb')
+    except Exception:
+        high_mb = FREE_SPACE_HIGH_WATER_MB
+    floor_mb = max(0, floor_mb)
+    return floor_mb * 1024 * 1024, max(floor_mb, high_mb) * 1024 * 1024
+
+
+def _free_space_devices(paths=None):
+    """Agrupa por dispositivo las carpetas vigiladas: {st_dev: (ruta de medida, [(categoría, etiqueta, ruta)])}."""
+    paths = paths or get_kodi_paths()
+    folders = dict((category, paths.get(category, '')) for category, _ in FREE_SPACE_GUARD_ORDER)
+    folders['cachepath'] = buffering_module.read_cachepath_from_config(paths.get('advancedsettings', '')) or ''
+    devices = {}
+    # userdata se vigila aunque no tenga nada expulsable: sus carpetas comparten dispositivo
+    userdata = _translate('special://userdata/')
+    device = storage._device_of(userdata)
+    if device is not None:
+        devices[device] = (userdata, [])
+    for category, label in FREE_SPACE_GUARD_ORDER:
+        folder = folders.get(category)
+        if not folder or not os.path.isdir(folder):
+            continue
+        device = storage._device_of(folder)
+        if device is None:
+            continue
+        devices.setdefault(device, (folder, []))[1].append((category, label, folder))
+    return devices
+
+
+def find_low_space_devices(paths=None):
+    """Comprobación barata (un statvfs por dispositivo): lista de (ruta, libre) por debajo del suelo."""
+    floor, _ = get_free_space_thresholds()
+    low = []
+    if not floor:
+        return low
+    for probe_path, _ in _free_space_devices(paths).values():
+        free = storage.free_space(probe_path)
+        if free is not None and free < floor:
+            low.append((probe_path, free))
+    return low
+
+
+def _guard_thumbnails(folder, quota, policy, result, progress, index):
+    """Miniaturas en el guardián: primero las huérfanas y después solo las obsoletas.
+
+    Las que Kodi ha usado en el plazo de antigüedad no se tocan aunque no se
+    llegue a la marca alta: vaciarlas solo haría que Kodi las descargue otra vez.
+    """
+    stale_seconds = (policy['max_age_days'] or FREE_SPACE_STALE_THUMBNAIL_DAYS) * 86400
+    if textures.find_textures_db():
+        textures.clean_orphans(folder, result=result, progress=progress)
+        if result['cancelled']:
+            return result
+        return textures.evict_by_usage(quota, folder, result=result, progress=progress,
+                                       max_age_seconds=stale_seconds, index=index, stale_only=True)
+    # Sin Textures DB no hay uso real: se expulsan las no accedidas en el plazo
+    return storage.evict_folder(folder, 0, stale_seconds, policy['order'], result, progress, index=index)
+
+
+def guard_free_space(throttle=None):
+    """Expulsa archivos en los dispositivos con poco espacio libre hasta recuperar la marca alta.
+
+    Por dispositivo, y solo si su espacio libre está por debajo del suelo, se
+    recorren las categorías en FREE_SPACE_GUARD_ORDER: temporales, caché USB y
+    caché por antigüedad (criterio eviction_order) y después las miniaturas:
+    las huérfanas y las no usadas en el plazo de antigüedad. Tras cada categoría se vuelve a medir con statvfs y se para
+    en cuanto se alcanza la marca alta. Cada intervención queda en el log con
+    lo recuperado.
+    """
+    total_result = storage.empty_result()
+    try:
+        floor, high_water = get_free_space_thresholds()
+        if not floor:
+            return total_result
+        paths = get_kodi_paths()
+        policy = get_eviction_policy()
+        size_index = storage.load_index()
+        touched = set()
+        for probe_path, categories in _free_space_devices(paths).values():
+            free_before = storage.free_space(probe_path)
+            if free_before is None or free_before >= floor:
+                continue
+            log('Espacio libre bajo en %s: %s (suelo %s, objetivo %s)' % (
+                probe_path, format_size(free_before), format_size(floor), format_size(high_water)))
+            if not categories:
+                log('Nada que expulsar en el dispositivo de %s' % probe_path)
+                continue
+            device_result = storage.empty_result()
+            probe = storage.FreeSpaceProbe([probe_path])
+            for category, label, folder in categories:
+                free = storage.free_space(probe_path)
+                needed = high_water - free if free is not None else 0
+                if needed <= 0:
+                    break
+                size = storage.scan_tree_cached(folder, index=size_index)['size']
+                if size <= 0:
+                    continue
+                # Cuota que deja la carpeta `needed` bytes más pequeña (1 byte = vaciarla: 0 desactiva la cuota)
+                quota = max(1, size - needed)
+                before_count, before_size = device_result['removed_count'], device_result['removed_size']
+                reporter = storage.ProgressReporter(None, 0, min(size, needed), throttle=throttle)
+                if category == 'thumbnails':
+                    _guard_thumbnails(folder, quota, policy, device_result, reporter, size_index)
+                else:
+                    _evict_category(category, folder, quota, 0, policy['order'], device_result, reporter, size_index)
+                touched.add(category)
+                log('Guardián de espacio: %s, %d archivos (%s)' % (
+                    label, device_result['removed_count'] - before_count,
+                    format_size(device_result['removed_size'] - before_size)))
+                if device_result['cancelled']:
+                    break
+            free_after = storage.free_space(probe_path)
+            device_result['free_space_gained'] = probe.gained()
+            log('Guardián de espacio en %s: %s -> %s libres; recuperado %s%s' % (
+                probe_path, format_size(free_before), format_size(free_after or 0),
+                storage.describe_freed(device_result, device_result['free_space_gained']),
+                '' if free_after is not None and free_after >= high_water else ' (sin alcanzar el objetivo)'))
+            storage.merge_result(total_result, device_result)
+            if total_result['cancelled']:
+                break
+        storage.save_index(size_index)
+        if touched:
+            storage.forget_cached_sizes(sorted(touched))
+    except Exception as e:
+        log('Error en el guardián de espacio libre: %s' % str(e))
+    return total_result
+
 
 def schedule_clean_on_start():
     """Programa limpieza al inicio: una vez o en cada inicio; también permite desactivar."""
     try:
         log('Preparando programación de limpieza al iniciar')
-        # Obtener información actual
-        cache_size, cache_files = get_cache_info()
-        thumb_size, thumb_files = get_thumbnails_info()
-        pack_size, pack_files = get_packages_info()
-        temp_size, temp_files = get_temp_info()
-        streaming_size, streaming_files = get_streaming_artifacts_info()
+        # Planificación en seco: el servicio borrará a partir de este manifiesto
+        manifest = plan_clean_all()
+        summary_stats = storage.manifest_totals(manifest)
+        cache_size, cache_files = summary_stats['cache']
+        thumb_size, thumb_files = summary_stats['thumbnails']
+        pack_size, pack_files = summary_stats['packages']
+        temp_size, temp_files = summary_stats['temp']
+        streaming_size, streaming_files = summary_stats['streaming']
 
         total_size = cache_size + thumb_size + pack_size + temp_size + streaming_size
         total_files = cache_files + thumb_files + pack_files + temp_files + streaming_files
@@ -841,6 +1524,7 @@ def schedule_clean_on_start():
                     os.remove(os.path.join(addon_data_dir, 'schedule_clean.json'))
                 except Exception:
                     pass
+                storage.discard_manifest()
                 dialog.ok('Limpieza al inicio', 'Limpieza programada desactivada.')
             return
 
@@ -876,14 +1560,31 @@ def schedule_clean_on_start():
                 os.remove(os.path.join(addon_data_dir, 'schedule_clean.json'))
             except Exception:
                 pass
+            storage.discard_manifest()
             dialog.ok('Limpieza al inicio', 'Limpieza programada desactivada.')
             return
 
+        # Vaciar todo o solo liberar un objetivo de espacio (modo objetivo)
+        mode = dialog.select('Qué limpiar al iniciar', [
+            'Limpieza completa',
+            'Solo liberar un objetivo de espacio'
+        ])
+        if mode == -1:
+            log('Usuario canceló programación')
+            return
+        target_bytes = 0
+        if mode == 1:
+            target_bytes = _ask_target_bytes()
+            if not target_bytes:
+                log('Usuario canceló programación')
+                return
+
         # Guardar marca en addon_data_dir
         schedule_path = os.path.join(addon_data_dir, 'schedule_clean.json')
         data = {
             'scheduled': True,
             'repeat': (choice == 1),
+            'target_bytes': target_bytes,
             'created': __import__('datetime').datetime.now().isoformat(),
             'planned': {
                 'cache': {'files': cache_files, 'size': cache_size},
@@ -899,8 +1600,17 @@ def schedule_clean_on_start():
             os.makedirs(addon_data_dir, exist_ok=True)
             with open(schedule_path, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
-            log('Limpieza programada (%s). Archivo: %s' % ('persistente' if data['repeat'] else 'una vez', schedule_path))
-            dialog.ok('Limpieza programada', 'Se ejecutará %s.' % ('en cada inicio' if data['repeat'] else 'en el próximo inicio'))
+            if target_bytes:
+                # El modo objetivo planifica al ejecutarse: el manifiesto no aplica
+                storage.discard_manifest()
+            else:
+                storage.save_manifest(manifest)
+            log('Limpieza programada (%s%s). Archivo: %s' % (
+                'persistente' if data['repeat'] else 'una vez',
+                ', objetivo %s' % format_size(target_bytes) if target_bytes else '', schedule_path))
+            dialog.ok('Limpieza programada', 'Se %s %s.' % (
+                'liberarán %s' % format_size(target_bytes) if target_bytes else 'ejecutará',
+                'en cada inicio' if data['repeat'] else 'en el próximo inicio'))
         except Exception as e:
             log('No se pudo programar la limpieza: %s' % str(e))
             dialog.ok('Error', 'No se pudo programar la limpieza: %s' % str(e))
@@ -1241,9 +1951,9 @@ def toggle_usb_autoclean():
     set_usb_autoclean_enabled(not cur)
     xbmcgui.Dialog().notification(addon_name, 'Auto-limpiar cache USB: %s' % ('ON' if not cur else 'OFF'), time=3000)
 
-def clean_usb_cachepath(config_path, silent=False):
+def clean_usb_cachepath(config_path, silent=False, throttle=None):
     """Proxy a buffering.py para mantener una única implementación."""
-    return buffering_module.clean_usb_cachepath(config_path, silent=silent)
+    return buffering_module.clean_usb_cachepath(config_path, silent=silent, throttle=throttle)
 
 def optimize_buffering_auto(config_path):
     """Proxy a buffering.py para mantener una única implementación."""
@@ -1275,15 +1985,22 @@ def restore_advancedsettings_interactive(config_path):
     """Proxy a buffering.py para mantener una única implementación."""
     return buffering_module.restore_advancedsettings_interactive(config_path)
 
-def vacuum_databases():
-    """Compacta bases de datos de Kodi (Textures, Addons, Videos)"""
+def vacuum_databases(interactive=True, throttle=None):
+    """Compacta bases de datos de Kodi (Textures, Addons, Videos).
+
+    Sin `interactive` no hay diálogos (mantenimiento en segundo plano); con
+    `throttle` (storage.TimeSlicer) se comprueba antes de cada VACUUM si hay
+    que esperar o parar. Devuelve el número de bases compactadas.
+    """
+    compacted = 0
     try:
         paths = get_kodi_paths()
         # directorio Database suele estar en special://database/
         db_dir = _translate('special://database/')
         if not os.path.exists(db_dir):
-            xbmcgui.Dialog().ok('Información', 'No se encontró el directorio de bases de datos.')
-            return
+            if interactive:
+                xbmcgui.Dialog().ok('Información', 'No se encontró el directorio de bases de datos.')
+            return compacted
 
         # Localizar DBs comunes
         targets = []
@@ -1292,32 +2009,43 @@ def vacuum_databases():
                 targets.append(os.path.join(db_dir, name))
 
         if not targets:
-            xbmcgui.Dialog().ok('Información', 'No se encontraron bases de datos para compactar.')
-            return
+            if interactive:
+                xbmcgui.Dialog().ok('Información', 'No se encontraron bases de datos para compactar.')
+            return compacted
 
         # Confirmación
-        msg = 'Se compactarán las siguientes bases de datos:\n\n' + '\n'.join('- ' + os.path.basename(t) for t in targets)
-        if not xbmcgui.Dialog().yesno('Compactar Bases de Datos', msg, yeslabel='Compactar', nolabel='Cancelar'):
-            return
-
-        progress = xbmcgui.DialogProgress()
-        progress.create('Compactando bases de datos', 'Iniciando...')
+        progress = None
+        if interactive:
+            msg = 'Se compactarán las siguientes bases de datos:\n\n' + '\n'.join('- ' + os.path.basename(t) for t in targets)
+            if not xbmcgui.Dialog().yesno('Compactar Bases de Datos', msg, yeslabel='Compactar', nolabel='Cancelar'):
+                return compacted
+            progress = xbmcgui.DialogProgress()
+            progress.create('Compactando bases de datos', 'Iniciando...')
         for i, db_path in enumerate(targets, 1):
-            percent = int((i / len(targets)) * 100) if len(targets) else 0
-            progress.update(percent, 'Compactando %s' % os.path.basename(db_path))
+            # Un VACUUM no se puede interrumpir: decidir antes de empezar cada uno
+            if throttle is not None and not throttle.checkpoint():
+                break
+            if progress:
+                percent = int((i / len(targets)) * 100) if len(targets) else 0
+                progress.update(percent, 'Compactando %s' % os.path.basename(db_path))
             try:
                 # Asegurar que no está en uso: pequeño sleep para dar tiempo a addons
                 time.sleep(0.2)
                 conn = sqlite3.connect(db_path)
                 conn.execute('VACUUM')
                 conn.close()
+                compacted += 1
             except Exception as e:
                 log('Error compactando %s: %s' % (db_path, str(e)))
-        progress.close()
-        xbmcgui.Dialog().ok('Completado', 'Compactación finalizada.')
+        if progress:
+            progress.close()
+            xbmcgui.Dialog().ok('Completado', 'Compactación finalizada.')
+        log('Bases de datos compactadas: %d de %d' % (compacted, len(targets)))
     except Exception as e:
         log('Error compactando bases de datos: %s' % str(e))
-        xbmcgui.Dialog().ok('Error', 'Error al compactar: %s' % str(e))
+        if interactive:
+            xbmcgui.Dialog().ok('Error', 'Error al compactar: %s' % str(e))
+    return compacted
 
 def _read_cachepath_from_config(config_path):
     try:
@@ -1428,19 +2156,14 @@ def view_special_temp_cache():
         cache_dir = os.path.join(temp_root, 'cache')
         target = cache_dir if os.path.exists(cache_dir) else temp_root
 
-        total_size = get_folder_size(target)
-        total_files = count_files_in_folder(target)
-
-        # Recopilar últimos archivos modificados
+        # Tamaño, número de archivos y últimos modificados en una sola pasada
         recent = []
-        for dirpath, dirnames, filenames in os.walk(target):
-            for fn in filenames:
-                fp = os.path.join(dirpath, fn)
-                try:
-                    st = os.stat(fp)
-                except Exception:
-                    continue
-                recent.append((st.st_mtime, os.path.relpath(fp, target), st.st_size))
+        stats = storage.scan_tree(
+            target,
+            on_file=lambda entry, st: recent.append((st.st_mtime, os.path.relpath(entry.path, target), st.st_size))
+        )
+        total_size = stats['size']
+        total_files = stats['files']
         recent.sort(reverse=True)
         lines = []
         lines.append('RUTA DE CACHÉ EN USO (special://temp)')
@@ -2128,7 +2851,8 @@ def restore_kodi_defaults():
                 paths = get_kodi_paths()
                 cache_path = paths.get('cache', '')
                 if cache_path and os.path.exists(cache_path):
-                    removed_count, removed_size = safe_remove_folder_contents(cache_path)
+                    result = safe_remove_folder_contents(cache_path)
+                    removed_count, removed_size = result['removed_count'], result['removed_size']
                     restored_items.append('✓ Caché limpiada: %d archivos (%s)' % (removed_count, format_size(removed_size)))
             except Exception as e:
                 errors.append('Caché: %s' % str(e))
@@ -2139,7 +2863,8 @@ def restore_kodi_defaults():
                 paths = get_kodi_paths()
                 thumbnails_path = paths.get('thumbnails', '')
                 if thumbnails_path and os.path.exists(thumbnails_path):
-                    removed_count, removed_size = safe_remove_folder_contents(thumbnails_path)
+                    result = safe_remove_folder_contents(thumbnails_path)
+                    removed_count, removed_size = result['removed_count'], result['removed_size']
                     clean_textures_database()  # Ya se hizo antes, pero asegurar
                     restored_items.append('✓ Thumbnails limpiados: %d archivos (%s)' % (removed_count, format_size(removed_size)))
             except Exception as e:
@@ -2151,7 +2876,8 @@ def restore_kodi_defaults():
                 paths = get_kodi_paths()
                 packages_path = paths.get('packages', '')
                 if packages_path and os.path.exists(packages_path):
-                    removed_count, removed_size = safe_remove_folder_contents(packages_path)
+                    result = safe_remove_folder_contents(packages_path)
+                    removed_count, removed_size = result['removed_count'], result['removed_size']
                     restored_items.append('✓ Paquetes limpiados: %d archivos (%s)' % (removed_count, format_size(removed_size)))
             except Exception as e:
                 errors.append('Paquetes: %s' % str(e))
@@ -2162,7 +2888,8 @@ def restore_kodi_defaults():
                 paths = get_kodi_paths()
                 temp_path = paths.get('temp', '')
                 if temp_path and os.path.exists(temp_path):
-                    removed_count, removed_size = safe_remove_folder_contents(temp_path)
+                    result = safe_remove_folder_contents(temp_path)
+                    removed_count, removed_size = result['removed_count'], result['removed_size']
                     restored_items.append('✓ Temporales limpiados: %d archivos (%s)' % (removed_count, format_size(removed_size)))
             except Exception as e:
                 errors.append('Temporales: %s' % str(e))
@@ -5187,6 +5914,27 @@ def check_addon_updates():
         log('Error actualizando addon: %s' % str(e))
         xbmcgui.Dialog().ok('Actualizaciones', 'Error durante la actualizacion: %s' % str(e))
 
+# Opciones del menú principal que muestran el tamaño pre-escaneado por el servicio
+MENU_CACHED_SIZES = ((0, 'cache'), (1, 'thumbnails'), (2, 'packages'), (3, 'temp'), (4, 'streaming'))
+MENU_CLEAN_ALL_INDEX = 5
+
+
+def _menu_with_cached_sizes(opciones, heading):
+    """Añade a las opciones de limpieza las cifras de la caché de tamaños, sin escanear."""
+    cached = storage.load_size_cache()
+    if cached is None or not cached['categories']:
+        return opciones, heading
+    opciones = list(opciones)
+    categories = cached['categories']
+    for index, label in MENU_CACHED_SIZES:
+        if label in categories:
+            opciones[index] = '%s (%s)' % (opciones[index], format_size(categories[label].get('size', 0)))
+    if all(label in categories for label in CLEAN_ALL_LABELS):
+        opciones[MENU_CLEAN_ALL_INDEX] = '%s (%s)' % (
+            opciones[MENU_CLEAN_ALL_INDEX], format_size(sum(categories[label].get('size', 0) for label in CLEAN_ALL_LABELS)))
+    return opciones, '%s - tamaños %s' % (heading, storage.format_age(time.time() - cached.get('created', 0)))
+
+
 def main():
     """Función principal del addon con bucle continuo"""
     log('Iniciando Aspirando Kodi v%s' % addon_version)
@@ -5203,6 +5951,8 @@ def main():
                 'Limpiar Temporales',
                 'Limpieza Streaming/IPTV',
                 'Limpieza Completa',
+                'Limpieza por cuota/antigüedad',
+                'Liberar espacio (objetivo)',
                 'Compactar Bases de Datos',
                 'Programar limpieza al iniciar',
                 'Gestión de Buffering',
@@ -5214,9 +5964,10 @@ def main():
                 'Salir'
             ]
             
-            seleccion = dialog.select('Aspirando Kodi - Menú Principal', opciones)
+            opciones_menu, titulo = _menu_with_cached_sizes(opciones, 'Aspirando Kodi - Menú Principal')
+            seleccion = dialog.select(titulo, opciones_menu)
             
-            if seleccion == -1 or seleccion == 14:  # Usuario canceló o seleccionó Salir
+            if seleccion == -1 or seleccion == 16:  # Usuario canceló o seleccionó Salir
                 log('Usuario salió del addon')
                 break
             
@@ -5244,38 +5995,46 @@ def main():
                 log('Usuario seleccionó: Limpieza Completa')
                 clean_all()
             
-            elif seleccion == 6:  # Compactar Bases de Datos
+            elif seleccion == 6:  # Limpieza por cuota/antigüedad
+                log('Usuario seleccionó: Limpieza por cuota/antigüedad')
+                evict_caches()
+
+            elif seleccion == 7:  # Liberar espacio (objetivo)
+                log('Usuario seleccionó: Liberar espacio (objetivo)')
+                free_space_target()
+
+            elif seleccion == 8:  # Compactar Bases de Datos
                 log('Usuario seleccionó: Compactar Bases de Datos')
                 vacuum_databases()
             
-            elif seleccion == 7:  # Programar limpieza al iniciar
+            elif seleccion == 9:  # Programar limpieza al iniciar
                 log('Usuario seleccionó: Programar limpieza al iniciar')
                 schedule_clean_on_start()
                 
-            elif seleccion == 8:  # Gestión de Buffering
+            elif seleccion == 10:  # Gestión de Buffering
                 log('Usuario seleccionó: Gestión de Buffering')
                 manage_buffering()
                 
-            elif seleccion == 9:  # Restaurar valores predeterminados
+            elif seleccion == 11:  # Restaurar valores predeterminados
                 log('Usuario seleccionó: Restaurar valores predeterminados')
                 restore_kodi_defaults()
                 
-            elif seleccion == 10:  # Resetear aviso PVR Android
+            elif seleccion == 12:  # Resetear aviso PVR Android
                 log('Usuario seleccionó: Resetear aviso PVR Android')
                 reset_android_pvr_warning()
                 
-            elif seleccion == 11:  # Buscar actualizaciones
+            elif seleccion == 13:  # Buscar actualizaciones
                 log('Usuario seleccionó: Buscar actualizaciones')
                 check_addon_updates()
 
-            elif seleccion == 12:  # Reiniciar Kodi
+            elif seleccion == 14:  # Reiniciar Kodi
                 log('Usuario seleccionó: Reiniciar Kodi')
                 restart_kodi()
                 # Si el usuario confirma reiniciar, salimos del bucle
                 # porque Kodi se va a reiniciar
                 break
                 
-            elif seleccion == 13:  # Acerca de
+            elif seleccion == 15:  # Acerca de
                 log('Usuario seleccionó: Acerca de')
                 show_about()
                 
@@ -0,0 +1,348 @@
+"""Control de los sustitutos de Kodi (xbmc, xbmcgui, xbmcvfs, xbmcaddon).
+
+Los módulos xbmc* de esta carpeta leen su estado de aquí, de modo que un
+benchmark, un perfilado o una prueba puede preparar el entorno antes de
+importar el addon y guionizar lo que haría el usuario:
+
+    import kodistub
+    kodistub.configure(root='/tmp/kodi', settings={'orphan_check_on_start': 'true'})
+    kodistub.script_dialog('yesno', True, False)
+    kodistub.script_dialog('select', 1)
+    kodistub.register_jsonrpc('Settings.GetSettingValue', {'value': 20})
+    kodistub.abort_after_waits(3)
+
+    import default
+    default.clean_all()
+    print(kodistub.dialog_calls())
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+_lock = threading.RLock()
+_state = {}
+_monitors = weakref.WeakSet()
+_players = weakref.WeakSet()
+
+# Respuesta de cada diálogo cuando no hay nada guionizado
+DEFAULT_DIALOG_ANSWERS = {
+    'ok': True,
+    'yesno': True,
+    'yesnocustom': 1,
+    'select': 0,
+    'contextmenu': 0,
+    'multiselect': None,
+    'input': None,
+    'numeric': None,
+    'browse': None,
+    'browseSingle': None,
+    'browseMultiple': None,
+    'textviewer': None,
+    'notification': None,
+}
+
+
+def reset():
+    """Devuelve todo el estado a sus valores iniciales (salvo la raíz de special://)."""
+    with _lock:
+        root = _state.get('root')
+        _state.clear()
+        _state.update({
+            'root': root,
+            'settings': {},
+            'conditions': {},
+            'info_labels': {},
+            'dialog_answers': {},
+            'dialog_calls': [],
+            'progress_cancel_after': None,
+            'progress_checks': 0,
+            'jsonrpc_handlers': {},
+            'jsonrpc_calls': [],
+            'builtins': [],
+            'abort': False,
+            'abort_after_waits': None,
+            'time_scale': 1.0,
+            'idle_time': 0,
+            'log_level': int(os.environ.get('KODI_STUB_LOG', 5)),
+            'log': [],
+            'playing': None,
+            'paused': False,
+            'caching': False,
+            'play_time': 0.0,
+            'total_time': 0.0,
+        })
+
+
+def configure(root=None, settings=None, conditions=None, info_labels=None, time_scale=None,
+              idle_time=None, log_level=None):
+    """Ajusta el entorno simulado.
+
+    `root` es la carpeta que hace de special://home; `settings` sobrescribe
+    los valores por defecto de resources/settings.xml; `conditions` responde
+    a getCondVisibility (sin distinguir mayúsculas); `time_scale` multiplica
+    las esperas de sleep/waitForAbort (0 = no esperar).
+    """
+    with _lock:
+        if root is not None:
+            _state['root'] = root
+            os.environ['KODI_STUB_ROOT'] = root
+        if settings:
+            _state['settings'].update(dict((key, _setting_text(value)) for key, value in settings.items()))
+        if conditions:
+            _state['conditions'].update(dict((key.lower(), bool(value)) for key, value in conditions.items()))
+        if info_labels:
+            _state['info_labels'].update(dict((key.lower(), str(value)) for key, value in info_labels.items()))
+        if time_scale is not None:
+            _state['time_scale'] = max(0.0, float(time_scale))
+        if idle_time is not None:
+            _state['idle_time'] = int(idle_time)
+        if log_level is not None:
+            _state['log_level'] = int(log_level)
+
+
+def get(key, default=None):
+    with _lock:
+        return _state.get(key, default)
+
+
+def get_root():
+    with _lock:
+        root = _state.get('root') or os.environ.get('KODI_STUB_ROOT')
+        if not root:
+            root = os.path.join(tempfile.gettempdir(), 'kodi_stub_home')
+        _state['root'] = root
+        os.environ['KODI_STUB_ROOT'] = root
+        return root
+
+
+def _setting_text(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def get_setting(setting_id, default=''):
+    with _lock:
+        return _state['settings'].get(setting_id, default)
+
+
+def set_setting(setting_id, value):
+    with _lock:
+        _state['settings'][setting_id] = _setting_text(value)
+
+
+# Tiempo simulado
+def sleep_seconds(seconds):
+    scaled = seconds * _state['time_scale']
+    if scaled > 0:
+        time.sleep(scaled)
+
+
+def set_idle_time(seconds):
+    configure(idle_time=seconds)
+
+
+# Registro
+def record_log(message, level):
+    with _lock:
+        _state['log'].append((level, message))
+        return level >= _state['log_level']
+
+
+def log_lines(min_level=0):
+    with _lock:
+        return [message for level, message in _state['log'] if level >= min_level]
+
+
+# Diálogos guionizados
+def script_dialog(method, *answers):
+    """Encola respuestas para Dialog.<method>() (se consumen en orden)."""
+    with _lock:
+        _state['dialog_answers'].setdefault(method, []).extend(answers)
+
+
+def next_dialog_answer(method, args, kwargs, fallback=None):
+    with _lock:
+        _state['dialog_calls'].append((method, args, kwargs))
+        queue = _state['dialog_answers'].get(method)
+        if queue:
+            return queue.pop(0)
+        answer = DEFAULT_DIALOG_ANSWERS.get(method)
+        return fallback if answer is None else answer
+
+
+def dialog_calls(method=None):
+    with _lock:
+        return [call for call in _state['dialog_calls'] if method is None or call[0] == method]
+
+
+def cancel_progress_after(checks):
+    """DialogProgress.iscanceled() devolverá True a partir de la comprobación número `checks`."""
+    with _lock:
+        _state['progress_cancel_after'] = checks
+        _state['progress_checks'] = 0
+
+
+def progress_canceled():
+    with _lock:
+        _state['progress_checks'] += 1
+        limit = _state['progress_cancel_after']
+        return limit is not None and _state['progress_checks'] >= limit
+
+
+# JSON-RPC simulado
+def register_jsonrpc(method, handler):
+    """`handler` es un callable(params) -> result o directamente el valor de 'result'."""
+    with _lock:
+        _state['jsonrpc_handlers'][method] = handler
+
+
+def execute_jsonrpc(request):
+    try:
+        payload = json.loads(request) if isinstance(request, str) else dict(request)
+    except ValueError:
+        return json.dumps({'jsonrpc': '2.0', 'id': None, 'error': {'code': -32700, 'message': 'Parse error.'}})
+    method = payload.get('method')
+    params = payload.get('params', {})
+    with _lock:
+        _state['jsonrpc_calls'].append((method, params))
+        handler = _state['jsonrpc_handlers'].get(method)
+    response = {'jsonrpc': '2.0', 'id': payload.get('id')}
+    if handler is None:
+        response['result'] = 'OK' if method and method.split('.')[-1].startswith('Set') else {}
+    else:
+        try:
+            response['result'] = handler(params) if callable(handler) else handler
+        except Exception as e:
+            response['error'] = {'code': -32602, 'message': str(e)}
+    return json.dumps(response)
+
+
+def jsonrpc_calls(method=None):
+    with _lock:
+        return [call for call in _state['jsonrpc_calls'] if method is None or call[0] == method]
+
+
+def record_builtin(command):
+    with _lock:
+        _state['builtins'].append(command)
+
+
+def builtins():
+    with _lock:
+        return list(_state['builtins'])
+
+
+# Monitor
+def register_monitor(monitor):
+    _monitors.add(monitor)
+
+
+def request_abort():
+    with _lock:
+        _state['abort'] = True
+    for monitor in list(_monitors):
+        _call(monitor, 'onAbortRequested')
+
+
+def abort_after_waits(count):
+    """waitForAbort() devolverá True a partir de su llamada número `count`."""
+    with _lock:
+        _state['abort_after_waits'] = count
+
+
+def abort_requested():
+    with _lock:
+        return _state['abort']
+
+
+def count_wait():
+    with _lock:
+        remaining = _state['abort_after_waits']
+        if remaining is None:
+            return _state['abort']
+        remaining -= 1
+        _state['abort_after_waits'] = remaining
+        if remaining <= 0:
+            _state['abort'] = True
+        return _state['abort']
+
+
+def notify_settings_changed(**settings):
+    if settings:
+        configure(settings=settings)
+    for monitor in list(_monitors):
+        _call(monitor, 'onSettingsChanged')
+
+
+def set_screensaver(active):
+    configure(conditions={'System.ScreenSaverActive': active})
+    for monitor in list(_monitors):
+        _call(monitor, 'onScreensaverActivated' if active else 'onScreensaverDeactivated')
+
+
+def send_notification(sender, method, data=None):
+    payload = data if isinstance(data, str) else json.dumps(data or {})
+    for monitor in list(_monitors):
+        _call(monitor, 'onNotification', sender, method, payload)
+
+
+# Player
+def register_player(player):
+    _players.add(player)
+
+
+def start_playback(path='http://example.invalid/stream.ts', total_time=3600.0):
+    with _lock:
+        _state.update({'playing': path, 'paused': False, 'caching': False, 'play_time': 0.0, 'total_time': float(total_time)})
+    for player in list(_players):
+        _call(player, 'onPlayBackStarted')
+        _call(player, 'onAVStarted')
+
+
+def pause_playback(paused=True):
+    with _lock:
+        _state['paused'] = bool(paused)
+    for player in list(_players):
+        _call(player, 'onPlayBackPaused' if paused else 'onPlayBackResumed')
+
+
+def set_caching(caching=True):
+    with _lock:
+        _state['caching'] = bool(caching)
+
+
+def seek_playback(seconds):
+    with _lock:
+        _state['play_time'] = float(seconds)
+
+
+def stop_playback(ended=False):
+    with _lock:
+        _state.update({'playing': None, 'paused': False, 'caching': False})
+    for player in list(_players):
+        _call(player, 'onPlayBackEnded' if ended else 'onPlayBackStopped')
+
+
+def playback_conditions():
+    with _lock:
+        playing = _state['playing'] is not None
+        return {
+            'player.hasmedia': playing,
+            'player.hasvideo': playing,
+            'player.playing': playing and not _state['paused'],
+            'player.paused': playing and _state['paused'],
+            'player.caching': playing and _state['caching'],
+        }
+
+
+def _call(target, name, *args):
+    callback = getattr(target, name, None)
+    if callback is not None:
+        callback(*args)
+
+
+reset()
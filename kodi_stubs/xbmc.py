@@ -0,0 +1,143 @@
+"""Sustituto del módulo xbmc para ejecutar el addon fuera de Kodi (ver kodistub)."""
+import sys
+
+import kodistub
+import xbmcvfs
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGWARNING = 2
+LOGERROR = 3
+LOGFATAL = 4
+LOGNONE = 5
+
+PLAYLIST_MUSIC = 0
+PLAYLIST_VIDEO = 1
+
+
+def log(msg, level=LOGDEBUG):
+    # KODI_STUB_LOG=<nivel mínimo> (o configure(log_level=...)) vuelca el log a stderr
+    if kodistub.record_log(msg, level):
+        sys.stderr.write('[xbmc:%d] %s\n' % (level, msg))
+
+
+def sleep(milliseconds):
+    kodistub.sleep_seconds(milliseconds / 1000.0)
+
+
+def translatePath(path):
+    return xbmcvfs.translatePath(path)
+
+
+def getCondVisibility(condition):
+    key = condition.strip().lower()
+    conditions = kodistub.get('conditions', {})
+    if key in conditions:
+        return conditions[key]
+    return kodistub.playback_conditions().get(key, False)
+
+
+def getInfoLabel(label):
+    key = label.strip().lower()
+    if key == 'system.idletime':
+        return str(kodistub.get('idle_time', 0))
+    return kodistub.get('info_labels', {}).get(key, '')
+
+
+def getGlobalIdleTime():
+    return kodistub.get('idle_time', 0)
+
+
+def getFreeMem():
+    return 1024
+
+
+def executebuiltin(command, wait=False):
+    kodistub.record_builtin(command)
+    log('executebuiltin: %s' % command)
+
+
+def executeJSONRPC(request):
+    return kodistub.execute_jsonrpc(request)
+
+
+class Monitor(object):
+    def __init__(self):
+        kodistub.register_monitor(self)
+
+    def abortRequested(self):
+        return kodistub.abort_requested()
+
+    def waitForAbort(self, timeout=0):
+        if kodistub.count_wait():
+            return True
+        if timeout:
+            kodistub.sleep_seconds(timeout)
+        return kodistub.abort_requested()
+
+    def onSettingsChanged(self):
+        pass
+
+    def onScreensaverActivated(self):
+        pass
+
+    def onScreensaverDeactivated(self):
+        pass
+
+    def onNotification(self, sender, method, data):
+        pass
+
+    def onAbortRequested(self):
+        pass
+
+
+class Player(object):
+    def __init__(self):
+        kodistub.register_player(self)
+
+    def isPlaying(self):
+        return kodistub.get('playing') is not None
+
+    def isPlayingVideo(self):
+        return self.isPlaying()
+
+    def isPlayingAudio(self):
+        return False
+
+    def getPlayingFile(self):
+        playing = kodistub.get('playing')
+        if playing is None:
+            raise RuntimeError('Kodi is not playing any file')
+        return playing
+
+    def getTime(self):
+        return kodistub.get('play_time', 0.0)
+
+    def getTotalTime(self):
+        return kodistub.get('total_time', 0.0)
+
+    def stop(self):
+        if self.isPlaying():
+            kodistub.stop_playback()
+
+    def pause(self):
+        if self.isPlaying():
+            kodistub.pause_playback(not kodistub.get('paused'))
+
+    def onPlayBackStarted(self):
+        pass
+
+    def onAVStarted(self):
+        pass
+
+    def onPlayBackStopped(self):
+        pass
+
+    def onPlayBackEnded(self):
+        pass
+
+    def onPlayBackPaused(self):
+        pass
+
+    def onPlayBackResumed(self):
+        pass
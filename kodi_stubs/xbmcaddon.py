@@ -0,0 +1,87 @@
+"""Sustituto de xbmcaddon: lee addon.xml y los valores por defecto de settings.xml.
+
+Los valores pasados a kodistub.configure(settings=...) tienen prioridad.
+"""
+import os
+import xml.etree.ElementTree as ET
+
+import kodistub
+
+ADDON_PATH = os.environ.get('KODI_STUB_ADDON_PATH') or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _read_addon_info():
+    info = {'id': 'script.aspirando-kodi', 'name': 'Aspirando Kodi', 'version': '0', 'path': ADDON_PATH}
+    try:
+        root = ET.parse(os.path.join(ADDON_PATH, 'addon.xml')).getroot()
+        for key in ('id', 'name', 'version'):
+            info[key] = root.get(key, info[key])
+    except (OSError, ET.ParseError):
+        pass
+    info['profile'] = 'special://profile/addon_data/%s/' % info['id']
+    return info
+
+
+def _read_default_settings():
+    settings = {}
+    try:
+        for node in ET.parse(os.path.join(ADDON_PATH, 'resources', 'settings.xml')).getroot().iter('setting'):
+            if node.get('id'):
+                settings[node.get('id')] = node.get('default', '')
+    except (OSError, ET.ParseError):
+        pass
+    return settings
+
+
+_info = _read_addon_info()
+_settings = _read_default_settings()
+
+
+class Addon(object):
+    def __init__(self, id=None):
+        self._id = id or _info['id']
+
+    def getAddonInfo(self, key):
+        return _info.get(key, '')
+
+    def getLocalizedString(self, string_id):
+        return ''
+
+    def getSetting(self, setting_id):
+        return kodistub.get_setting(setting_id, _settings.get(setting_id, ''))
+
+    def getSettingBool(self, setting_id):
+        return self.getSetting(setting_id).lower() == 'true'
+
+    def getSettingInt(self, setting_id):
+        try:
+            return int(float(self.getSetting(setting_id)))
+        except ValueError:
+            return 0
+
+    def getSettingNumber(self, setting_id):
+        try:
+            return float(self.getSetting(setting_id))
+        except ValueError:
+            return 0.0
+
+    def getSettingString(self, setting_id):
+        return self.getSetting(setting_id)
+
+    def setSetting(self, setting_id, value):
+        kodistub.set_setting(setting_id, str(value))
+
+    def setSettingBool(self, setting_id, value):
+        kodistub.set_setting(setting_id, 'true' if value else 'false')
+
+    def setSettingInt(self, setting_id, value):
+        kodistub.set_setting(setting_id, str(int(value)))
+
+    def setSettingNumber(self, setting_id, value):
+        kodistub.set_setting(setting_id, str(value))
+
+    def setSettingString(self, setting_id, value):
+        kodistub.set_setting(setting_id, str(value))
+
+    def openSettings(self):
+        pass
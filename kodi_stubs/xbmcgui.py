@@ -0,0 +1,125 @@
+"""Sustituto de xbmcgui: los diálogos responden lo guionizado con kodistub.script_dialog.
+
+Sin guion, ok/yesno aceptan, select elige la primera opción e input devuelve
+el valor por defecto. Todas las llamadas quedan en kodistub.dialog_calls().
+"""
+import kodistub
+
+INPUT_ALPHANUM = 0
+INPUT_NUMERIC = 1
+INPUT_DATE = 2
+INPUT_TIME = 3
+INPUT_IPADDRESS = 4
+INPUT_PASSWORD = 5
+NOTIFICATION_INFO = 'info'
+NOTIFICATION_WARNING = 'warning'
+NOTIFICATION_ERROR = 'error'
+
+
+def _answer(method, args, kwargs, fallback=None):
+    return kodistub.next_dialog_answer(method, args, kwargs, fallback)
+
+
+class Dialog(object):
+    def ok(self, heading, message='', *args, **kwargs):
+        return bool(_answer('ok', (heading, message) + args, kwargs))
+
+    def yesno(self, heading, message='', *args, **kwargs):
+        return bool(_answer('yesno', (heading, message) + args, kwargs))
+
+    def yesnocustom(self, heading, message='', *args, **kwargs):
+        return _answer('yesnocustom', (heading, message) + args, kwargs)
+
+    def select(self, heading, options, *args, **kwargs):
+        return _answer('select', (heading, list(options)) + args, kwargs) if options else -1
+
+    def contextmenu(self, options):
+        return _answer('contextmenu', (list(options),), {})
+
+    def multiselect(self, heading, options, *args, **kwargs):
+        return _answer('multiselect', (heading, list(options)) + args, kwargs, list(range(len(options))))
+
+    def input(self, heading, defaultt='', *args, **kwargs):
+        return _answer('input', (heading, defaultt) + args, kwargs, kwargs.get('defaultt', defaultt))
+
+    def numeric(self, type, heading, defaultt='', *args, **kwargs):
+        return _answer('numeric', (type, heading, defaultt) + args, kwargs, defaultt)
+
+    def browse(self, type, heading, shares, *args, **kwargs):
+        return _answer('browse', (type, heading, shares) + args, kwargs, kwargs.get('defaultt', ''))
+
+    def browseSingle(self, type, heading, shares, *args, **kwargs):
+        return _answer('browseSingle', (type, heading, shares) + args, kwargs, kwargs.get('defaultt', ''))
+
+    def browseMultiple(self, type, heading, shares, *args, **kwargs):
+        return _answer('browseMultiple', (type, heading, shares) + args, kwargs, [])
+
+    def textviewer(self, heading, text, *args, **kwargs):
+        _answer('textviewer', (heading, text) + args, kwargs)
+
+    def notification(self, heading, message, *args, **kwargs):
+        _answer('notification', (heading, message) + args, kwargs)
+
+
+class DialogProgress(object):
+    def __init__(self):
+        self.percent = 0
+        self.message = ''
+
+    def create(self, heading, message=''):
+        self.message = message
+        _answer('progress.create', (heading, message), {})
+
+    def update(self, percent, message=''):
+        self.percent = percent
+        if message:
+            self.message = message
+
+    def iscanceled(self):
+        # kodistub.cancel_progress_after(n) simula que el usuario pulsa Cancelar
+        return kodistub.progress_canceled()
+
+    def close(self):
+        pass
+
+
+class DialogProgressBG(object):
+    def __init__(self):
+        self.percent = 0
+        self.message = ''
+
+    def create(self, heading, message=''):
+        self.message = message
+
+    def update(self, percent=0, heading='', message=''):
+        self.percent = percent
+        if message:
+            self.message = message
+
+    def isFinished(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class Window(object):
+    def __init__(self, existingWindowId=-1):
+        self._properties = {}
+
+    def getProperty(self, key):
+        return self._properties.get(key, '')
+
+    def setProperty(self, key, value):
+        self._properties[key] = value
+
+    def clearProperty(self, key):
+        self._properties.pop(key, None)
+
+
+def getCurrentWindowId():
+    return 10000
+
+
+def getCurrentWindowDialogId():
+    return 9999
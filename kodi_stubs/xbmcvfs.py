@@ -0,0 +1,122 @@
+"""Sustituto de xbmcvfs: special:// se resuelve bajo la raíz de kodistub.configure(root=...)."""
+import os
+import shutil
+
+import kodistub
+
+# Estructura de Kodi en Linux: <raíz>/addons, <raíz>/userdata, <raíz>/temp
+SPECIAL_DIRS = {
+    'home': '',
+    'xbmc': '',
+    'userdata': 'userdata',
+    'profile': 'userdata',
+    'masterprofile': 'userdata',
+    'database': os.path.join('userdata', 'Database'),
+    'thumbnails': os.path.join('userdata', 'Thumbnails'),
+    'temp': 'temp',
+    'logpath': 'temp',
+}
+
+
+def get_root():
+    return kodistub.get_root()
+
+
+def translatePath(path):
+    if not path or not path.startswith('special://'):
+        return path
+    name, slash, tail = path[len('special://'):].partition('/')
+    base = os.path.join(get_root(), SPECIAL_DIRS.get(name, name))
+    if tail:
+        return os.path.join(base, *tail.split('/'))
+    return os.path.join(base, '') if slash else base
+
+
+def exists(path):
+    return os.path.exists(translatePath(path))
+
+
+def mkdirs(path):
+    os.makedirs(translatePath(path), exist_ok=True)
+    return True
+
+
+def delete(path):
+    try:
+        os.remove(translatePath(path))
+        return True
+    except OSError:
+        return False
+
+
+def rmdir(path, force=False):
+    try:
+        if force:
+            shutil.rmtree(translatePath(path))
+        else:
+            os.rmdir(translatePath(path))
+        return True
+    except OSError:
+        return False
+
+
+def rename(source, destination):
+    try:
+        os.replace(translatePath(source), translatePath(destination))
+        return True
+    except OSError:
+        return False
+
+
+def listdir(path):
+    directories, files = [], []
+    try:
+        with os.scandir(translatePath(path)) as entries:
+            for entry in entries:
+                (directories if entry.is_dir() else files).append(entry.name)
+    except OSError:
+        pass
+    return directories, files
+
+
+def makeLegalFilename(filename):
+    return filename
+
+
+def validatePath(path):
+    return path
+
+
+def copy(source, destination):
+    try:
+        shutil.copyfile(translatePath(source), translatePath(destination))
+        return True
+    except OSError:
+        return False
+
+
+class File(object):
+    def __init__(self, path, mode='r'):
+        self._handle = open(translatePath(path), 'wb' if 'w' in mode else 'rb')
+
+    def read(self, size=-1):
+        return self._handle.read(size).decode('utf-8', 'replace')
+
+    def readBytes(self, size=-1):
+        return bytearray(self._handle.read(size))
+
+    def write(self, data):
+        self._handle.write(data.encode('utf-8') if isinstance(data, str) else bytes(data))
+        return True
+
+    def size(self):
+        return os.fstat(self._handle.fileno()).st_size
+
+    def close(self):
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,251 @@
+import os
+import time
+
+import xbmc
+import xbmcaddon
+
+import priority
+import storage
+
+
+# Puerta de mantenimiento: ningún trabajo pesado del servicio (limpieza,
+# VACUUM, instalación de actualizaciones, auto-limpieza del cachepath) arranca
+# mientras se reproduce, se está cargando o está en pausa un vídeo. Los que se
+# encuentran la puerta ocupada se aplazan y se reintentan desde el bucle del
+# servicio; los que ya están en marcha se pausan entre lotes (storage.TimeSlicer).
+DEFER_RETRY_SECONDS = 15
+
+# Ventana de inactividad: Kodi lleva IDLE_MINUTES sin entrada del usuario, no
+# se reproduce nada y el salvapantallas está activo. En ella se ejecutan las
+# tareas de mantenimiento vencidas, hasta IDLE_MAX_RUNTIME_MINUTES por ventana;
+# cada tarea se repite como mucho cada IDLE_TASK_INTERVAL segundos.
+IDLE_MINUTES = 10
+IDLE_MAX_RUNTIME_MINUTES = 15
+IDLE_TASK_INTERVAL = 24 * 3600
+IDLE_STATE_FILENAME = 'idle_maintenance.json'
+
+addon = xbmcaddon.Addon()
+addon_name = addon.getAddonInfo('name')
+
+
+idle_state_path = os.path.join(storage.addon_data_dir, IDLE_STATE_FILENAME)
+
+
+def log(message, level=xbmc.LOGINFO):
+    xbmc.log('[%s][maintenance] %s' % (addon_name, message), level)
+
+
+def is_idle_maintenance_enabled():
+    try:
+        return addon.getSettingBool('idle_maintenance')
+    except Exception:
+        return False
+
+
+class PlaybackGate(object):
+    """Indica si hay reproducción activa, en carga o en pausa."""
+
+    def __init__(self):
+        self._player = None
+
+    def _get_player(self):
+        if self._player is None:
+            self._player = xbmc.Player()
+        return self._player
+
+    def busy_reason(self):
+        """Motivo por el que no se debe hacer mantenimiento, o None si la vía está libre."""
+        try:
+            if xbmc.getCondVisibility('Player.Caching'):
+                return 'reproducción cargando (Player.Caching)'
+            if xbmc.getCondVisibility('Player.Paused'):
+                return 'reproducción en pausa (Player.Paused)'
+            if self._get_player().isPlaying():
+                return 'reproducción en curso'
+        except Exception as e:
+            log('No se pudo consultar el reproductor: %s' % str(e), xbmc.LOGDEBUG)
+        return None
+
+    def is_busy(self):
+        return self.busy_reason() is not None
+
+
+class MaintenanceQueue(object):
+    """Cola de trabajos pesados del servicio.
+
+    `submit` encola; `run_pending` ejecuta en orden los trabajos pendientes
+    mientras la puerta esté libre, cada uno en el hilo de baja prioridad de
+    priority.run_maintenance. Si la puerta está ocupada, los trabajos se
+    quedan en la cola y se reintentan pasados `retry_seconds`.
+    """
+
+    def __init__(self, gate, retry_seconds=None):
+        self.gate = gate
+        self.retry_seconds = DEFER_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self.pending = []
+        self._next_try = 0.0
+        self._deferred_reason = None
+
+    def submit(self, name, function, *args, **kwargs):
+        if any(job[0] == name for job in self.pending):
+            return
+        self.pending.append((name, function, args, kwargs))
+
+    def run_pending(self):
+        """Ejecuta lo que se pueda. Devuelve el número de trabajos ejecutados."""
+        executed = 0
+        while self.pending:
+            if time.time() < self._next_try:
+                break
+            reason = self.gate.busy_reason()
+            if reason is not None:
+                if reason != self._deferred_reason:
+                    log('Aplazados %d trabajo(s) (%s): %s' % (
+                        len(self.pending), reason, ', '.join(job[0] for job in self.pending)))
+                self._deferred_reason = reason
+                self._next_try = time.time() + self.retry_seconds
+                break
+            self._deferred_reason = None
+            name, function, args, kwargs = self.pending.pop(0)
+            try:
+                priority.run_maintenance(name, function, *args, **kwargs)
+            except Exception as e:
+                log('Error en %s: %s' % (name, str(e)))
+            executed += 1
+        return executed
+
+
+class IdleWindow(object):
+    """Ventana de inactividad real: sin entrada del usuario, sin reproducción y con salvapantallas.
+
+    `busy_reason` sirve de puerta para storage.TimeSlicer y `stop_reason` de
+    condición de parada: la ventana se cierra al volver el usuario o al
+    agotarse el tiempo máximo.
+    """
+
+    def __init__(self, gate, min_idle_seconds=None, max_runtime_seconds=None):
+        self.gate = gate
+        self.min_idle_seconds = (min_idle_seconds if min_idle_seconds is not None
+                                 else storage._get_setting_int('idle_maintenance_minutes', IDLE_MINUTES) * 60)
+        self.max_runtime_seconds = (max_runtime_seconds if max_runtime_seconds is not None
+                                    else storage._get_setting_int('idle_maintenance_max_minutes',
+                                                                  IDLE_MAX_RUNTIME_MINUTES) * 60)
+        self.opened_at = None
+
+    def busy_reason(self):
+        """Motivo por el que Kodi no está inactivo, o None."""
+        reason = self.gate.busy_reason()
+        if reason is not None:
+            return reason
+        try:
+            idle_seconds = xbmc.getGlobalIdleTime()
+            if idle_seconds < self.min_idle_seconds:
+                return 'actividad del usuario hace %d s' % idle_seconds
+            if not xbmc.getCondVisibility('System.ScreenSaverActive'):
+                return 'salvapantallas inactivo'
+        except Exception as e:
+            return 'no se pudo consultar la inactividad: %s' % str(e)
+        return None
+
+    def open(self):
+        """Abre la ventana si Kodi está inactivo. Devuelve True si se abrió."""
+        if self.busy_reason() is not None:
+            return False
+        self.opened_at = time.time()
+        return True
+
+    def remaining(self):
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.max_runtime_seconds - (time.time() - self.opened_at))
+
+    def stop_reason(self):
+        if self.opened_at is None:
+            return 'ventana cerrada'
+        if self.remaining() <= 0:
+            return 'tiempo máximo de la ventana agotado (%d min)' % (self.max_runtime_seconds // 60)
+        return self.busy_reason()
+
+    def close(self):
+        self.opened_at = None
+
+
+class IdleMaintenance(object):
+    """Tareas de mantenimiento que solo se ejecutan en ventanas de inactividad.
+
+    Cada tarea es `function(throttle)`, donde `throttle` es un
+    storage.TimeSlicer ligado a la ventana: se pausa con la reproducción y se
+    detiene si el usuario vuelve o se acaba el tiempo. Las tareas se ejecutan
+    en orden, en el hilo de baja prioridad, y solo las que terminan enteras
+    guardan su hora en addon_data/idle_maintenance.json; una tarea cortada se
+    retoma en la siguiente ventana.
+    """
+
+    def __init__(self, gate, interval=None):
+        self.gate = gate
+        self.interval = IDLE_TASK_INTERVAL if interval is None else interval
+        self.tasks = []
+        self._last_check = 0.0
+
+    def add(self, name, function):
+        self.tasks.append((name, function))
+
+    def _load_state(self):
+        data = storage._read_json(idle_state_path, {})
+        return data if isinstance(data, dict) else {}
+
+    def _save_state(self, state):
+        try:
+            storage._write_json_atomic(idle_state_path, state)
+        except Exception as e:
+            log('No se pudo guardar %s: %s' % (IDLE_STATE_FILENAME, str(e)))
+
+    def due_tasks(self, state=None):
+        state = self._load_state() if state is None else state
+        now = time.time()
+        return [task for task in self.tasks if now - state.get(task[0], 0) >= self.interval]
+
+    def run_if_idle(self):
+        """Abre una ventana si Kodi está inactivo y ejecuta las tareas vencidas.
+
+        Devuelve el número de tareas completadas.
+        """
+        if not self.tasks or not is_idle_maintenance_enabled():
+            return 0
+        # La inactividad se mide en minutos: basta con mirar cada pocos segundos
+        if time.time() - self._last_check < DEFER_RETRY_SECONDS:
+            return 0
+        self._last_check = time.time()
+        state = self._load_state()
+        pending = self.due_tasks(state)
+        if not pending:
+            return 0
+        window = IdleWindow(self.gate)
+        if not window.open():
+            return 0
+        log('Ventana de inactividad abierta (máximo %d min): %s' % (
+            window.max_runtime_seconds // 60, ', '.join(task[0] for task in pending)))
+        completed = 0
+        try:
+            for name, function in pending:
+                reason = window.stop_reason()
+                if reason is not None:
+                    log('Ventana de inactividad cerrada antes de %s: %s' % (name, reason))
+                    break
+                throttle = storage.TimeSlicer(gate=self.gate, should_stop=window.stop_reason)
+                started = time.time()
+                try:
+                    priority.run_maintenance(name, function, throttle)
+                except Exception as e:
+                    log('Error en %s: %s' % (name, str(e)))
+                    continue
+                if throttle.stopped or throttle.aborted:
+                    log('%s interrumpido tras %.1fs; se retomará en la próxima ventana' % (name, time.time() - started))
+                    break
+                state[name] = time.time()
+                self._save_state(state)
+                completed += 1
+                log('%s completado en %.1fs' % (name, time.time() - started))
+        finally:
+            window.close()
+        return completed
@@ -0,0 +1,231 @@
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import xbmc
+import xbmcaddon
+import xbmcvfs
+
+import storage
+import updater
+
+
+# Poda de special://home/addons/packages: Kodi usa el último zip de cada addon
+# para reinstalar y volver atrás, así que se conservan los N más recientes por
+# addon y se borra el resto junto con los paquetes corruptos.
+PACKAGE_NAME_PATTERN = re.compile(r'^(?P<addon_id>.+?)-(?P<version>\d[^/\\]*?)\.zip$', re.IGNORECASE)
+DEFAULT_KEEP_PER_ADDON = 1
+MAX_CHECK_WORKERS = 4
+
+addon = xbmcaddon.Addon()
+addon_name = addon.getAddonInfo('name')
+
+
+def log(message, level=xbmc.LOGINFO):
+    xbmc.log('[%s][packages] %s' % (addon_name, message), level)
+
+
+def _translate(path):
+    try:
+        return xbmcvfs.translatePath(path)
+    except Exception:
+        try:
+            return xbmc.translatePath(path)
+        except Exception:
+            return path
+
+
+def packages_path():
+    return os.path.join(_translate('special://home/'), 'addons', 'packages')
+
+
+def get_keep_per_addon():
+    return storage._get_setting_int('packages_keep_per_addon', DEFAULT_KEEP_PER_ADDON, minimum=0)
+
+
+def parse_package_name(name):
+    """Devuelve (addon_id, version) para 'plugin.video.x-1.2.3.zip' o None."""
+    match = PACKAGE_NAME_PATTERN.match(name)
+    if not match:
+        return None
+    return match.group('addon_id'), match.group('version')
+
+
+def group_packages(folder_path):
+    """Agrupa los zip por addon, del más reciente al más antiguo.
+
+    El orden usa la versión normalizada como en updater y, a igualdad, la
+    fecha de modificación. Devuelve (grupos, otros): `otros` son archivos con
+    nombre no reconocido, que no se tocan.
+    """
+    groups = {}
+    others = []
+    try:
+        with os.scandir(folder_path) as it:
+            for entry in it:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                parsed = parse_package_name(entry.name)
+                if parsed is None:
+                    others.append(entry.path)
+                    continue
+                addon_id, version = parsed
+                groups.setdefault(addon_id, []).append({
+                    'path': entry.path,
+                    'name': entry.name,
+                    'version': version,
+                    'size': st.st_size,
+                    'mtime': st.st_mtime,
+                })
+    except OSError as e:
+        log('No se pudo listar %s: %s' % (folder_path, str(e)))
+    for items in groups.values():
+        items.sort(key=lambda item: (updater._normalize_version(item['version']), item['mtime']), reverse=True)
+    return groups, others
+
+
+def check_package(path):
+    """Comprueba el CRC de todas las entradas del zip. Devuelve None o el error."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            bad_member = archive.testzip()
+        if bad_member is not None:
+            return 'CRC incorrecto en %s' % bad_member
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError, EOFError, ValueError) as e:
+        return str(e) or e.__class__.__name__
+    return None
+
+
+def check_packages(paths, workers=None):
+    """Comprueba varios zip en paralelo (zlib libera el GIL al descomprimir)."""
+    if not paths:
+        return {}
+    if workers is None:
+        workers = min(MAX_CHECK_WORKERS, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        errors = dict(zip(paths, executor.map(check_package, paths)))
+    return dict((path, error) for path, error in errors.items() if error)
+
+
+def plan_prune(folder_path=None, keep=None, verify=True, workers=None):
+    """Decide qué paquetes borrar sin tocar el disco.
+
+    Devuelve {'delete': [(ruta, tamaño, motivo)], 'size', 'kept', 'corrupt',
+    'addons'}. Solo se verifican los paquetes que se conservarían; los demás
+    se borran de todos modos.
+    """
+    folder_path = folder_path or packages_path()
+    keep = get_keep_per_addon() if keep is None else max(0, int(keep))
+    groups, _ = group_packages(folder_path)
+    plan = {'delete': [], 'size': 0, 'kept': 0, 'corrupt': 0, 'addons': len(groups)}
+    kept_items = []
+    for items in groups.values():
+        kept_items.extend(items[:keep])
+        for item in items[keep:]:
+            plan['delete'].append((item['path'], item['size'], 'antiguo'))
+            plan['size'] += item['size']
+
+    corrupt = check_packages([item['path'] for item in kept_items], workers) if verify else {}
+    for item in kept_items:
+        error = corrupt.get(item['path'])
+        if error:
+            log('Paquete corrupto %s: %s' % (item['name'], error))
+            plan['delete'].append((item['path'], item['size'], 'corrupto'))
+            plan['size'] += item['size']
+            plan['corrupt'] += 1
+        else:
+            plan['kept'] += 1
+    log('Poda de paquetes: %d addons, %d a borrar (%s), %d corruptos, %d conservados' % (
+        plan['addons'], len(plan['delete']), storage.format_size(plan['size']), plan['corrupt'], plan['kept']))
+    return plan
+
+
+def prune_packages(plan, result=None, progress=None):
+    """Borra los paquetes de un plan de `plan_prune` con el motor de storage."""
+    if result is None:
+        result = storage.empty_result()
+    with storage.skip_open_files():
+        for path, _, _ in plan['delete']:
+            storage.remove_path(path, result, progress)
+            if result.get('cancelled'):
+                break
+    return result
+
+
+def eviction_candidates(folder_path=None, keep=None):
+    """Paquetes que se pueden expulsar por espacio: (antiguos, recientes, total).
+
+    'recientes' son los `keep` (al menos uno) últimos de cada addon, los que
+    Kodi necesita para reinstalar o volver atrás; ambas listas van del más
+    antiguo al más reciente por mtime. `total` es el tamaño real de la carpeta,
+    incluidos los archivos de nombre no reconocido, que nunca se tocan.
+    """
+    folder_path = folder_path or packages_path()
+    keep = max(1, get_keep_per_addon() if keep is None else int(keep))
+    groups, others = group_packages(folder_path)
+    outdated = []
+    latest = []
+    for items in groups.values():
+        latest.extend(items[:keep])
+        outdated.extend(items[keep:])
+    total = sum(item['size'] for item in outdated + latest)
+    for path in others:
+        try:
+            total += os.lstat(path).st_size
+        except OSError:
+            pass
+    outdated.sort(key=lambda item: item['mtime'])
+    latest.sort(key=lambda item: item['mtime'])
+    return outdated, latest, total
+
+
+def evict_to_quota(quota_bytes=0, max_age_seconds=0, keep_latest=True, folder_path=None, result=None, progress=None,
+                   needed_bytes=None):
+    """Expulsión por cuota y antigüedad que respeta el último paquete de cada addon.
+
+    Primero se borran los paquetes antiguos (como en la poda), del más antiguo
+    al más reciente, hasta quedar bajo `quota_bytes`; la antigüedad máxima
+    solo se aplica a ellos. Con `keep_latest=False`, y solo si aún no basta,
+    se borran también los más recientes de cada addon como último recurso:
+    se avisa en el registro y se cuentan en 'packages_latest' del resultado.
+    Con `needed_bytes` se borra esa cantidad en lugar de mirar la cuota.
+    """
+    if result is None:
+        result = storage.empty_result()
+    quota_bytes = max(0, int(quota_bytes or 0))
+    outdated, latest, total = eviction_candidates(folder_path)
+    if needed_bytes is not None:
+        excess = needed_bytes
+    else:
+        excess = total - quota_bytes if quota_bytes else 0
+    cutoff = time.time() - max_age_seconds if max_age_seconds else None
+    with storage.skip_open_files():
+        for item in outdated:
+            if result.get('cancelled'):
+                return result
+            if excess <= 0 and (cutoff is None or item['mtime'] >= cutoff):
+                continue
+            before = result['removed_size']
+            storage.remove_path(item['path'], result, progress)
+            excess -= result['removed_size'] - before
+        if excess <= 0 or keep_latest or result.get('cancelled'):
+            return result
+        log('Último recurso: se borran paquetes recientes (sin ellos Kodi no puede reinstalar ni volver atrás); faltan %s' % (
+            storage.format_size(excess)), xbmc.LOGWARNING)
+        result.setdefault('packages_latest', 0)
+        for item in latest:
+            if excess <= 0 or result.get('cancelled'):
+                break
+            before_count, before = result['removed_count'], result['removed_size']
+            storage.remove_path(item['path'], result, progress)
+            excess -= result['removed_size'] - before
+            if result['removed_count'] > before_count:
+                result['packages_latest'] += 1
+                log('Paquete reciente borrado: %s' % item['name'], xbmc.LOGWARNING)
+    return result
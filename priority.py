@@ -0,0 +1,190 @@
+import ctypes
+import ctypes.util
+import os
+import platform
+import sys
+import threading
+
+import xbmc
+import xbmcaddon
+
+
+# Modo mantenimiento: los trabajos pesados del servicio (limpieza, VACUUM,
+# escaneos) se ejecutan en un hilo propio con la prioridad de CPU y de E/S
+# rebajadas, para no competir con el demuxer y el reproductor de Kodi. Solo se
+# toca la prioridad de ese hilo, nunca la del proceso de Kodi: en Linux nice e
+# ioprio son atributos de cada hilo y los heredan los hilos que cree.
+MAINTENANCE_NICE = 19
+
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_NAMES = {0: 'ninguna', 1: 'tiempo real', 2: 'best-effort', 3: 'idle'}
+
+# Números de syscall (ioprio_set, ioprio_get) por arquitectura
+IOPRIO_SYSCALLS = {
+    'x86_64': (251, 252),
+    'amd64': (251, 252),
+    'i386': (289, 290),
+    'i686': (289, 290),
+    'armv7l': (314, 315),
+    'armv8l': (314, 315),
+    'armv6l': (314, 315),
+    'aarch64': (30, 31),
+    'arm64': (30, 31),
+    'riscv64': (30, 31),
+    'ppc64le': (273, 274),
+    'ppc64': (273, 274),
+}
+
+# Windows: modo de fondo del hilo (baja CPU, E/S y memoria a la vez)
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+# macOS: setpriority(PRIO_DARWIN_THREAD, 0, PRIO_DARWIN_BG)
+PRIO_DARWIN_THREAD = 3
+PRIO_DARWIN_BG = 0x1000
+
+addon = xbmcaddon.Addon()
+addon_name = addon.getAddonInfo('name')
+
+
+def log(message, level=xbmc.LOGINFO):
+    xbmc.log('[%s][priority] %s' % (addon_name, message), level)
+
+
+def is_low_priority_enabled():
+    try:
+        return addon.getSettingBool('maintenance_low_priority')
+    except Exception:
+        return True
+
+
+def _libc():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except (OSError, TypeError):
+        return None
+
+
+def _ioprio_value(io_class, level):
+    return (io_class << IOPRIO_CLASS_SHIFT) | level
+
+
+def _lower_linux(tid, info):
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, MAINTENANCE_NICE)
+    except OSError as e:
+        info['errors'].append('nice: %s' % e.strerror)
+    try:
+        info['nice'] = os.getpriority(os.PRIO_PROCESS, tid)
+    except OSError:
+        pass
+
+    numbers = IOPRIO_SYSCALLS.get(platform.machine().lower())
+    libc = _libc()
+    if numbers is None or libc is None:
+        info['errors'].append('ioprio: arquitectura %s no soportada' % platform.machine())
+        return
+    set_nr, get_nr = numbers
+    # idle no requiere privilegios desde Linux 2.6.25; si se rechaza, el nivel más bajo de best-effort
+    for io_class, level in ((IOPRIO_CLASS_IDLE, 0), (IOPRIO_CLASS_BE, 7)):
+        if libc.syscall(set_nr, IOPRIO_WHO_PROCESS, tid, _ioprio_value(io_class, level)) == 0:
+            break
+        info['errors'].append('ioprio %s: %s' % (IOPRIO_CLASS_NAMES[io_class], os.strerror(ctypes.get_errno())))
+    current = libc.syscall(get_nr, IOPRIO_WHO_PROCESS, tid)
+    if current >= 0:
+        io_class = current >> IOPRIO_CLASS_SHIFT
+        level = current & ((1 << IOPRIO_CLASS_SHIFT) - 1)
+        if io_class == 0:
+            # Sin clase explícita el kernel deriva la E/S del nice: best-effort (nice + 20) / 5
+            io_class, level = IOPRIO_CLASS_BE, (info.get('nice', 0) + 20) // 5
+        info['io'] = IOPRIO_CLASS_NAMES.get(io_class, str(io_class))
+        if io_class == IOPRIO_CLASS_BE:
+            info['io'] += ' %d' % level
+
+
+def _lower_windows(info):
+    try:
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetCurrentThread()
+        if kernel32.SetThreadPriority(handle, THREAD_MODE_BACKGROUND_BEGIN):
+            info['io'] = 'background'
+            info['cpu'] = 'background'
+        else:
+            info['errors'].append('SetThreadPriority: %d' % kernel32.GetLastError())
+    except Exception as e:
+        info['errors'].append('SetThreadPriority: %s' % str(e))
+
+
+def _lower_darwin(info):
+    libc = _libc()
+    if libc is None:
+        info['errors'].append('libc no disponible')
+        return
+    if libc.setpriority(PRIO_DARWIN_THREAD, 0, PRIO_DARWIN_BG) == 0:
+        info['io'] = 'background'
+        info['cpu'] = 'background'
+    else:
+        info['errors'].append('setpriority: %s' % os.strerror(ctypes.get_errno()))
+
+
+def lower_current_thread_priority():
+    """Rebaja la prioridad de CPU y E/S del hilo actual y devuelve la obtenida.
+
+    Devuelve {'nice', 'cpu', 'io', 'errors'}; los valores son los que el
+    sistema informa después del cambio, no los pedidos.
+    """
+    info = {'nice': None, 'cpu': None, 'io': None, 'errors': []}
+    try:
+        if sys.platform.startswith('linux'):
+            _lower_linux(threading.get_native_id(), info)
+        elif sys.platform == 'win32':
+            _lower_windows(info)
+        elif sys.platform == 'darwin':
+            _lower_darwin(info)
+        else:
+            # os.nice cambiaría la prioridad de todo el proceso de Kodi (y para siempre)
+            info['errors'].append('sin prioridad por hilo en %s' % sys.platform)
+    except Exception as e:
+        info['errors'].append(str(e))
+    return info
+
+
+def describe_priority(info):
+    parts = []
+    if info.get('nice') is not None:
+        parts.append('CPU nice %d' % info['nice'])
+    elif info.get('cpu'):
+        parts.append('CPU %s' % info['cpu'])
+    parts.append('E/S %s' % (info.get('io') or 'sin cambios'))
+    text = ', '.join(parts)
+    if info.get('errors'):
+        text += ' (%s)' % '; '.join(info['errors'])
+    return text
+
+
+def run_maintenance(name, function, *args, **kwargs):
+    """Ejecuta `function` en un hilo de mantenimiento de baja prioridad y espera su resultado.
+
+    Las excepciones se relanzan en el hilo que llama. Con el ajuste
+    maintenance_low_priority desactivado se ejecuta directamente.
+    """
+    if not is_low_priority_enabled():
+        return function(*args, **kwargs)
+    outcome = {}
+
+    def target():
+        info = lower_current_thread_priority()
+        log('%s con prioridad de mantenimiento: %s' % (name, describe_priority(info)))
+        try:
+            outcome['value'] = function(*args, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+
+    worker = threading.Thread(target=target, name='aspirando-maintenance')
+    worker.daemon = True
+    worker.start()
+    worker.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome.get('value')
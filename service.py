@@ -5,7 +5,11 @@ import json
 import os
 import time
 import xbmcvfs
+import maintenance
+import priority
+import storage
 import updater
+import watcher
 from typing import Any, cast
 
 # Servicio de arranque: ejecuta limpieza si está programada
@@ -22,6 +26,30 @@ schedule_path = os.path.join(addon_data_dir, 'schedule_clean.json')
 _default_module = None
 KodiMonitorBase = cast(Any, getattr(xbmc, 'Monitor', object))
 KodiPlayerBase = cast(Any, getattr(xbmc, 'Player', object))
+# Todos los trabajos pesados pasan por la puerta de reproducción y su cola
+gate = maintenance.PlaybackGate()
+jobs = maintenance.MaintenanceQueue(gate)
+
+
+# Pre-escaneo de tamaños para los menús: tras asentarse el arranque y después
+# de cada reproducción, nunca mientras se reproduce algo
+PRESCAN_STARTUP_DELAY = 60
+PRESCAN_AFTER_PLAYBACK_DELAY = 30
+# Cada cuánto se vuelcan a la caché de tamaños los contadores en vivo
+WATCH_PUBLISH_SECONDS = 10
+# Cada cuánto se mide el espacio libre de userdata, temp y cachepath
+FREE_SPACE_CHECK_SECONDS = 60
+# Si una expulsión no alcanza la marca alta (el espacio lo ocupa algo ajeno al
+# addon), la siguiente espera el doble cada vez, hasta este máximo, o a que el
+# espacio libre cambie en FREE_SPACE_RETRY_DELTA_MB
+FREE_SPACE_MAX_BACKOFF_SECONDS = 6 * 3600
+FREE_SPACE_RETRY_DELTA_MB = 256
+# Cada cuánto se mira si la limpieza instantánea ha dejado algo en la papelera
+TRASH_CHECK_SECONDS = 5
+# Una entrada de la papelera que no se puede borrar se reintenta tras este
+# tiempo, el doble en cada fallo hasta TRASH_MAX_BACKOFF_SECONDS
+TRASH_RETRY_SECONDS = 60
+TRASH_MAX_BACKOFF_SECONDS = 6 * 3600
 
 
 def log(msg):
@@ -49,6 +77,7 @@ def get_default_module():
 
 
 def run_clean():
+    slicer = None
     try:
         mod = get_default_module()
 
@@ -57,8 +86,10 @@ def run_clean():
             with open(schedule_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
             planned = data.get('planned', {})
+            target_bytes = int(data.get('target_bytes') or 0)
         except Exception:
             planned = {}
+            target_bytes = 0
 
         summary_lines = [
             'Iniciando limpieza programada...',
@@ -72,19 +103,61 @@ def run_clean():
             return '%s: %d archivos (%s)' % (cat.capitalize(), files, mod.format_size(size))
         for c in ['cache', 'thumbnails', 'packages', 'temp', 'streaming']:
             summary_lines.append(fmt(c))
+        if target_bytes:
+            summary_lines = ['Iniciando limpieza programada con objetivo de %s...' % mod.format_size(target_bytes)]
         log(' | '.join(summary_lines))
         xbmcgui.Dialog().notification(addon_name, 'Limpieza programada iniciada', time=3000)
 
-        # Ejecutar limpieza completa
-        result = mod.clean_all(interactive=False, notify=False)
+        # Ejecutar la limpieza en lotes para no competir con el arranque de Kodi
+        slicer = storage.TimeSlicer(gate=gate)
+        if target_bytes:
+            result = mod.free_space_target(target_bytes, interactive=False, notify=False, throttle=slicer)
+        else:
+            # Borrar a partir del manifiesto de la programación (sin volver a escanear);
+            # si ya se consumió en un inicio anterior, clean_all planifica de nuevo
+            manifest = storage.load_manifest()
+            if manifest is not None:
+                log('Usando manifiesto de borrado de %s' % time.strftime('%Y-%m-%d %H:%M', time.localtime(manifest.get('created', 0))))
+            result = mod.clean_all(interactive=False, notify=False, throttle=slicer, manifest=manifest)
+        if slicer.aborted:
+            log('Limpieza programada interrumpida por cierre de Kodi')
+            return False
+        storage.discard_manifest()
         xbmcgui.Dialog().notification(addon_name, 'Limpieza completada: %s liberados' % mod.format_size(result.get('removed_size', 0)), time=4000)
         log('Limpieza programada ejecutada: %d archivos, %s liberados' % (
             result.get('removed_count', 0),
             mod.format_size(result.get('removed_size', 0))
         ))
+        return True
     except Exception as e:
+        if slicer is not None and slicer.aborted:
+            log('Limpieza programada interrumpida por cierre de Kodi: %s' % str(e))
+            return False
         log('Error en limpieza programada: %s' % str(e))
         xbmcgui.Dialog().ok(addon_name, 'Error en limpieza programada: %s' % str(e))
+    # Un error no es una interrupción: la programación se consume igual (y el
+    # manifiesto, que puede ser la causa) para no repetir el aviso en cada inicio
+    storage.discard_manifest()
+    return True
+
+
+def run_scheduled_clean():
+    """Trabajo de la cola: limpieza programada y, si no es repetitiva, retirar la programación."""
+    try:
+        with open(schedule_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        log('Error leyendo programación: %s' % str(e))
+        return
+    if not data.get('scheduled'):
+        return
+    completed = run_clean()
+    # Si no es repetitivo, desactivar para próximos inicios (salvo si Kodi la interrumpió)
+    if completed and not data.get('repeat', False):
+        try:
+            os.remove(schedule_path)
+        except Exception:
+            pass
 
 
 class StartupMonitor(KodiMonitorBase):
@@ -104,10 +177,247 @@ class StartupMonitor(KodiMonitorBase):
     def onSettingsChanged(self):
         pass
 
+class PreScanScheduler(object):
+    """Programa el pre-escaneo de tamaños y lo lanza desde el bucle del servicio.
+
+    En el primer pre-escaneo arranca además el seguimiento en vivo (inotify o
+    sondeo) de caché, Thumbnails, temp y cachepath; a partir de ahí esas
+    categorías no se vuelven a escanear y sus contadores se vuelcan a la caché
+    de tamaños cada WATCH_PUBLISH_SECONDS.
+    """
+
+    def __init__(self):
+        self.due_at = None
+        self.size_watcher = None
+        self.watcher_started = False
+        self._publish_pending = False
+        self._last_publish = 0.0
+
+    def request(self, delay):
+        self.due_at = time.time() + delay
+
+    def run_if_due(self):
+        if self.due_at is None or time.time() < self.due_at:
+            return False
+        if gate.is_busy():
+            # Se reprograma al parar la reproducción
+            self.due_at = None
+            return False
+        self.due_at = None
+        if not self.watcher_started:
+            self.watcher_started = True
+            self.size_watcher = start_size_watcher()
+        run_prescan(skip=list(self.size_watcher.totals()) if self.size_watcher is not None else ())
+        return True
+
+    def track(self):
+        """Atiende los eventos del seguimiento en vivo; durante la reproducción solo los acumula."""
+        if self.size_watcher is None:
+            return
+        try:
+            if self.size_watcher.update(flush=not gate.is_busy()):
+                self._publish_pending = True
+            if self._publish_pending and time.time() - self._last_publish >= WATCH_PUBLISH_SECONDS:
+                storage.save_size_cache(self.size_watcher.totals(), merge=True)
+                self._publish_pending = False
+                self._last_publish = time.time()
+        except Exception as e:
+            log('Error en el seguimiento de tamaños: %s' % str(e))
+
+    def close(self):
+        if self.size_watcher is not None:
+            self.size_watcher.close()
+            self.size_watcher = None
+
+
+class FreeSpaceGuardian(object):
+    """Mide cada FREE_SPACE_CHECK_SECONDS el espacio libre y encola la expulsión si baja del suelo.
+
+    La medida es un statvfs por dispositivo; la expulsión pasa por la cola de
+    mantenimiento, así que con un vídeo en marcha espera a que termine. Si tras
+    expulsar un dispositivo sigue bajo la marca alta, no se insiste cada
+    minuto: la espera se duplica hasta FREE_SPACE_MAX_BACKOFF_SECONDS, salvo
+    que su espacio libre cambie en FREE_SPACE_RETRY_DELTA_MB.
+    """
+
+    def __init__(self):
+        self._last_check = 0.0
+        self._low = ()
+        self._backoff = 0
+        self._retry_at = 0.0
+        # Espacio libre de cada dispositivo al terminar la última expulsión que no llegó
+        self._free_after = {}
+
+    def check(self):
+        if time.time() - self._last_check < FREE_SPACE_CHECK_SECONDS:
+            return
+        self._last_check = time.time()
+        try:
+            mod = get_default_module()
+            low = mod.find_low_space_devices()
+        except Exception as e:
+            log('Error midiendo el espacio libre: %s' % str(e))
+            return
+        paths = tuple(path for path, _ in low)
+        if low and paths != self._low:
+            log('Espacio libre bajo: %s' % ', '.join(
+                '%s (%s)' % (path, mod.format_size(free)) for path, free in low))
+        self._low = paths
+        if not low:
+            if self._backoff:
+                log('Espacio libre recuperado: el guardián vuelve a comprobar cada %ds' % FREE_SPACE_CHECK_SECONDS)
+            self._backoff = 0
+            self._free_after = {}
+            return
+        if self._backoff and time.time() < self._retry_at and not self._free_changed(low):
+            return
+        jobs.submit('Guardián de espacio libre', self.run, mod)
+
+    def _free_changed(self, low):
+        delta = FREE_SPACE_RETRY_DELTA_MB * 1024 * 1024
+        return any(path not in self._free_after or abs(free - self._free_after[path]) >= delta
+                   for path, free in low)
+
+    def run(self, mod):
+        slicer = storage.TimeSlicer(gate=gate)
+        result = mod.guard_free_space(throttle=slicer)
+        if result.get('cancelled') or slicer.aborted:
+            return result
+        _, high_water = mod.get_free_space_thresholds()
+        short = []
+        for path in self._low:
+            free = storage.free_space(path)
+            if free is not None and free < high_water:
+                short.append((path, free))
+        if not short:
+            self._backoff = 0
+            self._free_after = {}
+            return result
+        if not self._backoff:
+            log('Objetivo de espacio libre (%s) inalcanzable: %s; el espacio lo ocupa algo que el addon no gestiona. '
+                'Se reintentará con espera creciente o si el espacio libre cambia en %d MB' % (
+                    mod.format_size(high_water),
+                    ', '.join('%s (%s)' % (path, mod.format_size(free)) for path, free in short),
+                    FREE_SPACE_RETRY_DELTA_MB))
+        self._backoff = min(max(self._backoff * 2, FREE_SPACE_CHECK_SECONDS * 2), FREE_SPACE_MAX_BACKOFF_SECONDS)
+        self._retry_at = time.time() + self._backoff
+        self._free_after = dict(short)
+        return result
+
+
+class TrashPurger(object):
+    """Vacía en segundo plano las papeleras de la limpieza instantánea.
+
+    La primera comprobación retoma lo que quedó de un inicio anterior; el
+    borrado pasa por la cola de mantenimiento y por lotes (TimeSlicer), así
+    que se pausa con la reproducción y se retoma si Kodi se cierra a medias.
+    Solo se encola cuando hay entradas nuevas o vence la espera de una que
+    falló: esas se reintentan con espera creciente (TRASH_RETRY_SECONDS,
+    duplicada en cada fallo hasta TRASH_MAX_BACKOFF_SECONDS).
+    """
+
+    def __init__(self):
+        self._last_check = 0.0
+        self._first = True
+        # entrada -> (reintento, espera) de las que no se pudieron borrar
+        self._failed = {}
+
+    def check(self):
+        if time.time() - self._last_check < TRASH_CHECK_SECONDS:
+            return
+        self._last_check = time.time()
+        pending = storage.pending_trash()
+        if pending and self._first:
+            log('Papelera pendiente de un inicio anterior: %d carpetas' % len(pending))
+        self._first = False
+        self._failed = dict((entry, state) for entry, state in self._failed.items() if entry in pending)
+        now = time.time()
+        due = [entry for entry in pending if entry not in self._failed or self._failed[entry][0] <= now]
+        if due:
+            jobs.submit('Vaciado de papelera', self.purge, due)
+
+    def purge(self, entries):
+        result = run_trash_purge(entries)
+        failed = set(result['trash_failed'])
+        for entry in entries:
+            if entry not in failed:
+                self._failed.pop(entry, None)
+                continue
+            delay = self._failed[entry][1] * 2 if entry in self._failed else TRASH_RETRY_SECONDS
+            delay = min(delay, TRASH_MAX_BACKOFF_SECONDS)
+            if entry not in self._failed:
+                log('No se pudo vaciar %s de la papelera: se reintentará con espera creciente' % entry)
+            self._failed[entry] = (time.time() + delay, delay)
+        return result
+
+
+def run_trash_purge(entries=None):
+    started = time.time()
+    probe = storage.FreeSpaceProbe(storage.load_trash_roots())
+    slicer = storage.TimeSlicer(gate=gate)
+    result = storage.purge_trash(progress=storage.ProgressReporter(throttle=slicer), entries=entries)
+    result['free_space_gained'] = probe.gained()
+    log('Papelera vaciada%s en %.1fs: %d archivos, %s%s' % (
+        ' (interrumpido)' if result['cancelled'] else '', time.time() - started,
+        result['removed_count'], storage.describe_freed(result, result['free_space_gained']),
+        '; %d carpetas sin poder borrar' % len(result['trash_failed']) if result['trash_failed'] else ''))
+    return result
+
+
+def is_prescan_enabled():
+    try:
+        return addon.getSettingBool('background_prescan')
+    except Exception:
+        return True
+
+
+def is_live_tracking_enabled():
+    try:
+        return addon.getSettingBool('live_size_tracking')
+    except Exception:
+        return True
+
+
+def start_size_watcher():
+    if not is_prescan_enabled() or not is_live_tracking_enabled():
+        return None
+    try:
+        mod = get_default_module()
+        paths = mod.get_kodi_paths()
+        categories = {
+            'cache': paths.get('cache', ''),
+            'thumbnails': paths.get('thumbnails', ''),
+            'temp': paths.get('temp', ''),
+        }
+        cachepath = mod.buffering_module.read_cachepath_from_config(paths.get('advancedsettings', ''))
+        if cachepath and os.path.isdir(cachepath):
+            categories['cachepath'] = cachepath
+        size_watcher = priority.run_maintenance('Seguimiento de tamaños', watcher.SizeWatcher, categories)
+        storage.save_size_cache(size_watcher.totals(), merge=True)
+        return size_watcher
+    except Exception as e:
+        log('No se pudo iniciar el seguimiento de tamaños: %s' % str(e))
+    return None
+
+
+def run_prescan(skip=()):
+    if not is_prescan_enabled():
+        return
+    try:
+        mod = get_default_module()
+        started = time.time()
+        results = priority.run_maintenance('Pre-escaneo de tamaños', mod.refresh_category_sizes, skip=skip)
+        log('Pre-escaneo de tamaños (%.2fs): %s' % (time.time() - started, ', '.join(
+            '%s %s' % (label, mod.format_size(stats.get('size', 0))) for label, stats in results.items())))
+    except Exception as e:
+        log('Error en el pre-escaneo de tamaños: %s' % str(e))
+
+
 class PlaybackMonitor(KodiPlayerBase):
-    def __init__(self, mod):
+    def __init__(self, mod, prescan=None):
         super().__init__()
         self.mod = mod
+        self.prescan = prescan
         self.was_playing = False
 
     def onAVStart(self):
@@ -118,20 +428,60 @@ class PlaybackMonitor(KodiPlayerBase):
 
     def onPlayBackStopped(self):
         self._maybe_autoclean()
+        self._schedule_prescan()
 
     def onPlayBackEnded(self):
         self._maybe_autoclean()
+        self._schedule_prescan()
+
+    def _schedule_prescan(self):
+        if self.prescan is not None:
+            self.prescan.request(PRESCAN_AFTER_PLAYBACK_DELAY)
 
     def _maybe_autoclean(self):
         try:
             if self.mod.get_usb_autoclean_enabled():
                 paths = self.mod.get_kodi_paths()
                 cfg = paths.get('advancedsettings', '')
-                self.mod.clean_usb_cachepath(cfg, silent=True)
+                # Se encola: lo ejecuta el bucle del servicio, fuera del hilo de callbacks del reproductor
+                jobs.submit('Auto-limpieza cache USB', self.mod.clean_usb_cachepath, cfg, silent=True,
+                            throttle=storage.TimeSlicer(gate=gate))
         except Exception as e:
             log('Auto-limpieza cache USB falló: %s' % str(e))
 
 
+def run_orphan_check():
+    try:
+        if not addon.getSettingBool('orphan_check_on_start'):
+            return
+    except Exception:
+        return
+    try:
+        mod = get_default_module()
+        result = mod.clean_thumbnail_orphans(interactive=False, notify=False, throttle=storage.TimeSlicer(gate=gate))
+        log('Miniaturas huérfanas: %d archivos (%s), %d filas' % (
+            result.get('removed_count', 0), mod.format_size(result.get('removed_size', 0)), result.get('db_rows', 0)))
+    except Exception as e:
+        log('Error eliminando miniaturas huérfanas: %s' % str(e))
+
+
+def build_idle_maintenance():
+    """Tareas de la ventana de inactividad: desalojo por cuotas, miniaturas huérfanas y VACUUM."""
+    idle = maintenance.IdleMaintenance(gate)
+    try:
+        mod = get_default_module()
+    except Exception as e:
+        log('Mantenimiento en inactividad no disponible: %s' % str(e))
+        return idle
+    idle.add('Desalojo de cachés', lambda throttle: mod.evict_caches(
+        interactive=False, notify=False, throttle=throttle))
+    idle.add('Barrido de miniaturas huérfanas', lambda throttle: mod.clean_thumbnail_orphans(
+        interactive=False, notify=False, throttle=throttle))
+    idle.add('Compactación de bases de datos', lambda throttle: mod.vacuum_databases(
+        interactive=False, throttle=throttle))
+    return idle
+
+
 def run_auto_update_check():
     if not updater.is_auto_update_enabled():
         log('Comprobacion automatica de actualizaciones desactivada')
@@ -186,31 +536,26 @@ if __name__ == '__main__':
             if monitor.abortRequested():
                 break
             xbmc.sleep(250)
+        prescan = PreScanScheduler()
+        prescan.request(PRESCAN_STARTUP_DELAY)
+        idle = build_idle_maintenance()
+        guardian = FreeSpaceGuardian()
+        trash = TrashPurger()
         
-        # Comprobar si hay limpieza programada
+        # Comprobar si hay limpieza programada; los trabajos esperan si ya hay algo reproduciéndose
         if os.path.exists(schedule_path):
-            try:
-                with open(schedule_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                if data.get('scheduled'):
-                    run_clean()
-                    # Si no es repetitivo, desactivar para próximos inicios
-                    if not data.get('repeat', False):
-                        try:
-                            os.remove(schedule_path)
-                        except Exception:
-                            pass
-            except Exception as e:
-                log('Error leyendo programación: %s' % str(e))
+            jobs.submit('Limpieza programada', run_scheduled_clean)
         else:
             log('Sin limpieza programada')
 
-        run_auto_update_check()
+        jobs.submit('Miniaturas huérfanas', run_orphan_check)
+        jobs.submit('Actualizaciones', run_auto_update_check)
+        jobs.run_pending()
 
         # Cargar módulo principal para utilidades y activar monitor de reproducción
         try:
             mod = get_default_module()
-            player = PlaybackMonitor(mod)
+            player = PlaybackMonitor(mod, prescan)
         except Exception as e:
             log('No se pudo iniciar PlaybackMonitor: %s' % str(e))
 
@@ -430,6 +775,13 @@ if __name__ == '__main__':
 
         # Bucle de servicio
         while not monitor.waitForAbort(2):
-            pass
+            guardian.check()
+            trash.check()
+            jobs.run_pending()
+            prescan.run_if_due()
+            prescan.track()
+            if not jobs.pending:
+                idle.run_if_idle()
+        prescan.close()
     except Exception as e:
         log('Error en servicio: %s' % str(e))
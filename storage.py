@@ -0,0 +1,1954 @@
+import contextlib
+import errno
+import heapq
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import xbmc
+import xbmcaddon
+import xbmcvfs
+
+
+# Motor de escaneo compartido por default.py, buffering.py y service.py.
+# No debe importar default ni buffering para evitar dependencias circulares.
+INDEX_FILENAME = 'size_index.json'
+INDEX_VERSION = 2
+# Un directorio solo cambia de mtime al añadir/borrar entradas, no al reescribir
+# un archivo existente: forzar un reescaneo completo de vez en cuando.
+INDEX_FULL_RESCAN_SECONDS = 6 * 3600
+
+# Manifiesto de borrado (addon_data/clean_manifest.json): lo escribe la
+# planificación en seco y lo consume la limpieza real
+MANIFEST_FILENAME = 'clean_manifest.json'
+MANIFEST_VERSION = 1
+
+# Tamaños por categoría que el servicio pre-escanea en segundo plano
+# (addon_data/category_sizes.json) para que los menús no tengan que esperar
+SIZE_CACHE_FILENAME = 'category_sizes.json'
+SIZE_CACHE_VERSION = 1
+
+# Papelera de la limpieza instantánea: cada carpeta se renombra a una papelera
+# del mismo sistema de archivos y el servicio la vacía después en segundo
+# plano. addon_data/trash.json registra las papeleras usadas para retomar en
+# el siguiente inicio lo que quedó a medias.
+TRASH_DIRNAME = '.aspirando-trash'
+TRASH_REGISTRY_FILENAME = 'trash.json'
+TRASH_REGISTRY_VERSION = 1
+
+# Archivos abiertos por Kodi (el cachepath del vídeo que se está cargando, el
+# timeshift del PVR...): el motor de borrado los salta. En Linux se identifican
+# por (dispositivo, inodo) con /proc/self/fd (el addon corre dentro del proceso
+# de Kodi); sin /proc se saltan los modificados en los últimos segundos.
+PROC_SELF_FD = '/proc/self/fd'
+OPEN_FILE_RECENT_SECONDS = 5
+
+# Presupuesto por defecto de cada lote del borrado en segundo plano
+BACKGROUND_BATCH_ENTRIES = 200
+BACKGROUND_BATCH_MS = 50
+BACKGROUND_BATCH_PAUSE = 0.1
+
+# Borrado en paralelo para sistemas de archivos con unlink lento (exFAT/vfat
+# en USB, SMB, FUSE de Android): los unlink de cada directorio se reparten en
+# un pool acotado. Con el ajuste en automático se miden los primeros
+# UNLINK_PROBE_FILES borrados: por debajo de UNLINK_SLOW_SECONDS por archivo
+# se sigue en serie; por encima, un hilo más por cada UNLINK_SLOW_SECONDS.
+UNLINK_WORKER_OPTIONS = {
+    '0': None,
+    '1': 1,
+    '2': 2,
+    '3': 4,
+    '4': 8,
+}
+MAX_UNLINK_WORKERS = 8
+UNLINK_PROBE_FILES = 16
+UNLINK_SLOW_SECONDS = 0.0005
+PARALLEL_UNLINK_MIN_FILES = 32
+
+# Valores del ajuste scan_workers_per_device (índice del select -> hilos)
+SCAN_WORKER_OPTIONS = {
+    '0': 1,
+    '1': 2,
+    '2': 4,
+    '3': 8,
+}
+
+addon = xbmcaddon.Addon()
+addon_name = addon.getAddonInfo('name')
+addon_id = addon.getAddonInfo('id')
+
+try:
+    addon_data_dir = xbmcvfs.translatePath('special://profile/addon_data/%s' % addon_id)
+except Exception:
+    addon_data_dir = os.path.expanduser('~/.kodi/userdata/addon_data/%s' % addon_id)
+
+index_path = os.path.join(addon_data_dir, INDEX_FILENAME)
+manifest_path = os.path.join(addon_data_dir, MANIFEST_FILENAME)
+size_cache_path = os.path.join(addon_data_dir, SIZE_CACHE_FILENAME)
+trash_registry_path = os.path.join(addon_data_dir, TRASH_REGISTRY_FILENAME)
+
+
+def log(message, level=xbmc.LOGINFO):
+    xbmc.log('[%s][storage] %s' % (addon_name, message), level)
+
+
+def format_size(bytes_size):
+    if bytes_size < 1024:
+        return "%d B" % bytes_size
+    elif bytes_size < 1024 * 1024:
+        return "%.1f KB" % (bytes_size / 1024.0)
+    elif bytes_size < 1024 * 1024 * 1024:
+        return "%.1f MB" % (bytes_size / (1024.0 * 1024.0))
+    else:
+        return "%.1f GB" % (bytes_size / (1024.0 * 1024.0 * 1024.0))
+
+
+def empty_stats():
+    """Estructura de resultados de un escaneo: bytes, archivos, directorios y bloques de 512 bytes."""
+    return {'size': 0, 'files': 0, 'dirs': 0, 'blocks': 0}
+
+
+def merge_stats(target, other):
+    """Acumula los contadores de `other` sobre `target` y devuelve `target`."""
+    for key in ('size', 'files', 'dirs', 'blocks'):
+        target[key] = target.get(key, 0) + other.get(key, 0)
+    if other.get('newest') is not None and (target.get('newest') is None or other['newest'] > target['newest']):
+        target['newest'] = other['newest']
+    if other.get('oldest') is not None and (target.get('oldest') is None or other['oldest'] < target['oldest']):
+        target['oldest'] = other['oldest']
+    return target
+
+
+def _stat_blocks(st):
+    blocks = getattr(st, 'st_blocks', None)
+    if blocks is None:
+        # Windows no expone st_blocks: aproximar con el tamaño lógico
+        return (st.st_size + 511) // 512
+    return blocks
+
+
+def allocated_bytes(blocks):
+    """Bytes ocupados en disco a partir de bloques de 512 bytes (st_blocks)."""
+    return int(blocks or 0) * 512
+
+
+# Tamaño lógico (st_size) frente a ocupado (st_blocks*512): un archivo disperso
+# ocupa menos de lo que mide, uno pequeño en vfat/exFAT ocupa un clúster entero
+# y un archivo con varios enlaces duros solo se cuenta una vez por (st_dev, st_ino).
+def _link_key(st):
+    """Clave (st_dev, st_ino) de un archivo con más de un enlace duro, o None."""
+    if getattr(st, 'st_nlink', 1) > 1 and st.st_ino:
+        return (st.st_dev, st.st_ino)
+    return None
+
+
+def _count_file(stats, st, seen):
+    """Suma un archivo a `stats`; `seen` guarda los inodos con varios enlaces ya contados."""
+    stats['files'] += 1
+    key = _link_key(st)
+    if key is not None:
+        if key in seen:
+            return
+        seen.add(key)
+    stats['size'] += st.st_size
+    stats['blocks'] += _stat_blocks(st)
+
+
+def _count_removed(result, st):
+    """Contabiliza un archivo borrado a partir del lstat previo al unlink.
+
+    El tamaño lógico se suma una vez por inodo; los bloques solo cuando se
+    borra el último enlace, que es cuando el sistema de archivos los libera.
+    """
+    result['removed_count'] += 1
+    linked = result.get('linked_inodes')
+    if getattr(st, 'st_nlink', 1) > 1:
+        if linked is None:
+            linked = result['linked_inodes'] = set()
+        key = (st.st_dev, st.st_ino)
+        if key not in linked:
+            linked.add(key)
+            result['removed_size'] += st.st_size
+        return
+    if linked is None or (st.st_dev, st.st_ino) not in linked:
+        result['removed_size'] += st.st_size
+    result['removed_blocks'] += _stat_blocks(st)
+
+
+# Recorrido y borrado relativos a descriptores de directorio (fstatat, unlinkat,
+# unlinkat(AT_REMOVEDIR)): el kernel no vuelve a resolver la ruta completa en
+# cada llamada, lo que es caro en /storage de Android (FUSE) y en USB lentos.
+# Donde la plataforma no lo permite (Windows) se usan rutas completas.
+FD_TRAVERSAL_SUPPORTED = (
+    hasattr(os, 'O_DIRECTORY')
+    and os.scandir in os.supports_fd
+    and os.open in os.supports_dir_fd
+    and os.stat in os.supports_dir_fd
+    and os.unlink in os.supports_dir_fd
+    and os.rmdir in os.supports_dir_fd
+)
+# Se puede desactivar en tiempo de ejecución (p. ej. desde los benchmarks)
+use_fd_traversal = FD_TRAVERSAL_SUPPORTED
+_DIR_OPEN_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_CLOEXEC', 0)
+# Los subdirectorios se abren sin seguir enlaces: un enlace colado entre el
+# listado y la apertura falla en lugar de sacar el recorrido fuera del árbol
+_SUBDIR_OPEN_FLAGS = _DIR_OPEN_FLAGS | getattr(os, 'O_NOFOLLOW', 0)
+
+
+def _open_dir(path):
+    """Descriptor de una carpeta raíz (siguiendo enlaces, como os.scandir), o None."""
+    if not use_fd_traversal:
+        return None
+    try:
+        return os.open(path, _DIR_OPEN_FLAGS)
+    except OSError:
+        return None
+
+
+def _walk_fd(root_fd, folder_path):
+    """Recorre en profundidad un árbol a partir del descriptor de su raíz.
+
+    Genera (rel_path, dir_fd, dir_stat, archivos, subdirs) por directorio, con
+    `archivos` como lista de (nombre, stat). Solo hay abiertos tantos
+    descriptores como niveles de profundidad; el de la raíz lo cierra el
+    llamante.
+    """
+    stack = []
+    fd, rel_path = root_fd, ''
+    try:
+        while True:
+            files = []
+            subdirs = []
+            dir_stat = None
+            try:
+                dir_stat = os.fstat(fd)
+                with os.scandir(fd) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.name)
+                                continue
+                            files.append((entry.name, entry.stat(follow_symlinks=False)))
+                        except OSError:
+                            continue
+            except OSError as e:
+                log('Error recorriendo %s: %s' % (os.path.join(folder_path, rel_path), str(e)))
+            if dir_stat is not None:
+                yield rel_path, fd, dir_stat, files, subdirs
+            stack.append((fd, rel_path, subdirs[::-1]))
+            fd = None
+            while stack and fd is None:
+                parent_fd, parent_rel, pending = stack[-1]
+                if not pending:
+                    stack.pop()
+                    if parent_fd != root_fd:
+                        os.close(parent_fd)
+                    continue
+                name = pending.pop()
+                child_rel = os.path.join(parent_rel, name) if parent_rel else name
+                try:
+                    fd = os.open(name, _SUBDIR_OPEN_FLAGS, dir_fd=parent_fd)
+                    rel_path = child_rel
+                except OSError as e:
+                    log('Error recorriendo %s: %s' % (os.path.join(folder_path, child_rel), str(e)))
+            if fd is None:
+                return
+    finally:
+        if fd is not None and fd != root_fd and all(fd != item[0] for item in stack):
+            os.close(fd)
+        for parent_fd, _, _ in stack:
+            if parent_fd != root_fd:
+                os.close(parent_fd)
+
+
+def _scan_tree_fd(root_fd, folder_path):
+    stats = empty_stats()
+    seen = set()
+    for _, _, _, files, subdirs in _walk_fd(root_fd, folder_path):
+        stats['dirs'] += len(subdirs)
+        for _, st in files:
+            _count_file(stats, st, seen)
+    return stats
+
+
+def scan_tree(folder_path, on_file=None):
+    """Recorre una carpeta una sola vez con os.scandir.
+
+    Usa el stat cacheado de cada DirEntry para obtener tamaño y número de
+    archivos en la misma pasada. Los enlaces simbólicos se cuentan como
+    archivos y no se siguen; los enlaces duros suman su tamaño una sola vez.
+    `on_file(entry, st)` se invoca para cada archivo (en ese caso se recorre
+    por rutas, porque el llamante usa entry.path).
+    """
+    stats = empty_stats()
+    if not folder_path or not os.path.isdir(folder_path):
+        return stats
+    if on_file is None:
+        root_fd = _open_dir(folder_path)
+        if root_fd is not None:
+            try:
+                return _scan_tree_fd(root_fd, folder_path)
+            finally:
+                os.close(root_fd)
+    seen = set()
+    pending = [folder_path]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stats['dirs'] += 1
+                            pending.append(entry.path)
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    _count_file(stats, st, seen)
+                    if on_file is not None:
+                        on_file(entry, st)
+        except OSError as e:
+            log('Error recorriendo %s: %s' % (current, str(e)))
+    return stats
+
+
+def scan_path(path):
+    """Escanea una ruta que puede ser archivo o carpeta."""
+    try:
+        if not path or not os.path.exists(path):
+            return empty_stats()
+        if os.path.isdir(path):
+            return scan_tree(path)
+        st = os.stat(path)
+        stats = empty_stats()
+        stats['size'] = st.st_size
+        stats['files'] = 1
+        stats['blocks'] = _stat_blocks(st)
+        return stats
+    except Exception as e:
+        log('Error obteniendo estadísticas de %s: %s' % (path, str(e)))
+    return empty_stats()
+
+
+# Índice persistente de tamaños por directorio (addon_data/size_index.json).
+# Cada directorio guarda sus agregados propios (sin subdirectorios) junto con
+# el mtime e inodo con el que se calcularon; si no cambian, no se vuelve a listar.
+def _read_json(path, default=None):
+    if default is None:
+        default = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as file_handle:
+            return json.load(file_handle)
+    except Exception:
+        return default
+
+
+def _write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as file_handle:
+        json.dump(data, file_handle, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_index():
+    data = _read_json(index_path, {})
+    if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+        return {'version': INDEX_VERSION, 'roots': {}}
+    data.setdefault('roots', {})
+    return data
+
+
+def save_index(index):
+    try:
+        _write_json_atomic(index_path, index)
+    except Exception as e:
+        log('No se pudo guardar el índice de tamaños: %s' % str(e))
+
+
+def _index_key(folder_path):
+    return os.path.normcase(os.path.abspath(folder_path))
+
+
+def _scan_directory_record(dir_path, dir_stat):
+    """Lista un único directorio (sin recursión) y devuelve su registro para el índice."""
+    record = {
+        'mtime': dir_stat.st_mtime_ns,
+        'ino': dir_stat.st_ino,
+        'size': 0,
+        'files': 0,
+        'blocks': 0,
+        'newest': None,
+        'oldest': None,
+        'subdirs': [],
+        # Archivos con varios enlaces duros: [st_dev, st_ino, tamaño, bloques],
+        # fuera de size/blocks para deduplicarlos al sumar el árbol
+        'links': [],
+    }
+    dir_fd = _open_dir(dir_path)
+    try:
+        with os.scandir(dir_fd if dir_fd is not None else dir_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        record['subdirs'].append(entry.name)
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                record['files'] += 1
+                key = _link_key(st)
+                if key is not None:
+                    record['links'].append([key[0], key[1], st.st_size, _stat_blocks(st)])
+                else:
+                    record['size'] += st.st_size
+                    record['blocks'] += _stat_blocks(st)
+                mtime = st.st_mtime
+                if record['newest'] is None or mtime > record['newest']:
+                    record['newest'] = mtime
+                if record['oldest'] is None or mtime < record['oldest']:
+                    record['oldest'] = mtime
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+    return record
+
+
+def _open_root(index, folder_path):
+    """Prepara el estado del índice para escanear una raíz (posiblemente en varios hilos)."""
+    key = _index_key(folder_path)
+    root_entry = index['roots'].get(key) or {}
+    now = time.time()
+    if now - root_entry.get('full_scan', 0) > INDEX_FULL_RESCAN_SECONDS:
+        old_dirs = {}
+        full_scan = now
+    else:
+        old_dirs = root_entry.get('dirs', {})
+        full_scan = root_entry.get('full_scan', now)
+    return {
+        'path': folder_path,
+        'key': key,
+        'old_dirs': old_dirs,
+        # Cada hilo escribe claves distintas: las asignaciones en dict son atómicas con el GIL
+        'new_dirs': {},
+        # Inodos con varios enlaces ya sumados en esta raíz (compartido entre hilos)
+        'links': {},
+        'full_scan': full_scan,
+    }
+
+
+def _close_root(index, root):
+    index['roots'][root['key']] = {
+        'dirs': root['new_dirs'],
+        'full_scan': root['full_scan'],
+        'updated': time.time(),
+    }
+
+
+def _walk_cached(root, start_rel='', recursive=True):
+    """Recorre `start_rel` dentro de la raíz usando el índice.
+
+    Devuelve (stats, subdirs) donde `subdirs` son las rutas relativas de los
+    subdirectorios directos de `start_rel`; con recursive=False no se desciende
+    en ellos, para que el coordinador los reparta entre hilos.
+    """
+    stats = empty_stats()
+    stats['newest'] = None
+    stats['oldest'] = None
+    start_subdirs = []
+    old_dirs = root['old_dirs']
+    new_dirs = root['new_dirs']
+    base = root['path']
+    pending = [start_rel]
+    while pending:
+        rel_path = pending.pop()
+        current = os.path.join(base, rel_path) if rel_path else base
+        try:
+            dir_stat = os.stat(current)
+            record = old_dirs.get(rel_path)
+            if not record or record.get('mtime') != dir_stat.st_mtime_ns or record.get('ino') != dir_stat.st_ino:
+                record = _scan_directory_record(current, dir_stat)
+                stats['rescanned'] = stats.get('rescanned', 0) + 1
+        except OSError as e:
+            log('Error recorriendo %s: %s' % (current, str(e)))
+            continue
+        new_dirs[rel_path] = record
+        stats['files'] += record['files']
+        stats['size'] += record['size']
+        stats['blocks'] += record['blocks']
+        stats['dirs'] += len(record['subdirs'])
+        for dev, ino, size, blocks in record.get('links', ()):
+            # setdefault es atómico con el GIL: solo un hilo suma cada inodo
+            token = object()
+            if root['links'].setdefault((dev, ino), token) is token:
+                stats['size'] += size
+                stats['blocks'] += blocks
+        merge_stats(stats, {'newest': record['newest'], 'oldest': record['oldest']})
+        children = [os.path.join(rel_path, name) if rel_path else name for name in record['subdirs']]
+        if rel_path == start_rel:
+            start_subdirs = children
+            if not recursive:
+                break
+        pending.extend(children)
+    return stats, start_subdirs
+
+
+def scan_tree_cached(folder_path, index=None):
+    """Como scan_tree, pero reutilizando los agregados del índice persistente.
+
+    Solo se listan los directorios cuyo mtime o inodo ha cambiado desde el
+    último escaneo; del resto basta un stat. Añade 'newest' y 'oldest' (mtime
+    de archivo más reciente/antiguo) al resultado. Si no se pasa `index`, se
+    carga y se guarda aquí mismo; si se pasa, el llamante debe guardarlo.
+    """
+    if not folder_path or not os.path.isdir(folder_path):
+        stats = empty_stats()
+        stats['newest'] = None
+        stats['oldest'] = None
+        return stats
+
+    own_index = index is None
+    if own_index:
+        index = load_index()
+    root = _open_root(index, folder_path)
+    stats, _ = _walk_cached(root)
+    _close_root(index, root)
+    if own_index:
+        save_index(index)
+    log('Índice de %s: %d/%d directorios reescaneados' % (
+        folder_path, stats.pop('rescanned', 0), len(root['new_dirs'])), xbmc.LOGDEBUG)
+    return stats
+
+
+# Coordinador de escaneo en paralelo: un pool de hilos por dispositivo (st_dev),
+# de modo que las raíces en discos distintos avanzan a la vez y el tiempo total
+# queda acotado por el dispositivo más lento.
+def _get_setting_value(setting_id, default=''):
+    try:
+        value = addon.getSetting(setting_id)
+    except Exception:
+        value = ''
+    if value in ('', None):
+        return default
+    return str(value)
+
+
+def _get_setting_int(setting_id, default=0, minimum=1):
+    raw_value = _get_setting_value(setting_id, '')
+    try:
+        value = int(float(raw_value))
+    except (TypeError, ValueError):
+        return default
+    return value if value >= minimum else default
+
+
+def get_scan_workers_per_device():
+    raw_value = _get_setting_value('scan_workers_per_device', '1')
+    if raw_value in SCAN_WORKER_OPTIONS:
+        return SCAN_WORKER_OPTIONS[raw_value]
+    if raw_value.isdigit() and int(raw_value) > 0:
+        return int(raw_value)
+    return SCAN_WORKER_OPTIONS['1']
+
+
+def _device_of(path):
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+
+def get_unlink_workers():
+    """Hilos de borrado del ajuste unlink_workers; None = automático (sonda de latencia)."""
+    return UNLINK_WORKER_OPTIONS.get(_get_setting_value('unlink_workers', '0'))
+
+
+def scan_roots_parallel(categories, index=None, workers_per_device=None):
+    """Escanea varias categorías a la vez.
+
+    `categories` es un dict etiqueta -> lista de rutas (archivos o carpetas).
+    Cada carpeta se divide en su nivel superior más un trabajo por
+    subdirectorio (p. ej. los 16 fragmentos hexadecimales de Thumbnails).
+    Devuelve un dict etiqueta -> stats, con el mismo formato que scan_tree_cached.
+    """
+    own_index = index is None
+    if own_index:
+        index = load_index()
+    workers = max(1, int(workers_per_device or get_scan_workers_per_device()))
+    results = {}
+    executors = {}
+    roots = []
+    futures = {}
+    started = time.time()
+
+    def executor_for(path):
+        device = _device_of(path)
+        executor = executors.get(device)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='aspirando-scan')
+            executors[device] = executor
+        return executor
+
+    try:
+        for label, paths in categories.items():
+            stats = empty_stats()
+            stats['newest'] = None
+            stats['oldest'] = None
+            results[label] = stats
+            for path in paths or []:
+                if not path or not os.path.exists(path):
+                    continue
+                if not os.path.isdir(path):
+                    merge_stats(stats, scan_path(path))
+                    continue
+                root = _open_root(index, path)
+                roots.append(root)
+                executor = executor_for(path)
+                future = executor.submit(_walk_cached, root, '', False)
+                futures[future] = (label, root, executor)
+
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                label, root, executor = futures.pop(future)
+                try:
+                    stats, subdirs = future.result()
+                except Exception as e:
+                    log('Error escaneando %s: %s' % (root['path'], str(e)))
+                    continue
+                stats.pop('rescanned', None)
+                merge_stats(results[label], stats)
+                if executor is None:
+                    # Subárbol completo: sus subdirectorios ya se han recorrido
+                    continue
+                for rel_path in subdirs:
+                    sub_future = executor.submit(_walk_cached, root, rel_path, True)
+                    futures[sub_future] = (label, root, None)
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+
+    for root in roots:
+        _close_root(index, root)
+    if own_index:
+        save_index(index)
+    log('Escaneo paralelo: %d raíces en %d dispositivo(s), %d hilo(s) por dispositivo, %.2fs' % (
+        len(roots), len(executors), workers, time.time() - started))
+    return results
+
+
+# Motor de borrado: una única pasada ascendente que hace stat y unlink de cada
+# entrada, de modo que los contadores son exactos sin recorrer antes el árbol.
+def empty_result():
+    """Resultado de un borrado, compartido por todas las funciones clean_*."""
+    return {
+        'removed_count': 0,
+        'removed_size': 0,
+        'removed_blocks': 0,
+        'removed_dirs': 0,
+        'errors': 0,
+        'cancelled': False,
+    }
+
+
+def merge_result(target, other):
+    for key, value in other.items():
+        if isinstance(value, bool):
+            target[key] = bool(target.get(key)) or value
+        elif isinstance(value, set):
+            target.setdefault(key, set()).update(value)
+        elif isinstance(value, (int, float)):
+            target[key] = target.get(key, 0) + value
+    return target
+
+
+class ProgressReporter(object):
+    """Enlaza el motor de borrado con un DialogProgress de Kodi.
+
+    Calcula el avance con los archivos y bytes procesados frente a los totales
+    del escaneo previo, limita las actualizaciones de la UI a `interval`
+    segundos y comprueba la cancelación en esos mismos instantes.
+    """
+
+    def __init__(self, dialog=None, total_files=0, total_size=0, should_cancel=None, interval=0.25, throttle=None):
+        self.dialog = dialog
+        self.total_files = max(0, int(total_files or 0))
+        self.total_size = max(0, int(total_size or 0))
+        self.should_cancel = should_cancel
+        self.throttle = throttle
+        self.interval = interval
+        self.stage = ''
+        self.cancelled = False
+        self._last_update = 0.0
+
+    def set_stage(self, message):
+        self.stage = message
+        self._last_update = 0.0
+
+    def percent(self, result):
+        if self.total_size > 0:
+            done, total = result['removed_size'], self.total_size
+        else:
+            done, total = result['removed_count'] + result['errors'], self.total_files
+        if total <= 0:
+            return 0
+        return min(100, int(done * 100 / total))
+
+    def tick(self, result):
+        """Devuelve False si el usuario (o `should_cancel`) ha pedido parar."""
+        if self.cancelled:
+            return False
+        if self.throttle is not None and not self.throttle.tick(result):
+            self.cancelled = True
+            return False
+        now = time.time()
+        if now - self._last_update < self.interval:
+            return True
+        self._last_update = now
+        if self.dialog is not None:
+            try:
+                if self.dialog.iscanceled():
+                    self.cancelled = True
+                    return False
+                processed = result['removed_count'] + result['errors']
+                line = '%s\nArchivos: %d de %d\nLiberado: %s de %s' % (
+                    self.stage,
+                    processed,
+                    max(self.total_files, processed),
+                    format_size(result['removed_size']),
+                    format_size(max(self.total_size, result['removed_size'])),
+                )
+                self.dialog.update(self.percent(result), line)
+            except Exception:
+                pass
+        if self.should_cancel is not None and self.should_cancel():
+            self.cancelled = True
+            return False
+        return True
+
+
+class TimeSlicer(object):
+    """Borrado cooperativo para el servicio: lotes de `max_entries` entradas o
+    `max_ms` milisegundos, cediendo a Kodi con Monitor.waitForAbort entre lotes.
+
+    Tiene la misma interfaz `tick(result)` que ProgressReporter, así que puede
+    pasarse directamente como `progress` al motor de borrado. Devuelve False
+    (y el borrado se detiene) en cuanto Kodi pide cerrarse. Con `gate` (un
+    objeto con busy_reason(), p. ej. maintenance.PlaybackGate) el borrado se
+    pone en pausa entre lotes mientras haya algo reproduciéndose; con
+    `should_stop` (callable que devuelve un motivo o None) se detiene del todo.
+    """
+
+    def __init__(self, monitor=None, max_entries=None, max_ms=None, pause=BACKGROUND_BATCH_PAUSE, gate=None,
+                 should_stop=None):
+        self.monitor = monitor
+        self.max_entries = max_entries or _get_setting_int('background_batch_entries', BACKGROUND_BATCH_ENTRIES)
+        self.max_ms = max_ms or _get_setting_int('background_batch_ms', BACKGROUND_BATCH_MS)
+        self.pause = pause
+        self.gate = gate
+        self.should_stop = should_stop
+        self.aborted = False
+        self.stopped = False
+        self.batches = 0
+        self.paused_seconds = 0.0
+        self._count = 0
+        self._batch_start = time.time()
+
+    def _get_monitor(self):
+        if self.monitor is None:
+            self.monitor = xbmc.Monitor()
+        return self.monitor
+
+    def _stop_requested(self):
+        if self.stopped:
+            return True
+        reason = self.should_stop() if self.should_stop is not None else None
+        if reason:
+            self.stopped = True
+            log('Mantenimiento detenido: %s' % reason)
+        return self.stopped
+
+    def checkpoint(self):
+        """Punto seguro antes de un paso que no se puede interrumpir (p. ej. un VACUUM).
+
+        Espera si la puerta está ocupada; devuelve False si hay que parar.
+        """
+        if self._stop_requested():
+            return False
+        return self.wait_idle()
+
+    def wait_idle(self):
+        """Espera a que la puerta de reproducción quede libre. Devuelve False si Kodi se cierra."""
+        if self.aborted:
+            return False
+        if self.gate is None:
+            return True
+        reason = self.gate.busy_reason()
+        if reason is None:
+            return True
+        log('Mantenimiento en pausa: %s' % reason)
+        started = time.time()
+        while reason is not None:
+            if self._get_monitor().waitForAbort(1):
+                self.aborted = True
+                log('Borrado en segundo plano detenido: Kodi se está cerrando')
+                return False
+            reason = self.gate.busy_reason()
+        self.paused_seconds += time.time() - started
+        log('Mantenimiento reanudado tras %.0fs en pausa' % (time.time() - started))
+        self._count = 0
+        self._batch_start = time.time()
+        return True
+
+    def tick(self, result=None):
+        if self.aborted or self.stopped:
+            return False
+        self._count += 1
+        elapsed_ms = (time.time() - self._batch_start) * 1000.0
+        if self._count < self.max_entries and elapsed_ms < self.max_ms:
+            return True
+        self.batches += 1
+        if self._get_monitor().waitForAbort(self.pause):
+            self.aborted = True
+            log('Borrado en segundo plano detenido: Kodi se está cerrando')
+            return False
+        if not self.checkpoint():
+            return False
+        self._count = 0
+        self._batch_start = time.time()
+        return True
+
+
+class OpenFileGuard(object):
+    """Conjunto de archivos que Kodi tiene abiertos, tomado una vez por limpieza."""
+
+    def __init__(self, fd_dir=PROC_SELF_FD, recent_seconds=OPEN_FILE_RECENT_SECONDS):
+        self.keys = None
+        self.paths = []
+        self.recent_cutoff = time.time() - recent_seconds
+        try:
+            names = os.listdir(fd_dir)
+        except OSError:
+            return
+        keys = set()
+        for name in names:
+            fd_path = os.path.join(fd_dir, name)
+            try:
+                st = os.stat(fd_path)
+                target = os.readlink(fd_path)
+            except OSError:
+                # Descriptores que se cierran mientras se listan, sockets anónimos...
+                continue
+            if stat.S_ISREG(st.st_mode):
+                keys.add((st.st_dev, st.st_ino))
+                self.paths.append(target)
+        self.keys = keys
+
+    @property
+    def mode(self):
+        return 'proc' if self.keys is not None else 'mtime'
+
+    def open_under(self, folder_path):
+        """Archivos abiertos dentro de `folder_path` (ruta real).
+
+        Sin /proc se recorre la carpeta y se devuelve el primer archivo
+        modificado en los últimos segundos (basta uno para no moverla).
+        """
+        if self.keys is None:
+            return self._recent_under(folder_path)
+        prefix = os.path.join(folder_path, '')
+        return [path for path in self.paths if path.startswith(prefix)]
+
+    def _recent_under(self, folder_path):
+        pending = [folder_path]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as iterator:
+                    entries = list(iterator)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if self.is_open(st):
+                    return [entry.path]
+        return []
+
+    def is_open(self, st):
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        if self.keys is not None:
+            return (st.st_dev, st.st_ino) in self.keys
+        return st.st_mtime >= self.recent_cutoff
+
+
+_open_files = threading.local()
+
+
+@contextlib.contextmanager
+def skip_open_files(enabled=True):
+    """Ámbito de limpieza: dentro, el motor de borrado salta los archivos abiertos por Kodi.
+
+    El conjunto se toma al entrar en el ámbito más externo y lo reutilizan los
+    anidados; con enabled=False se desactiva (p. ej. al vaciar la papelera,
+    cuyos archivos ya no están en su sitio).
+    """
+    previous = getattr(_open_files, 'guard', None)
+    if previous is not None and enabled:
+        yield previous or None
+        return
+    _open_files.guard = OpenFileGuard() if enabled else False
+    try:
+        yield _open_files.guard or None
+    finally:
+        _open_files.guard = previous
+
+
+def _skip_open(st, path, result):
+    guard = getattr(_open_files, 'guard', None)
+    if not guard or not guard.is_open(st):
+        return False
+    _note_kept_open(result, path)
+    log('Se conserva %s: Kodi lo tiene abierto (%s)' % (path, guard.mode), xbmc.LOGDEBUG)
+    return True
+
+
+def _note_kept_open(result, path):
+    result['skipped_open'] = result.get('skipped_open', 0) + 1
+    result.setdefault('kept_open_dirs', set()).add(os.path.normpath(os.path.dirname(path)))
+
+
+def _rmdir_failed(result, path, error):
+    # Un directorio que conserva archivos abiertos por Kodi (en él o en una
+    # subcarpeta) no puede quedar vacío: no es un error, y su padre tampoco lo será
+    kept_dirs = result.get('kept_open_dirs', ())
+    if error.errno in (errno.ENOTEMPTY, errno.EEXIST) and os.path.normpath(path) in kept_dirs:
+        kept_dirs.add(os.path.normpath(os.path.dirname(path)))
+        return
+    result['errors'] += 1
+    log('Error eliminando directorio %s: %s' % (path, str(error)))
+
+
+_KEPT_OPEN = object()
+# Hilos elegidos por la sonda, por dispositivo, para el resto de la sesión
+_unlink_workers_by_device = {}
+_fan_out = threading.local()
+
+
+def _unlink_one(dir_path, name, dir_fd, guard):
+    """stat + unlink de un archivo, sin tocar el resultado (se ejecuta en los hilos del pool).
+
+    Devuelve (ruta, stat o None, None | excepción | _KEPT_OPEN).
+    """
+    path = os.path.join(dir_path, name)
+    try:
+        st = os.lstat(path) if dir_fd is None else os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+    except OSError as e:
+        return path, None, e
+    if guard and guard.is_open(st):
+        return path, st, _KEPT_OPEN
+    try:
+        if dir_fd is None:
+            os.unlink(path)
+        else:
+            os.unlink(name, dir_fd=dir_fd)
+    except OSError as e:
+        return path, st, e
+    return path, st, None
+
+
+def _account_unlink(result, outcome, missing_ok=False):
+    """Anota en `result` el desenlace de _unlink_one (siempre en el hilo que lleva el resultado)."""
+    path, st, error = outcome
+    if error is None:
+        _count_removed(result, st)
+    elif error is _KEPT_OPEN:
+        _note_kept_open(result, path)
+        log('Se conserva %s: Kodi lo tiene abierto' % path, xbmc.LOGDEBUG)
+    elif st is None and missing_ok and isinstance(error, FileNotFoundError):
+        # Ya no existe: Kodi (u otra limpieza) lo borró después de planificar
+        pass
+    else:
+        result['errors'] += 1
+        log('Error eliminando %s: %s' % (path, str(error)))
+
+
+def choose_unlink_workers(latency):
+    """Hilos de borrado para una latencia media de unlink (segundos por archivo)."""
+    if latency < UNLINK_SLOW_SECONDS:
+        return 1
+    return min(MAX_UNLINK_WORKERS, max(2, int(latency / UNLINK_SLOW_SECONDS)))
+
+
+class UnlinkFanOut(object):
+    """Reparte los unlink de un directorio entre un pool acotado de hilos.
+
+    Los hilos solo hacen stat y unlink; la contabilidad, el progreso y la
+    cancelación se atienden en el hilo que llama, y cada directorio se
+    termina entero antes de seguir, así que el rmdir de abajo arriba no
+    cambia. Con workers=None el número sale de una sonda: los primeros
+    UNLINK_PROBE_FILES archivos se borran en serie midiendo la latencia y la
+    elección se recuerda por dispositivo.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._executor = None
+        self._executor_workers = 0
+
+    def _workers_for(self, device):
+        if self.workers is not None:
+            return self.workers
+        return _unlink_workers_by_device.get(device)
+
+    def _get_executor(self, workers):
+        if self._executor is None or self._executor_workers != workers:
+            self.close()
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='aspirando-unlink')
+            self._executor_workers = workers
+        return self._executor
+
+    def run(self, current, names, result, progress, dir_fd=None, missing_ok=False):
+        """Borra `names` de `current`. Devuelve False si se canceló."""
+        guard = getattr(_open_files, 'guard', None)
+        try:
+            device = os.fstat(dir_fd).st_dev if dir_fd is not None else os.stat(current).st_dev
+        except OSError:
+            device = None
+        workers = self._workers_for(device)
+        start = 0
+        if workers is None:
+            start = min(UNLINK_PROBE_FILES, len(names))
+            started = time.perf_counter()
+            for name in names[:start]:
+                _account_unlink(result, _unlink_one(current, name, dir_fd, guard), missing_ok)
+                if progress is not None and not progress.tick(result):
+                    result['cancelled'] = True
+                    return False
+            latency = (time.perf_counter() - started) / max(1, start)
+            workers = choose_unlink_workers(latency)
+            _unlink_workers_by_device[device] = workers
+            log('Latencia de borrado en %s: %.3f ms por archivo -> %d hilo(s)' % (current, latency * 1000, workers))
+        if workers <= 1:
+            for name in names[start:]:
+                _account_unlink(result, _unlink_one(current, name, dir_fd, guard), missing_ok)
+                if progress is not None and not progress.tick(result):
+                    result['cancelled'] = True
+                    return False
+            return True
+
+        executor = self._get_executor(workers)
+        remaining = iter(names[start:])
+        # Ventana acotada: la cancelación no deja miles de unlink encolados
+        window = workers * 4
+        pending = set()
+        cancelled = False
+        while True:
+            while not cancelled and len(pending) < window:
+                name = next(remaining, None)
+                if name is None:
+                    break
+                pending.add(executor.submit(_unlink_one, current, name, dir_fd, guard))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                # Lo que ya se borró se cuenta aunque se haya cancelado: la contabilidad es exacta
+                _account_unlink(result, future.result(), missing_ok)
+                if not cancelled and progress is not None and not progress.tick(result):
+                    cancelled = True
+            if cancelled:
+                for future in pending:
+                    future.cancel()
+        if cancelled:
+            result['cancelled'] = True
+        return not cancelled
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+@contextlib.contextmanager
+def parallel_unlink():
+    """Ámbito de borrado con UnlinkFanOut; los ámbitos anidados reutilizan el pool."""
+    current = getattr(_fan_out, 'current', None)
+    if current is not None:
+        yield current
+        return
+    _fan_out.current = UnlinkFanOut(get_unlink_workers())
+    try:
+        yield _fan_out.current
+    finally:
+        _fan_out.current.close()
+        _fan_out.current = None
+
+
+def _unlink_files(current, files, result, progress, dir_fd=None, planned=False):
+    """Borra los archivos de un directorio, en serie o repartidos entre hilos.
+
+    `files` son entradas de os.scandir o, con `planned`, nombres del manifiesto
+    (que pueden haber desaparecido). Devuelve False si se canceló.
+    """
+    fan_out = getattr(_fan_out, 'current', None)
+    if fan_out is not None and fan_out.workers != 1 and len(files) >= PARALLEL_UNLINK_MIN_FILES:
+        names = files if planned else [entry.name for entry in files]
+        return fan_out.run(current, names, result, progress, dir_fd, missing_ok=planned)
+    for item in files:
+        if planned:
+            _unlink_name(current, item, result, dir_fd)
+        else:
+            _unlink_entry(item, result, dir_fd, current)
+        if progress is not None and not progress.tick(result):
+            result['cancelled'] = True
+            return False
+    return True
+
+
+def _unlink_entry(entry, result, dir_fd=None, dir_path=None):
+    """Borra una entrada de os.scandir; con `dir_fd` la entrada viene de scandir(dir_fd)."""
+    # Con scandir(dir_fd), entry.path es solo el nombre
+    path = entry.path if dir_fd is None else os.path.join(dir_path, entry.name)
+    try:
+        st = entry.stat(follow_symlinks=False)
+        if _skip_open(st, path, result):
+            return
+        if dir_fd is None:
+            os.unlink(entry.path)
+        else:
+            os.unlink(entry.name, dir_fd=dir_fd)
+    except OSError as e:
+        result['errors'] += 1
+        log('Error eliminando %s: %s' % (path, str(e)))
+        return
+    _count_removed(result, st)
+
+
+def _remove_contents_fd(root_fd, folder_path, result, progress):
+    """Como remove_folder_contents, pero con unlinkat/rmdir relativos al directorio padre."""
+    # [descriptor, ruta (para el log), nombre en el padre, subdirectorios pendientes o None]
+    stack = [[root_fd, folder_path, None, None]]
+    try:
+        while stack:
+            top = stack[-1]
+            dir_fd, current, _, pending = top
+            if pending is None:
+                pending = top[3] = []
+                try:
+                    with os.scandir(dir_fd) as iterator:
+                        entries = list(iterator)
+                except OSError as e:
+                    result['errors'] += 1
+                    log('Error accediendo a carpeta %s: %s' % (current, str(e)))
+                    entries = []
+                files = []
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        pending.append(entry.name)
+                        continue
+                    files.append(entry)
+                if not _unlink_files(current, files, result, progress, dir_fd):
+                    log('Borrado de %s cancelado tras %d archivos' % (folder_path, result['removed_count']))
+                    return result
+                continue
+            if pending:
+                name = pending.pop()
+                try:
+                    child_fd = os.open(name, _SUBDIR_OPEN_FLAGS, dir_fd=dir_fd)
+                except OSError as e:
+                    result['errors'] += 1
+                    log('Error accediendo a carpeta %s: %s' % (os.path.join(current, name), str(e)))
+                    continue
+                stack.append([child_fd, os.path.join(current, name), name, None])
+                continue
+            stack.pop()
+            if dir_fd == root_fd:
+                continue
+            os.close(dir_fd)
+            try:
+                os.rmdir(top[2], dir_fd=stack[-1][0])
+                result['removed_dirs'] += 1
+            except OSError as e:
+                _rmdir_failed(result, current, e)
+        return result
+    finally:
+        for dir_fd, _, _, _ in stack:
+            if dir_fd != root_fd:
+                os.close(dir_fd)
+
+
+def remove_folder_contents(folder_path, result=None, progress=None):
+    """Elimina el contenido de una carpeta (conservando la carpeta) en una sola pasada.
+
+    Los archivos se borran al listarlos y los directorios se eliminan de abajo
+    arriba una vez vacíos. Los enlaces simbólicos se borran sin seguirlos.
+    Con un ProgressReporter en `progress`, la cancelación se atiende entre
+    entradas y el resultado parcial queda marcado con 'cancelled'. Los
+    directorios con muchos archivos se borran con UnlinkFanOut.
+    """
+    with skip_open_files(), parallel_unlink():
+        if result is None:
+            result = empty_result()
+        if not folder_path or not os.path.isdir(folder_path) or result.get('cancelled'):
+            return result
+        root_fd = _open_dir(folder_path)
+        if root_fd is not None:
+            try:
+                return _remove_contents_fd(root_fd, folder_path, result, progress)
+            finally:
+                os.close(root_fd)
+        # (ruta, listado_completo): el segundo paso de cada directorio es el rmdir
+        stack = [(folder_path, False)]
+        while stack:
+            current, listed = stack.pop()
+            if listed:
+                if current != folder_path:
+                    try:
+                        os.rmdir(current)
+                        result['removed_dirs'] += 1
+                    except OSError as e:
+                        _rmdir_failed(result, current, e)
+                continue
+            stack.append((current, True))
+            try:
+                with os.scandir(current) as iterator:
+                    entries = list(iterator)
+            except OSError as e:
+                result['errors'] += 1
+                log('Error accediendo a carpeta %s: %s' % (current, str(e)))
+                continue
+            files = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    stack.append((entry.path, False))
+                    continue
+                files.append(entry)
+            if not _unlink_files(current, files, result, progress):
+                log('Borrado de %s cancelado tras %d archivos' % (folder_path, result['removed_count']))
+                return result
+        return result
+
+
+def remove_path(path, result=None, progress=None):
+    """Elimina un archivo suelto o el contenido de una carpeta."""
+    with skip_open_files():
+        if result is None:
+            result = empty_result()
+        try:
+            if not path or not os.path.lexists(path) or result.get('cancelled'):
+                return result
+            if os.path.isdir(path):
+                return remove_folder_contents(path, result, progress)
+            st = os.lstat(path)
+            if _skip_open(st, path, result):
+                return result
+            os.unlink(path)
+            _count_removed(result, st)
+        except OSError as e:
+            result['errors'] += 1
+            log('Error eliminando %s: %s' % (path, str(e)))
+        if progress is not None and not progress.tick(result):
+            result['cancelled'] = True
+        return result
+
+
+def _trash_root_for(folder_path):
+    """Papelera en el mismo dispositivo que `folder_path` (un rename no cruza sistemas de archivos).
+
+    Si comparte dispositivo con addon_data se usa addon_data/.aspirando-trash;
+    si no (p. ej. temp redirigido a un USB), una junto a la carpeta.
+    """
+    device = _device_of(folder_path)
+    addon_device = _device_of(addon_data_dir)
+    if device is not None and device == addon_device:
+        return os.path.join(addon_data_dir, TRASH_DIRNAME)
+    return os.path.join(os.path.dirname(folder_path), TRASH_DIRNAME)
+
+
+def load_trash_roots():
+    data = _read_json(trash_registry_path, {})
+    if not isinstance(data, dict) or data.get('version') != TRASH_REGISTRY_VERSION:
+        return []
+    return [root for root in data.get('roots', []) if isinstance(root, str)]
+
+
+def _register_trash_root(trash_root):
+    roots = load_trash_roots()
+    if trash_root in roots:
+        return True
+    roots.append(trash_root)
+    try:
+        _write_json_atomic(trash_registry_path, {'version': TRASH_REGISTRY_VERSION, 'roots': roots})
+        return True
+    except Exception as e:
+        log('No se pudo registrar la papelera %s: %s' % (trash_root, str(e)))
+    return False
+
+
+def move_to_trash(folder_path, label=''):
+    """Vacía `folder_path` al instante: la renombra a la papelera y la recrea vacía.
+
+    Se sigue el enlace si la carpeta lo es (special://temp redirigido) y la
+    carpeta nueva conserva permisos y propietario. Devuelve la ruta dentro de
+    la papelera, o None si no se pudo (otro dispositivo, permisos...): en ese
+    caso el llamador debe borrar como siempre.
+    """
+    if not folder_path or not os.path.isdir(folder_path):
+        return None
+    real_path = os.path.realpath(folder_path)
+    try:
+        folder_stat = os.stat(real_path)
+        trash_root = _trash_root_for(real_path)
+        os.makedirs(trash_root, exist_ok=True)
+    except OSError as e:
+        log('Sin papelera para %s: %s' % (folder_path, str(e)))
+        return None
+    if _device_of(trash_root) != folder_stat.st_dev:
+        log('Papelera en otro dispositivo que %s: se borra directamente' % folder_path)
+        return None
+    # Con archivos abiertos por Kodi dentro, el borrado normal los respeta; la papelera se los llevaría
+    # (sin /proc, los modificados hace unos segundos se tratan como abiertos)
+    guard = getattr(_open_files, 'guard', None) or OpenFileGuard()
+    in_use = guard.open_under(real_path)
+    if in_use:
+        log('%s tiene archivos abiertos por Kodi (%s, %s): se borra directamente' % (
+            folder_path, guard.mode, in_use[0]))
+        return None
+    # El registro va antes del rename: tras un cierre brusco la papelera se encuentra igualmente
+    if not _register_trash_root(trash_root):
+        return None
+    trash_path = os.path.join(trash_root, '%s-%d' % (label or os.path.basename(real_path) or 'carpeta', time.time_ns()))
+    try:
+        os.rename(real_path, trash_path)
+    except OSError as e:
+        log('No se pudo mover %s a la papelera: %s' % (folder_path, str(e)))
+        return None
+    try:
+        os.mkdir(real_path, stat.S_IMODE(folder_stat.st_mode))
+        # mkdir aplica la umask: fijar los permisos originales
+        os.chmod(real_path, stat.S_IMODE(folder_stat.st_mode))
+        if hasattr(os, 'chown'):
+            os.chown(real_path, folder_stat.st_uid, folder_stat.st_gid)
+    except FileExistsError:
+        # Kodi la ha vuelto a crear entre el rename y el mkdir
+        pass
+    except OSError as e:
+        log('Error recreando %s tras moverla a la papelera: %s' % (real_path, str(e)))
+    log('%s movida a la papelera (%s)' % (folder_path, trash_path))
+    return trash_path
+
+
+def pending_trash():
+    """Entradas de las papeleras registradas que faltan por vaciar."""
+    entries = []
+    for trash_root in load_trash_roots():
+        try:
+            names = os.listdir(trash_root)
+        except OSError:
+            continue
+        entries.extend(os.path.join(trash_root, name) for name in sorted(names))
+    return entries
+
+
+def purge_trash(result=None, progress=None, entries=None):
+    """Vacía las papeleras (o solo `entries`) con el motor de borrado; con un
+    TimeSlicer en `progress` va por lotes y lo que quede por una cancelación se
+    retoma en la siguiente pasada. Las entradas que siguen ahí sin haberse
+    cancelado (permisos, sistema de solo lectura...) van en 'trash_failed'."""
+    if result is None:
+        result = empty_result()
+    result['trash_failed'] = []
+    # Lo que hay en la papelera ya no está en su sitio: se borra aunque siga abierto
+    with skip_open_files(False):
+        _purge_trash_entries(pending_trash() if entries is None else entries, result, progress)
+    return result
+
+
+def _purge_trash_entries(entries, result, progress):
+    for entry in entries:
+        if result.get('cancelled'):
+            break
+        remove_path(entry, result, progress)
+        if result.get('cancelled'):
+            break
+        if os.path.isdir(entry) and not os.path.islink(entry):
+            try:
+                os.rmdir(entry)
+                result['removed_dirs'] += 1
+            except OSError as e:
+                result['errors'] += 1
+                log('Error eliminando %s de la papelera: %s' % (entry, str(e)))
+        if os.path.lexists(entry):
+            result['trash_failed'].append(entry)
+    return result
+
+
+# Comprobación con statvfs: el espacio libre de cada dispositivo antes y
+# después de limpiar es lo que el usuario gana de verdad (incluye VACUUM de las
+# bases de datos y descuenta lo que Kodi haya escrito mientras tanto).
+def free_space(path):
+    """Bytes disponibles para el usuario en el dispositivo de `path`, o None."""
+    try:
+        if hasattr(os, 'statvfs'):
+            st = os.statvfs(path)
+            return st.f_bavail * st.f_frsize
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+class FreeSpaceProbe(object):
+    """Espacio libre de los dispositivos de varias rutas, medido una vez por st_dev."""
+
+    def __init__(self, paths):
+        self.devices = {}
+        for path in paths:
+            if not path:
+                continue
+            # Los archivos sueltos desaparecen al limpiar: medir en su carpeta
+            probe_path = path if os.path.isdir(path) else os.path.dirname(path)
+            device = _device_of(probe_path)
+            if device is None or device in self.devices:
+                continue
+            free = free_space(probe_path)
+            if free is not None:
+                self.devices[device] = (probe_path, free)
+
+    def gained(self):
+        """Bytes ganados desde la creación en todos los dispositivos medidos."""
+        total = 0
+        for probe_path, before in self.devices.values():
+            after = free_space(probe_path)
+            if after is not None:
+                total += after - before
+        return total
+
+
+def describe_freed(result, gained=None):
+    """Texto con lo liberado: lógico, ocupado en disco y, si se midió, la ganancia real."""
+    text = '%s (%s en disco)' % (format_size(result['removed_size']), format_size(allocated_bytes(result['removed_blocks'])))
+    if gained is not None:
+        text += '; espacio libre %s%s' % ('+' if gained >= 0 else '-', format_size(abs(gained)))
+    if result.get('skipped_open'):
+        text += '; %d archivos abiertos por Kodi se conservan' % result['skipped_open']
+    return text
+
+
+# Manifiesto de borrado: una planificación en seco registra, por directorio,
+# su mtime/inodo y los archivos (nombre, tamaño) que contiene. La limpieza real
+# borra esos nombres sin volver a listar y solo relista los directorios cuyo
+# mtime o inodo ha cambiado desde la planificación.
+def _manifest_walk(folder_path):
+    """Recorre una carpeta y devuelve (stats, dirs) para el manifiesto."""
+    stats = empty_stats()
+    dirs = {}
+    seen = set()
+    root_fd = _open_dir(folder_path)
+    if root_fd is not None:
+        try:
+            for rel_path, _, dir_stat, files, subdirs in _walk_fd(root_fd, folder_path):
+                stats['dirs'] += len(subdirs)
+                for _, st in files:
+                    _count_file(stats, st, seen)
+                dirs[rel_path] = [dir_stat.st_mtime_ns, dir_stat.st_ino, [[name, st.st_size] for name, st in files]]
+        finally:
+            os.close(root_fd)
+        return stats, dirs
+    pending = ['']
+    while pending:
+        rel_path = pending.pop()
+        current = os.path.join(folder_path, rel_path) if rel_path else folder_path
+        files = []
+        try:
+            dir_stat = os.stat(current)
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stats['dirs'] += 1
+                            pending.append(os.path.join(rel_path, entry.name) if rel_path else entry.name)
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    files.append([entry.name, st.st_size])
+                    _count_file(stats, st, seen)
+        except OSError as e:
+            log('Error recorriendo %s: %s' % (current, str(e)))
+            continue
+        dirs[rel_path] = [dir_stat.st_mtime_ns, dir_stat.st_ino, files]
+    return stats, dirs
+
+
+def build_manifest(categories, workers_per_device=None):
+    """Planifica en seco el borrado de varias categorías con un único escaneo.
+
+    `categories` es un dict etiqueta -> lista de rutas, como en
+    scan_roots_parallel. Las raíces se reparten en un pool de hilos por
+    dispositivo. Devuelve el manifiesto con los totales por categoría.
+    """
+    workers = max(1, int(workers_per_device or get_scan_workers_per_device()))
+    manifest = {'version': MANIFEST_VERSION, 'created': time.time(), 'categories': {}}
+    executors = {}
+    futures = {}
+    started = time.time()
+    try:
+        for label, paths in categories.items():
+            category = {'size': 0, 'files': 0, 'blocks': 0, 'roots': []}
+            manifest['categories'][label] = category
+            for path in paths or []:
+                if not path or not os.path.lexists(path):
+                    continue
+                if not os.path.isdir(path):
+                    stats = scan_path(path)
+                    category['size'] += stats['size']
+                    category['files'] += stats['files']
+                    category['blocks'] += stats['blocks']
+                    category['roots'].append({'path': path, 'file': True})
+                    continue
+                device = _device_of(path)
+                executor = executors.get(device)
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='aspirando-plan')
+                    executors[device] = executor
+                futures[executor.submit(_manifest_walk, path)] = (category, path)
+        for future, (category, path) in futures.items():
+            try:
+                stats, dirs = future.result()
+            except Exception as e:
+                log('Error planificando %s: %s' % (path, str(e)))
+                continue
+            category['size'] += stats['size']
+            category['files'] += stats['files']
+            category['blocks'] += stats['blocks']
+            category['roots'].append({'path': path, 'dirs': dirs})
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+    log('Manifiesto de borrado: %d raíces, %.2fs' % (len(futures), time.time() - started))
+    return manifest
+
+
+def manifest_totals(manifest):
+    """Devuelve un dict categoría -> (tamaño, archivos) a partir del manifiesto."""
+    return dict((label, (category.get('size', 0), category.get('files', 0)))
+                for label, category in manifest.get('categories', {}).items())
+
+
+def manifest_allocated(manifest):
+    """Bytes ocupados en disco por todo lo planificado (st_blocks*512)."""
+    return allocated_bytes(sum(category.get('blocks', 0) for category in manifest.get('categories', {}).values()))
+
+
+def manifest_paths(manifest):
+    """Rutas raíz de todas las categorías del manifiesto."""
+    return [root_entry['path'] for category in manifest.get('categories', {}).values()
+            for root_entry in category.get('roots', [])]
+
+
+def save_manifest(manifest):
+    try:
+        _write_json_atomic(manifest_path, manifest)
+        return True
+    except Exception as e:
+        log('No se pudo guardar el manifiesto de borrado: %s' % str(e))
+    return False
+
+
+def load_manifest():
+    data = _read_json(manifest_path, {})
+    if not isinstance(data, dict) or data.get('version') != MANIFEST_VERSION:
+        return None
+    return data
+
+
+def discard_manifest():
+    try:
+        os.remove(manifest_path)
+    except OSError:
+        pass
+
+
+# Caché de tamaños compartida entre el servicio (que la escribe) y default.py
+# (que la muestra con su antigüedad y la invalida al borrar)
+def save_size_cache(categories, merge=False):
+    """Guarda un dict categoría -> stats (de scan_roots_parallel) con la hora del escaneo.
+
+    Con `merge` solo se sustituyen las categorías indicadas (p. ej. los
+    contadores en vivo de watcher.py) y el resto conserva su antigüedad.
+    """
+    now = time.time()
+    data = load_size_cache() if merge else None
+    if data is None:
+        data = {'version': SIZE_CACHE_VERSION, 'categories': {}}
+    for label, stats in categories.items():
+        data['categories'][label] = {
+            'size': stats.get('size', 0),
+            'files': stats.get('files', 0),
+            'blocks': stats.get('blocks', 0),
+            'updated': now,
+        }
+    # La antigüedad global es la de la categoría más desfasada
+    data['created'] = min([category.get('updated', now) for category in data['categories'].values()] or [now])
+    try:
+        _write_json_atomic(size_cache_path, data)
+        return True
+    except Exception as e:
+        log('No se pudo guardar la caché de tamaños: %s' % str(e))
+    return False
+
+
+def load_size_cache():
+    data = _read_json(size_cache_path, {})
+    if not isinstance(data, dict) or data.get('version') != SIZE_CACHE_VERSION:
+        return None
+    data.setdefault('categories', {})
+    return data
+
+
+def cached_category_sizes(label):
+    """Devuelve (tamaño, archivos, antigüedad en segundos) de una categoría o None."""
+    data = load_size_cache()
+    if data is None or label not in data['categories']:
+        return None
+    category = data['categories'][label]
+    updated = category.get('updated', data.get('created', 0))
+    return category.get('size', 0), category.get('files', 0), max(0, time.time() - updated)
+
+
+def forget_cached_sizes(labels=None):
+    """Invalida las categorías indicadas (todas si `labels` es None) tras un borrado."""
+    if labels is None:
+        try:
+            os.remove(size_cache_path)
+        except OSError:
+            pass
+        return
+    data = load_size_cache()
+    if data is None:
+        return
+    for label in labels:
+        data['categories'].pop(label, None)
+    try:
+        _write_json_atomic(size_cache_path, data)
+    except Exception as e:
+        log('No se pudo actualizar la caché de tamaños: %s' % str(e))
+
+
+def format_age(seconds):
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return 'hace %d s' % seconds
+    if seconds < 3600:
+        return 'hace %d min' % (seconds // 60)
+    if seconds < 86400:
+        return 'hace %d h' % (seconds // 3600)
+    return 'hace %d días' % (seconds // 86400)
+
+
+def _unlink_name(dir_path, name, result, dir_fd=None):
+    path = os.path.join(dir_path, name)
+    try:
+        if dir_fd is None:
+            st = os.lstat(path)
+        else:
+            st = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+    except OSError:
+        # Ya no existe: Kodi (u otra limpieza) lo borró después de planificar
+        return
+    if _skip_open(st, path, result):
+        return
+    try:
+        if dir_fd is None:
+            os.unlink(path)
+        else:
+            os.unlink(name, dir_fd=dir_fd)
+    except OSError as e:
+        result['errors'] += 1
+        log('Error eliminando %s: %s' % (path, str(e)))
+        return
+    _count_removed(result, st)
+
+
+def _remove_manifest_root(root_entry, result, progress):
+    folder_path = root_entry['path']
+    if root_entry.get('file'):
+        remove_path(folder_path, result, progress)
+        return
+    if not os.path.isdir(folder_path):
+        return
+    dirs = root_entry.get('dirs', {})
+    # Comparar todos los directorios antes de borrar: cada rmdir cambia el mtime del padre
+    changed = set()
+    missing = set()
+    for rel_path, record in dirs.items():
+        try:
+            dir_stat = os.stat(os.path.join(folder_path, rel_path) if rel_path else folder_path)
+        except OSError:
+            missing.add(rel_path)
+            continue
+        if dir_stat.st_mtime_ns != record[0] or dir_stat.st_ino != record[1]:
+            changed.add(rel_path)
+    if changed:
+        log('Manifiesto de %s: %d/%d directorios cambiados, se vuelven a listar' % (
+            folder_path, len(changed), len(dirs)), xbmc.LOGDEBUG)
+
+    for rel_path in sorted(dirs, key=lambda rel: rel.count(os.sep) + (1 if rel else 0), reverse=True):
+        if rel_path in missing:
+            continue
+        current = os.path.join(folder_path, rel_path) if rel_path else folder_path
+        dir_fd = None
+        if use_fd_traversal:
+            try:
+                # Un subdirectorio sustituido por un enlace no se sigue
+                dir_fd = os.open(current, _SUBDIR_OPEN_FLAGS if rel_path else _DIR_OPEN_FLAGS)
+            except OSError as e:
+                result['errors'] += 1
+                log('Error accediendo a carpeta %s: %s' % (current, str(e)))
+                continue
+        try:
+            _remove_manifest_dir(current, rel_path, dirs, rel_path in changed, dir_fd, result, progress)
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+        if result['cancelled']:
+            return
+        if rel_path:
+            try:
+                os.rmdir(current)
+                result['removed_dirs'] += 1
+            except OSError as e:
+                _rmdir_failed(result, current, e)
+
+
+def _remove_manifest_dir(current, rel_path, dirs, changed, dir_fd, result, progress):
+    """Borra el contenido planificado de un directorio (sin el rmdir del propio directorio)."""
+    if not changed:
+        _unlink_files(current, [name for name, _ in dirs[rel_path][2]], result, progress, dir_fd, planned=True)
+        return
+    try:
+        with os.scandir(dir_fd if dir_fd is not None else current) as iterator:
+            entries = list(iterator)
+    except OSError as e:
+        result['errors'] += 1
+        log('Error accediendo a carpeta %s: %s' % (current, str(e)))
+        return
+    files = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            is_dir = False
+        if is_dir:
+            child_rel = os.path.join(rel_path, entry.name) if rel_path else entry.name
+            if child_rel in dirs:
+                continue
+            # Subdirectorio nuevo desde la planificación
+            child_path = os.path.join(current, entry.name)
+            remove_folder_contents(child_path, result, progress)
+            if result['cancelled']:
+                return
+            try:
+                if dir_fd is None:
+                    os.rmdir(child_path)
+                else:
+                    os.rmdir(entry.name, dir_fd=dir_fd)
+                result['removed_dirs'] += 1
+            except OSError as e:
+                _rmdir_failed(result, child_path, e)
+            continue
+        files.append(entry)
+    _unlink_files(current, files, result, progress, dir_fd)
+
+
+def remove_manifest_category(manifest, label, result=None, progress=None):
+    """Ejecuta el borrado planificado de una categoría del manifiesto."""
+    with skip_open_files(), parallel_unlink():
+        if result is None:
+            result = empty_result()
+        category = manifest.get('categories', {}).get(label) or {}
+        for root_entry in category.get('roots', []):
+            if result.get('cancelled'):
+                break
+            _remove_manifest_root(root_entry, result, progress)
+            if result.get('cancelled'):
+                log('Borrado de %s cancelado tras %d archivos' % (root_entry['path'], result['removed_count']))
+        return result
+
+
+def trash_manifest_category(manifest, label, result=None, progress=None):
+    """Como remove_manifest_category, pero moviendo cada carpeta raíz a la papelera.
+
+    Lo movido se suma a 'trashed_count'/'trashed_size' del resultado (según el
+    manifiesto); los archivos sueltos y las carpetas que no se pueden mover se
+    borran en el momento.
+    """
+    if result is None:
+        result = empty_result()
+    result.setdefault('trashed_count', 0)
+    result.setdefault('trashed_size', 0)
+    category = manifest.get('categories', {}).get(label) or {}
+    for root_entry in category.get('roots', []):
+        if result.get('cancelled'):
+            break
+        if not root_entry.get('file') and move_to_trash(root_entry['path'], label):
+            for _, _, files in root_entry.get('dirs', {}).values():
+                result['trashed_count'] += len(files)
+                result['trashed_size'] += sum(size for _, size in files)
+            continue
+        _remove_manifest_root(root_entry, result, progress)
+    return result
+
+
+# Expulsión por cuota y antigüedad: en lugar de vaciar una categoría entera se
+# borran primero los archivos menos usados hasta quedar bajo la cuota.
+EVICTION_ORDERS = ('atime', 'mtime')
+
+
+def _eviction_timestamp(st, order):
+    if order == 'atime':
+        # Con noatime/relatime el atime puede quedarse por detrás del mtime
+        return max(st.st_atime, st.st_mtime)
+    return st.st_mtime
+
+
+class _EvictionHeap(object):
+    """Conserva solo los archivos más antiguos necesarios para cubrir `bound` bytes.
+
+    Es un heap de máximos por antigüedad: cuando entra un archivo más antiguo
+    se descartan los más recientes que ya no hacen falta, de modo que la
+    memoria depende de lo que hay que borrar y no del tamaño del árbol.
+    """
+
+    def __init__(self, bound):
+        self.bound = max(0, int(bound))
+        self.items = []
+        self.total = 0
+
+    def offer(self, timestamp, size, path):
+        if self.bound <= 0:
+            return
+        if self.total >= self.bound and timestamp >= -self.items[0][0]:
+            return
+        heapq.heappush(self.items, (-timestamp, size, path))
+        self.total += size
+        while self.items and self.total - self.items[0][1] >= self.bound:
+            _, popped_size, _ = heapq.heappop(self.items)
+            self.total -= popped_size
+
+    def oldest_first(self):
+        return [(-neg_ts, size, path) for neg_ts, size, path in sorted(self.items, reverse=True)]
+
+
+def _eviction_walk(folder_path, order, cutoff, candidates, result, progress):
+    """Recorre `folder_path`: borra lo anterior a `cutoff` y ofrece el resto a `candidates`.
+
+    Devuelve los bytes conservados, o None si se canceló.
+    """
+    kept_size = 0
+    pending = [folder_path]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as iterator:
+                entries = list(iterator)
+        except OSError as e:
+            result['errors'] += 1
+            log('Error accediendo a carpeta %s: %s' % (current, str(e)))
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            timestamp = _eviction_timestamp(st, order)
+            if cutoff is not None and timestamp < cutoff:
+                _unlink_entry(entry, result)
+                if progress is not None and not progress.tick(result):
+                    result['cancelled'] = True
+                    return None
+                continue
+            kept_size += st.st_size
+            candidates.offer(timestamp, st.st_size, entry.path)
+    return kept_size
+
+
+def evict_folder(folder_path, quota_bytes=0, max_age_seconds=0, order='atime', result=None, progress=None, index=None):
+    """Borra archivos de `folder_path` por antigüedad y cuota, sin vaciar la carpeta.
+
+    Primero se eliminan (al vuelo) los archivos cuya marca de tiempo supera
+    `max_age_seconds`; después, si el resto sigue por encima de `quota_bytes`,
+    se borran los menos recientes según `order` ('atime' o 'mtime') hasta
+    quedar bajo la cuota. Un valor 0 desactiva cada criterio. Los directorios
+    se conservan (p. ej. los fragmentos de Thumbnails).
+    """
+    with skip_open_files():
+        if result is None:
+            result = empty_result()
+        if not folder_path or not os.path.isdir(folder_path) or result.get('cancelled'):
+            return result
+        if order not in EVICTION_ORDERS:
+            order = 'atime'
+        quota_bytes = max(0, int(quota_bytes or 0))
+        max_age_seconds = max(0, int(max_age_seconds or 0))
+        if not quota_bytes and not max_age_seconds:
+            return result
+        start_count = result['removed_count']
+        start_size = result['removed_size']
+
+        # El total indexado solo dimensiona el heap: puede tener horas y no ve las
+        # reescrituras, así que el exceso real sale del recorrido
+        bound = 0
+        if quota_bytes:
+            bound = scan_tree_cached(folder_path, index=index)['size'] - quota_bytes
+        candidates = _EvictionHeap(bound)
+        cutoff = time.time() - max_age_seconds if max_age_seconds else None
+        kept_size = _eviction_walk(folder_path, order, cutoff, candidates, result, progress)
+        if kept_size is None:
+            return result
+
+        excess = kept_size - quota_bytes if quota_bytes else 0
+        if excess > candidates.total:
+            # El índice se quedó corto: segunda pasada con el exceso medido
+            log('Índice desfasado en %s: exceso real %s, se vuelve a recorrer' % (
+                folder_path, format_size(excess)))
+            candidates = _EvictionHeap(excess)
+            if _eviction_walk(folder_path, order, None, candidates, result, progress) is None:
+                return result
+        for _, size, path in candidates.oldest_first():
+            if excess <= 0:
+                break
+            before = result['removed_size']
+            remove_path(path, result, progress)
+            excess -= result['removed_size'] - before
+            if result.get('cancelled'):
+                break
+        log('Expulsión en %s (%s): %d archivos, %s liberados; exceso restante %s' % (
+            folder_path, order, result['removed_count'] - start_count,
+            format_size(result['removed_size'] - start_size), format_size(max(0, excess))))
+        return result
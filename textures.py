@@ -0,0 +1,330 @@
+import os
+import re
+import sqlite3
+import time
+
+import xbmc
+import xbmcaddon
+import xbmcvfs
+
+import storage
+
+
+# Mantenimiento de Thumbnails guiado por la base de datos Textures*.db de Kodi.
+# Tablas usadas: texture(id, url, cachedurl, ...) y
+# sizes(idtexture, size, width, height, usecount, lastusetime).
+DB_TIMEOUT = 10
+EVICTION_BATCH_SIZE = 500
+ORPHAN_GRACE_SECONDS = 300
+
+addon = xbmcaddon.Addon()
+addon_name = addon.getAddonInfo('name')
+
+
+def log(message, level=xbmc.LOGINFO):
+    xbmc.log('[%s][textures] %s' % (addon_name, message), level)
+
+
+def _translate(path):
+    try:
+        return xbmcvfs.translatePath(path)
+    except Exception:
+        try:
+            return xbmc.translatePath(path)
+        except Exception:
+            return path
+
+
+def thumbnails_path():
+    return os.path.join(_translate('special://userdata/'), 'Thumbnails')
+
+
+def find_textures_db():
+    """Devuelve la Textures*.db de versión más alta (Kodi conserva las antiguas al migrar)."""
+    db_dir = _translate('special://database/')
+    best = None
+    best_version = -1
+    try:
+        for name in os.listdir(db_dir):
+            lower_name = name.lower()
+            if not (lower_name.startswith('textures') and lower_name.endswith('.db')):
+                continue
+            match = re.search(r'(\d+)', name)
+            version = int(match.group(1)) if match else 0
+            if version > best_version:
+                best, best_version = os.path.join(db_dir, name), version
+    except OSError as e:
+        log('No se pudo listar %s: %s' % (db_dir, str(e)))
+    return best
+
+
+def connect(db_path):
+    # Kodi mantiene la base abierta: esperar a que libere el bloqueo en lugar de fallar
+    return sqlite3.connect(db_path, timeout=DB_TIMEOUT)
+
+
+def cached_file_path(thumbs_dir, cachedurl):
+    return os.path.join(thumbs_dir, *str(cachedurl).replace('\\', '/').split('/'))
+
+
+def delete_texture_rows(conn, ids):
+    """Borra filas de texture y sizes para los ids dados (la transacción la cierra el llamante)."""
+    if not ids:
+        return 0
+    placeholders = ','.join('?' * len(ids))
+    conn.execute('DELETE FROM sizes WHERE idtexture IN (%s)' % placeholders, ids)
+    cursor = conn.execute('DELETE FROM texture WHERE id IN (%s)' % placeholders, ids)
+    return cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else len(ids)
+
+
+def evict_by_usage(target_bytes, thumbs_dir=None, db_path=None, result=None, progress=None,
+                   batch_size=EVICTION_BATCH_SIZE, max_age_seconds=0, index=None, stale_only=False):
+    """Expulsa las miniaturas menos usadas hasta dejar Thumbnails en `target_bytes`.
+
+    Ordena las texturas por lastusetime y usecount (las que no tienen fila en
+    sizes primero), borra el archivo y sus filas de la base en la misma
+    transacción por lotes, y se detiene al alcanzar el objetivo. Con
+    `max_age_seconds` también se expulsan las no usadas en ese plazo aunque ya
+    se esté bajo el objetivo (las que no tienen fila en sizes se dejan). Con
+    `stale_only` es al revés: hasta el objetivo, pero solo entre las no usadas
+    en `max_age_seconds`. La carátula que Kodi muestra a menudo se conserva. Devuelve el resultado del motor de borrado con 'db_rows' (filas
+    eliminadas) y 'db_ok'.
+    """
+    if result is None:
+        result = storage.empty_result()
+    result.setdefault('db_rows', 0)
+    result['db_ok'] = False
+    thumbs_dir = thumbs_dir or thumbnails_path()
+    db_path = db_path or find_textures_db()
+    if not db_path or not os.path.isdir(thumbs_dir):
+        log('Sin Textures DB o carpeta Thumbnails: no se puede expulsar por uso')
+        return result
+
+    excess = storage.scan_tree_cached(thumbs_dir, index)['size'] - max(0, int(target_bytes or 0))
+    # lastusetime se guarda como 'YYYY-MM-DD HH:MM:SS' en hora local
+    cutoff = ''
+    if max_age_seconds:
+        cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() - max_age_seconds))
+    if excess <= 0 and (stale_only or not cutoff):
+        result['db_ok'] = True
+        return result
+    start_size = result['removed_size']
+
+    def should_continue(lastuse):
+        # None: saltar la fila; sin fila en sizes no se sabe su antigüedad, pero
+        # van primero en el orden y no deben cortar el pase por edad
+        if result.get('cancelled'):
+            return False
+        missing = result['removed_size'] - start_size < excess
+        if missing and not stale_only:
+            return True
+        if not cutoff or (stale_only and not missing):
+            return False
+        if not lastuse:
+            return None
+        return lastuse < cutoff
+
+    conn = None
+    try:
+        conn = connect(db_path)
+        # Orden de expulsión materializado una sola vez; luego se recorre por rowid
+        conn.execute('DROP TABLE IF EXISTS temp.evict_order')
+        conn.execute(
+            'CREATE TEMP TABLE evict_order AS '
+            "SELECT t.id AS id, t.cachedurl AS cachedurl, COALESCE(MAX(s.lastusetime), '') AS lastuse "
+            'FROM texture t LEFT JOIN sizes s ON s.idtexture = t.id '
+            'GROUP BY t.id '
+            "ORDER BY COALESCE(MAX(s.lastusetime), '') ASC, COALESCE(SUM(s.usecount), 0) ASC, t.id ASC"
+        )
+        # Un solo conjunto de archivos abiertos para toda la expulsión
+        with storage.skip_open_files():
+            last_rowid = 0
+            finished = False
+            while not finished:
+                rows = conn.execute(
+                    'SELECT rowid, id, cachedurl, lastuse FROM temp.evict_order WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last_rowid, batch_size)).fetchall()
+                if not rows:
+                    break
+                ids = []
+                for rowid, texture_id, cachedurl, lastuse in rows:
+                    last_rowid = rowid
+                    decision = should_continue(lastuse)
+                    if decision is None:
+                        continue
+                    if not decision:
+                        finished = True
+                        break
+                    if cachedurl:
+                        file_path = cached_file_path(thumbs_dir, cachedurl)
+                        kept_before = result['errors'] + result.get('skipped_open', 0)
+                        storage.remove_path(file_path, result, progress)
+                        if result['errors'] + result.get('skipped_open', 0) > kept_before:
+                            # Si el archivo no se pudo borrar (o Kodi lo tiene abierto), la fila debe seguir apuntándolo
+                            continue
+                    ids.append(texture_id)
+                result['db_rows'] += delete_texture_rows(conn, ids)
+                conn.commit()
+        conn.execute('DROP TABLE IF EXISTS temp.evict_order')
+        result['db_ok'] = True
+    except Exception as e:
+        log('Error expulsando miniaturas por uso en %s: %s' % (db_path, str(e)))
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+    log('Expulsión por uso: %d miniaturas, %d filas, %s liberados' % (
+        result['removed_count'], result['db_rows'], storage.format_size(result['removed_size'] - start_size)))
+    return result
+
+
+def _is_texture_dir(name):
+    # Kodi reparte la caché de texturas en subcarpetas 0-f; Video/ y Music/ guardan
+    # miniaturas de marcadores y no tienen fila en texture
+    return len(name) == 1 and name in '0123456789abcdefABCDEF'
+
+
+def _texture_key(relative_path):
+    return os.path.normcase(relative_path.replace('\\', '/').strip('/'))
+
+
+def find_orphans(thumbs_dir=None, db_path=None, grace_seconds=ORPHAN_GRACE_SECONDS):
+    """Cruza texture.cachedurl con el listado de Thumbnails.
+
+    Recorre la columna con un cursor (sin fetchall) y el disco con os.scandir,
+    ambos hacia conjuntos hash, así que es lineal en el número de entradas.
+    Devuelve {'files': [(ruta, tamaño)], 'rows': [id], 'size', 'db_ok'}:
+    archivos sin fila y filas cuyo archivo no existe. Los archivos modificados
+    en los últimos `grace_seconds` se ignoran porque Kodi escribe el archivo
+    antes de insertar su fila.
+    """
+    report = {'files': [], 'rows': [], 'size': 0, 'db_ok': False}
+    thumbs_dir = thumbs_dir or thumbnails_path()
+    db_path = db_path or find_textures_db()
+    if not db_path or not os.path.isdir(thumbs_dir):
+        log('Sin Textures DB o carpeta Thumbnails: no se buscan huérfanos')
+        return report
+
+    referenced = {}
+    conn = None
+    try:
+        conn = connect(db_path)
+        for texture_id, cachedurl in conn.execute('SELECT id, cachedurl FROM texture'):
+            if cachedurl:
+                referenced.setdefault(_texture_key(cachedurl), []).append(texture_id)
+            else:
+                report['rows'].append(texture_id)
+        report['db_ok'] = True
+    except Exception as e:
+        log('Error leyendo %s: %s' % (db_path, str(e)))
+        return report
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    newest_allowed = time.time() - grace_seconds
+    try:
+        top_entries = list(os.scandir(thumbs_dir))
+    except OSError as e:
+        log('No se pudo listar %s: %s' % (thumbs_dir, str(e)))
+        report['db_ok'] = False
+        return report
+    for top in top_entries:
+        try:
+            if not top.is_dir(follow_symlinks=False) or not _is_texture_dir(top.name):
+                continue
+        except OSError:
+            continue
+        pending = [(top.path, top.name)]
+        while pending:
+            dir_path, rel_dir = pending.pop()
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        rel = rel_dir + '/' + entry.name
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                pending.append((entry.path, rel))
+                                continue
+                            key = _texture_key(rel)
+                            if referenced.pop(key, None) is not None:
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if st.st_mtime > newest_allowed:
+                            continue
+                        report['files'].append((entry.path, st.st_size))
+                        report['size'] += st.st_size
+            except OSError as e:
+                log('Error listando %s: %s' % (dir_path, str(e)))
+
+    # Lo que queda en `referenced` son filas cuyo archivo no apareció en disco
+    for ids in referenced.values():
+        report['rows'].extend(ids)
+    log('Huérfanos en Thumbnails: %d archivos sin fila (%s), %d filas sin archivo' % (
+        len(report['files']), storage.format_size(report['size']), len(report['rows'])))
+    return report
+
+
+def clean_orphans(thumbs_dir=None, db_path=None, report=None, result=None, progress=None,
+                  batch_size=EVICTION_BATCH_SIZE):
+    """Elimina en una pasada los huérfanos de `find_orphans` (o del `report` dado).
+
+    Los archivos se borran con el motor de storage; las filas se borran por
+    lotes, comprobando antes que el archivo sigue sin existir. Devuelve el
+    resultado de borrado con 'db_rows' y 'db_ok'.
+    """
+    if result is None:
+        result = storage.empty_result()
+    result.setdefault('db_rows', 0)
+    result['db_ok'] = False
+    thumbs_dir = thumbs_dir or thumbnails_path()
+    db_path = db_path or find_textures_db()
+    if report is None:
+        report = find_orphans(thumbs_dir, db_path)
+    if not report.get('db_ok'):
+        return result
+
+    with storage.skip_open_files():
+        for file_path, _ in report['files']:
+            storage.remove_path(file_path, result, progress)
+            if result.get('cancelled'):
+                return result
+
+    if not report['rows']:
+        result['db_ok'] = True
+        return result
+    conn = None
+    try:
+        conn = connect(db_path)
+        rows = report['rows']
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            placeholders = ','.join('?' * len(batch))
+            # Kodi pudo haber regenerado la miniatura desde el análisis
+            ids = [texture_id for texture_id, cachedurl in conn.execute(
+                       'SELECT id, cachedurl FROM texture WHERE id IN (%s)' % placeholders, batch)
+                   if not cachedurl or not os.path.lexists(cached_file_path(thumbs_dir, cachedurl))]
+            result['db_rows'] += delete_texture_rows(conn, ids)
+            conn.commit()
+            if progress is not None and not progress.tick(result):
+                result['cancelled'] = True
+                break
+        result['db_ok'] = True
+    except Exception as e:
+        log('Error borrando filas huérfanas en %s: %s' % (db_path, str(e)))
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+    log('Huérfanos eliminados: %d archivos (%s), %d filas' % (
+        result['removed_count'], storage.format_size(result['removed_size']), result['db_rows']))
+    return result
@@ -0,0 +1,348 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+import time
+
+import xbmc
+import xbmcaddon
+
+import storage
+
+
+# Seguimiento en vivo del tamaño de las carpetas de caché desde el servicio.
+# En Linux (y Android) se usa inotify vía ctypes: cada directorio vigilado que
+# recibe eventos se vuelve a listar (solo ese directorio) y los contadores se
+# ajustan con la diferencia. Si la cola de eventos se desborda, el árbol se
+# marca para un reescaneo completo. En el resto de plataformas se comparan
+# periódicamente los mtime de los directorios, como hace el índice de tamaños.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_EXCL_UNLINK)
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+# Cada cuánto se comparan los mtime en modo sondeo
+POLL_INTERVAL = 60
+
+addon = xbmcaddon.Addon()
+addon_name = addon.getAddonInfo('name')
+
+
+def log(message, level=xbmc.LOGINFO):
+    xbmc.log('[%s][watcher] %s' % (addon_name, message), level)
+
+
+def _load_inotify():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        # En Android find_library no encuentra libc: basta con los símbolos del proceso
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        for name in ('inotify_init1', 'inotify_add_watch', 'inotify_rm_watch'):
+            getattr(libc, name)
+    except (OSError, AttributeError, TypeError):
+        return None
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+_libc = _load_inotify()
+INOTIFY_SUPPORTED = _libc is not None
+
+
+class TreeTracker(object):
+    """Contadores de un árbol a partir de un registro por directorio.
+
+    Los registros son los mismos que guarda el índice de tamaños
+    (storage._scan_directory_record): sus agregados propios, sin subdirectorios.
+    Los archivos con varios enlaces duros se cuentan una vez por inodo; un
+    enlace nuevo a un archivo de otro directorio no genera evento en este, así
+    que se corrige cuando ese directorio vuelve a listarse.
+    """
+
+    def __init__(self, label, path):
+        self.label = label
+        self.path = path
+        self.records = {}
+        self.links = {}
+        self.size = 0
+        self.files = 0
+        self.blocks = 0
+        self.dirs = 0
+        self.dirty = set()
+        self.rescan = False
+        self.polled = False
+        self.on_dir_added = None
+        self.on_dir_removed = None
+
+    def _abs(self, rel_path):
+        return os.path.join(self.path, rel_path) if rel_path else self.path
+
+    def _apply(self, record, sign):
+        self.size += sign * record['size']
+        self.files += sign * record['files']
+        self.blocks += sign * record['blocks']
+        self.dirs += sign * len(record['subdirs'])
+        for dev, ino, size, blocks in record.get('links', ()):
+            key = (dev, ino)
+            count = self.links.get(key, (0, size, blocks))[0]
+            if count == 0 and sign > 0:
+                self.size += size
+                self.blocks += blocks
+            elif count == 1 and sign < 0:
+                self.size -= size
+                self.blocks -= blocks
+            if count + sign > 0:
+                self.links[key] = (count + sign, size, blocks)
+            else:
+                self.links.pop(key, None)
+
+    def scan(self):
+        """Escaneo completo (al empezar y tras un desbordamiento de la cola)."""
+        for rel_path in list(self.records):
+            if self.on_dir_removed is not None:
+                self.on_dir_removed(self, rel_path)
+        self.records = {}
+        self.links = {}
+        self.size = self.files = self.blocks = self.dirs = 0
+        self.dirty = set()
+        self.rescan = False
+        self._add_subtree('')
+
+    def _add_subtree(self, start_rel):
+        pending = [start_rel]
+        while pending:
+            rel_path = pending.pop()
+            current = self._abs(rel_path)
+            try:
+                record = storage._scan_directory_record(current, os.stat(current))
+            except OSError:
+                continue
+            self.records[rel_path] = record
+            self._apply(record, 1)
+            if self.on_dir_added is not None:
+                self.on_dir_added(self, rel_path)
+            pending.extend(os.path.join(rel_path, name) if rel_path else name for name in record['subdirs'])
+
+    def _drop_subtree(self, start_rel):
+        prefix = start_rel + os.sep
+        for rel_path in [rel for rel in self.records if rel == start_rel or rel.startswith(prefix)]:
+            self._apply(self.records.pop(rel_path), -1)
+            if self.on_dir_removed is not None:
+                self.on_dir_removed(self, rel_path)
+
+    def refresh(self, rel_path):
+        """Vuelve a listar un directorio y ajusta los contadores con la diferencia."""
+        old = self.records.get(rel_path)
+        if old is None:
+            return
+        current = self._abs(rel_path)
+        try:
+            record = storage._scan_directory_record(current, os.stat(current))
+        except OSError:
+            self._drop_subtree(rel_path)
+            return
+        self._apply(old, -1)
+        self.records[rel_path] = record
+        self._apply(record, 1)
+        old_subdirs = set(old['subdirs'])
+        new_subdirs = set(record['subdirs'])
+        for name in old_subdirs - new_subdirs:
+            self._drop_subtree(os.path.join(rel_path, name) if rel_path else name)
+        for name in new_subdirs - old_subdirs:
+            self._add_subtree(os.path.join(rel_path, name) if rel_path else name)
+
+    def poll(self):
+        """Modo sondeo: relista los directorios cuyo mtime o inodo ha cambiado."""
+        for rel_path in list(self.records):
+            record = self.records.get(rel_path)
+            if record is None:
+                continue
+            try:
+                dir_stat = os.stat(self._abs(rel_path))
+            except OSError:
+                self._drop_subtree(rel_path)
+                continue
+            if dir_stat.st_mtime_ns != record['mtime'] or dir_stat.st_ino != record['ino']:
+                self.dirty.add(rel_path)
+        return self.flush()
+
+    def flush(self):
+        """Aplica los cambios pendientes. Devuelve True si se tocó algún directorio."""
+        if self.rescan:
+            self.scan()
+            return True
+        if not self.dirty:
+            return False
+        # Primero los padres: un subdirectorio nuevo ya se añade completo al refrescar el padre
+        for rel_path in sorted(self.dirty, key=lambda rel: rel.count(os.sep) + (1 if rel else 0)):
+            self.refresh(rel_path)
+        self.dirty = set()
+        return True
+
+    def stats(self):
+        return {'size': self.size, 'files': self.files, 'dirs': self.dirs, 'blocks': self.blocks}
+
+
+class SizeWatcher(object):
+    """Vigila varias categorías y mantiene sus contadores al día.
+
+    `categories` es un dict etiqueta -> carpeta. Se usa inotify cuando está
+    disponible; los árboles que no se pueden vigilar (p. ej. por agotar
+    fs.inotify.max_user_watches) pasan a sondeo de mtime.
+    """
+
+    def __init__(self, categories, use_inotify=None, poll_interval=POLL_INTERVAL):
+        self.trackers = [TreeTracker(label, path) for label, path in categories.items() if path and os.path.isdir(path)]
+        self.poll_interval = poll_interval
+        self.fd = None
+        self.watches = {}
+        self.watch_ids = {}
+        self._last_poll = time.time()
+        if use_inotify is None:
+            use_inotify = INOTIFY_SUPPORTED
+        if use_inotify and INOTIFY_SUPPORTED:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                log('inotify no disponible (%s): se usa sondeo de mtime' % os.strerror(ctypes.get_errno()))
+            else:
+                self.fd = fd
+        for tracker in self.trackers:
+            if self.fd is None:
+                tracker.polled = True
+            else:
+                tracker.on_dir_added = self._add_watch
+                tracker.on_dir_removed = self._remove_watch
+        started = time.time()
+        for tracker in self.trackers:
+            tracker.scan()
+        log('Vigilando %d carpetas (%s), %d directorios, %.2fs' % (
+            len(self.trackers), 'inotify' if self.fd is not None else 'sondeo',
+            sum(len(tracker.records) for tracker in self.trackers), time.time() - started))
+
+    @property
+    def mode(self):
+        return 'inotify' if self.fd is not None else 'sondeo'
+
+    def _add_watch(self, tracker, rel_path):
+        if tracker.polled:
+            return
+        # La raíz puede ser un enlace (special://temp redirigido); los subdirectorios no se siguen
+        mask = WATCH_MASK if not rel_path else WATCH_MASK | IN_DONT_FOLLOW
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(tracker._abs(rel_path)), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                log('Sin watches de inotify libres para %s: se vigila por sondeo' % tracker.path)
+                self._fall_back_to_polling(tracker)
+            return
+        self.watches[wd] = (tracker, rel_path)
+        self.watch_ids[(id(tracker), rel_path)] = wd
+
+    def _remove_watch(self, tracker, rel_path):
+        wd = self.watch_ids.pop((id(tracker), rel_path), None)
+        if wd is None:
+            return
+        target = self.watches.get(wd)
+        if target is not None and target[0] is tracker and target[1] == rel_path:
+            del self.watches[wd]
+            _libc.inotify_rm_watch(self.fd, wd)
+
+    def _fall_back_to_polling(self, tracker):
+        tracker.polled = True
+        for rel_path in list(tracker.records):
+            self._remove_watch(tracker, rel_path)
+
+    def read_events(self):
+        """Vacía la cola de inotify marcando los directorios afectados."""
+        if self.fd is None:
+            return 0
+        count = 0
+        while True:
+            try:
+                data = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                log('Error leyendo eventos de inotify: %s' % str(e))
+                break
+            if not data:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size + length
+                count += 1
+                if mask & IN_Q_OVERFLOW:
+                    log('Cola de inotify desbordada: se reescanean los árboles vigilados')
+                    for tracker in self.trackers:
+                        tracker.rescan = True
+                    continue
+                target = self.watches.get(wd)
+                if target is None:
+                    continue
+                tracker, rel_path = target
+                if mask & IN_IGNORED:
+                    # El kernel ya quitó el watch (directorio borrado o desmontado)
+                    del self.watches[wd]
+                    self.watch_ids.pop((id(tracker), rel_path), None)
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    if not rel_path:
+                        # La raíz se ha movido (p. ej. a la papelera) y su watch la sigue: vigilar la nueva
+                        tracker.rescan = True
+                        continue
+                    # Lo resuelve el padre al relistarse
+                    tracker.dirty.add(os.path.dirname(rel_path))
+                    continue
+                tracker.dirty.add(rel_path)
+        return count
+
+    def update(self, flush=True):
+        """Procesa los eventos pendientes; con flush=False solo los acumula.
+
+        Devuelve True si algún contador ha podido cambiar.
+        """
+        self.read_events()
+        if not flush:
+            return False
+        changed = False
+        due_poll = time.time() - self._last_poll >= self.poll_interval
+        if due_poll:
+            self._last_poll = time.time()
+        for tracker in self.trackers:
+            if tracker.polled and due_poll:
+                changed = tracker.poll() or changed
+            elif not tracker.polled:
+                changed = tracker.flush() or changed
+        return changed
+
+    def totals(self):
+        return dict((tracker.label, tracker.stats()) for tracker in self.trackers)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.watches = {}
+        self.watch_ids = {}